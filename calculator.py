@@ -1,4 +1,9 @@
 import functools
+import math
+import os
+import numpy as np
+import zipfile
+import xml.etree.ElementTree as ElementTree
 from operator import add, sub, mul, truediv
 from openpyxl import Workbook, load_workbook, worksheet
 from openpyxl.styles import Font, Alignment
@@ -41,6 +46,8 @@ class ExcelWriter:
         self.end_row_index = len(self.tick) + self.start_row_index+1
 
         self.dict = None
+        # Compiled formulas and their values, see formulas()
+        self.book = None
         self.init_sheet()
 
     def init_sheet(self):
@@ -58,6 +65,63 @@ class ExcelWriter:
         self.dict = ExcelDict(self)
         return self.dict
 
+    def formulas(self) -> 'FormulaBook':
+        if self.book is None:
+            self.book = FormulaBook(self.sheet)
+        return self.book
+
+    def touch(self):
+        # Sheet changed, computed values are stale.
+        self.book = None
+
+    def save(self, path):
+        # Save with every formula recalculated and its value cached in the file, so that
+        # load_workbook(path, data_only=True) reads the numbers without Excel or LibreOffice.
+        self.wb.save(path)
+        values = self.formulas().recalculate()
+        write_cached_values(path, self.wb.worksheets.index(self.sheet), values)
+        return values
+
+
+def write_cached_values(path, index, values):
+    # Fill the <v> of the formula cells of worksheet index in a file saved by openpyxl.
+    # values: (row, column) to a number, text or FormulaError, as FormulaBook.recalculate() returns
+    ns = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    ElementTree.register_namespace('', ns)
+    ElementTree.register_namespace('r', 'http://schemas.openxmlformats.org/officeDocument/2006/relationships')
+    name = 'xl/worksheets/sheet{}.xml'.format(index+1)
+
+    with zipfile.ZipFile(path) as z:
+        items = [(info, z.read(info)) for info in z.infolist()]
+
+    tmp = path + '.tmp'
+    with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as z:
+        for info, data in items:
+            if info.filename == name:
+                root = ElementTree.fromstring(data)
+                for c in root.iter('{%s}c' % ns):
+                    if c.find('{%s}f' % ns) is None:
+                        continue
+                    m = re.match(r'([A-Z]+)(\d+)$', c.get('r'))
+                    value = values.get((int(m.group(2)), excel_to_decimal(m.group(1))))
+                    if value is None:
+                        continue
+                    v = c.find('{%s}v' % ns)
+                    if v is None:
+                        v = ElementTree.SubElement(c, '{%s}v' % ns)
+                    if isinstance(value, FormulaError):
+                        c.set('t', 'e')
+                        v.text = str(value)
+                    elif isinstance(value, str):
+                        c.set('t', 'str')
+                        v.text = value
+                    else:
+                        c.attrib.pop('t', None)
+                        v.text = repr(float(value))
+                data = ElementTree.tostring(root, xml_declaration=True, encoding='UTF-8')
+            z.writestr(info, data)
+    os.replace(tmp, path)
+
 
 def excel_calc(wb, cell):
     sheet = wb.active
@@ -89,6 +153,7 @@ class ExcelDict:
         cell.alignment = Alignment(wrapText=True)
         # TODO create array?
         cell.value = key
+        self.excel.touch()
         return ExcelArray(row, self.excel, style=style)
 
     def add_label(self, label, row):
@@ -128,6 +193,7 @@ class ExcelDict:
 
         cell = sheet.cell(row=row, column=2)
         cell.value = '={}'.format(val)
+        self.excel.touch()
         cell.style = style
         if cell.style == 'Percent':
             cell.number_format = '0.00%'
@@ -154,6 +220,7 @@ class ExcelArray:
             cell.value = ''
         else:
             cell.value = val
+        self.excel.touch()
         if self.style == 'Comma':
             if val != 0:
                 cell.style = self.style
@@ -339,13 +406,482 @@ class Calculator:
         return self.evaluate(tokens)
 
 
+class FormulaError(str):
+    """Excel error value of a cell in a recalculated sheet, such as '#DIV/0!'."""
+    pass
+
+
+class Blank(int):
+    """Empty cell: 0 in arithmetic, left out of a range by SUM, AVERAGE, MIN and MAX as in Excel."""
+    pass
+
+
+blank = Blank(0)
+
+
+def excel_min(x):
+    # MIN of Excel, 0 over a range without numbers
+    return min(x, default=0)
+
+
+def excel_max(x):
+    return max(x, default=0)
+
+
+class Formula:
+    """
+    Formula string compiled once into postfix code over resolved cell references, e.g.
+    '=(C5+C42)*(1-C6)/B27' gives refs C5, C42, C6 and B27 as (row, column).
+    Supports + - * / ^, unary minus, numbers, cell references with optional $ and
+    SUM/AVERAGE/MIN/MAX over a range, with Excel precedence. Formulas are shared by text
+    between workbooks.
+    """
+    Num, Ref, Range, Op, Neg = range(5)
+    operators = {'+': add, '-': sub, '*': mul, '/': truediv, '^': math.pow}
+    precedence = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3, 'neg': 4}
+    # Text and blanks in a range are skipped as Excel does, see run()
+    functions = {'SUM': sum, 'AVERAGE': lambda x: sum(x) / len(x), 'MIN': excel_min, 'MAX': excel_max}
+    # Elementwise counterparts over numpy arrays of scenarios, see run_array()
+    array_functions = {math.pow: np.power,
+                       excel_min: lambda x: np.minimum.reduce(np.broadcast_arrays(*x)) if x else 0,
+                       excel_max: lambda x: np.maximum.reduce(np.broadcast_arrays(*x)) if x else 0}
+
+    re_token = re.compile(r'\s*(?:'
+                          r'(?P<function>[A-Z]+)\(\s*(?P<start>\$?[A-Z]+\$?\d+)\s*:\s*(?P<end>\$?[A-Z]+\$?\d+)\s*\)'
+                          r'|(?P<ref>\$?[A-Z]+\$?\d+)'
+                          r'|(?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+                          r'|(?P<op>[-+*/^()]))')
+
+    def __init__(self, text):
+        self.text = text
+        # List of (kind, arg)
+        self.code = []
+        # Referenced (row, column), in order of first use
+        self.refs = []
+
+        assert re.match(r'=', text)
+        # Shunting-yard into postfix, an operand or ')' is followed by a binary operator.
+        operators = []
+        operand = False
+        line = text[1:]
+        i = 0
+        while line[i:].strip():
+            m = Formula.re_token.match(line, i)
+            if m is None:
+                raise ValueError("Unsupported formula '{}' at '{}'".format(text, line[i:]))
+            i = m.end()
+            tok = m.group('op')
+            if m.group('function'):
+                fn = m.group('function')
+                if fn not in Formula.functions:
+                    raise ValueError("Unsupported function {} in '{}'".format(fn, text))
+                start_i, start_j = self.ref(m.group('start'))
+                end_i, end_j = self.ref(m.group('end'))
+                refs = [(r, c) for r in range(start_j, end_j+1) for c in range(start_i, end_i+1)]
+                self.emit(Formula.Range, (Formula.functions[fn], refs))
+                operand = True
+            elif m.group('ref'):
+                column, row = self.ref(m.group('ref'))
+                self.emit(Formula.Ref, (row, column))
+                operand = True
+            elif m.group('num'):
+                self.emit(Formula.Num, float(m.group('num')))
+                operand = True
+            elif tok == '(':
+                operators.append(tok)
+                operand = False
+            elif tok == ')':
+                while operators and operators[-1] != '(':
+                    self.emit(Formula.Op, operators.pop())
+                if not operators:
+                    raise ValueError("Unbalanced ')' in formula '{}'".format(text))
+                operators.pop()
+                operand = True
+            elif not operand and tok in '+-':
+                # Unary sign binds tighter than any binary operator.
+                if tok == '-':
+                    operators.append('neg')
+            else:
+                while operators and operators[-1] != '(' and \
+                        Formula.precedence[operators[-1]] >= Formula.precedence[tok]:
+                    self.emit(Formula.Op, operators.pop())
+                operators.append(tok)
+                operand = False
+        while operators:
+            if operators[-1] == '(':
+                raise ValueError("Unbalanced '(' in formula '{}'".format(text))
+            self.emit(Formula.Op, operators.pop())
+        self.check()
+
+    def check(self):
+        # Every operator has its operands and one value is left, as run() needs
+        depth = 0
+        for kind, _ in self.code:
+            if kind == Formula.Op:
+                depth -= 1
+            elif kind != Formula.Neg:
+                depth += 1
+            if depth < 1:
+                raise ValueError("Missing operand in formula '{}'".format(self.text))
+        if depth != 1:
+            raise ValueError("Malformed formula '{}'".format(self.text))
+
+    @staticmethod
+    def ref(cell):
+        m = re.match(r'\$?([A-Z]+)\$?(\d+)$', cell)
+        assert m is not None, cell
+        return excel_to_decimal(m.group(1)), int(m.group(2))
+
+    def emit(self, kind, arg):
+        if kind == Formula.Op:
+            if arg == 'neg':
+                kind, arg = Formula.Neg, None
+            else:
+                arg = Formula.operators[arg]
+        elif kind == Formula.Ref:
+            self.refs.append(arg)
+        elif kind == Formula.Range:
+            self.refs.extend(arg[1])
+        self.code.append((kind, arg))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8192)
+    def compile(text) -> 'Formula':
+        return Formula(text)
+
+    def run(self, values: dict) -> float:
+        # values: (row, column) to the value of every reference, text is #VALUE! in arithmetic
+        # and left out of a range as blanks are
+        stack = []
+        for kind, arg in self.code:
+            if kind == Formula.Op:
+                right = stack.pop()
+                left = stack.pop()
+                stack.append(arg(left, right))
+            elif kind == Formula.Num:
+                stack.append(arg)
+            elif kind == Formula.Ref:
+                value = values[arg]
+                if isinstance(value, str):
+                    raise TypeError("Text in arithmetic")
+                stack.append(float(value))
+            elif kind == Formula.Neg:
+                stack.append(-stack.pop())
+            else:
+                fn, refs = arg
+                stack.append(fn([values[x] for x in refs if not isinstance(values[x], (str, Blank))]))
+        return stack[-1]
+
+    def run_array(self, values: dict) -> np.ndarray:
+        # run() over numbers or numpy arrays, one element per scenario. Errors give inf or NaN.
+        stack = []
+        for kind, arg in self.code:
+            if kind == Formula.Op:
+                right = stack.pop()
+                left = stack.pop()
+                stack.append(Formula.array_functions.get(arg, arg)(left, right))
+            elif kind == Formula.Num:
+                stack.append(arg)
+            elif kind == Formula.Ref:
+                if isinstance(values[arg], str):
+                    raise TypeError("Text in arithmetic")
+                stack.append(values[arg])
+            elif kind == Formula.Neg:
+                stack.append(-stack.pop())
+            else:
+                fn, refs = arg
+                stack.append(Formula.array_functions.get(fn, fn)([values[x] for x in refs
+                                                                  if not isinstance(values[x], (str, Blank))]))
+        return stack[-1]
+
+
+class FormulaBook:
+    """
+    Values of a worksheet evaluated from compiled formulas.
+
+    A cell is compiled on first use and evaluated after its references in topological order,
+    each value is computed once and kept until the sheet changes (ExcelWriter.touch()).
+    recalculate() evaluates every formula of the sheet, recording Excel errors instead of raising,
+    and keeps the reference graph so that set() only recomputes the dependents of an edited cell.
+    """
+    # Exception to the Excel error value recorded by recalculate()
+    errors = {ZeroDivisionError: FormulaError('#DIV/0!'),
+              # math.pow out of its domain or range
+              OverflowError: FormulaError('#NUM!'),
+              ValueError: FormulaError('#NUM!'),
+              TypeError: FormulaError('#VALUE!')}
+    circular = FormulaError('#REF!')
+    unsupported = FormulaError('#NAME?')
+
+    def __init__(self, sheet: worksheet):
+        self.sheet = sheet
+        # (row, column) to Formula, or to the constant value of the cell
+        self.cells = {}
+        # (row, column) to value
+        self.values = {}
+        # Set by recalculate(): (row, column) to the formula cells referencing it, and
+        # (row, column) to the value or FormulaError of every formula cell.
+        self.users = None
+        self.results = None
+
+    def cell(self, key):
+        if key not in self.cells:
+            value = self.sheet.cell(row=key[0], column=key[1]).value
+            try:
+                self.cells[key] = self.parse(value)
+            except ValueError as e:
+                print("Warning: {}".format(e))
+                self.cells[key] = FormulaBook.unsupported
+        return self.cells[key]
+
+    @staticmethod
+    def parse(value):
+        # A blank, or the '' ExcelArray writes for a zero and openpyxl saves as a blank
+        if value is None or value == '':
+            return blank
+        if type(value) is str and re.match(r'=', value):
+            return Formula.compile(value)
+        # Text other than a formula is left to fail in value() as Calculator did.
+        return value
+
+    def deps(self, key):
+        cell = self.cell(key)
+        return cell.refs if type(cell) is Formula else ()
+
+    def order(self, key) -> list:
+        # Uncomputed cells needed by key, references first.
+        result = []
+        state = {key: 1}
+        stack = [(key, iter(self.deps(key)))]
+        while stack:
+            node, deps = stack[-1]
+            for dep in deps:
+                if dep in self.values or state.get(dep) == 2:
+                    continue
+                if state.get(dep) == 1:
+                    raise ValueError("Circular reference at {}{}".format(colnum_string(dep[1]), dep[0]))
+                state[dep] = 1
+                stack.append((dep, iter(self.deps(dep))))
+                break
+            else:
+                stack.pop()
+                state[node] = 2
+                result.append(node)
+        return result
+
+    def compute(self, node):
+        cell = self.cells[node]
+        if type(cell) is Formula:
+            return cell.run(self.values)
+        assert type(cell) in (float, int, Blank), "Not a number in {}{}: {!r}".format(
+            colnum_string(node[1]), node[0], cell)
+        return cell
+
+    def value(self, row, column):
+        key = row, column
+        if key not in self.values:
+            for node in self.order(key):
+                self.values[node] = self.compute(node)
+        return self.values[key]
+
+    def evaluate(self, cell):
+        # cell as Calculator.evaluate_cell, e.g. '#C30'
+        if not re.match(r'#[A-Z]+\d+', cell):
+            return 0
+        column, row = Formula.ref(re.match(r'#([A-Z]+\d+)', cell).group(1))
+        return self.value(row, column)
+
+    def recalculate(self) -> dict:
+        # Evaluate every formula cell once, Kahn's algorithm over the reference graph.
+        # Returns (row, column) to value of the formula cells, a FormulaError for a failed cell.
+        formulas = []
+        self.results = {}
+        for row in self.sheet.iter_rows():
+            for c in row:
+                key = c.row, c.column
+                cell = self.cell(key)
+                if type(cell) is Formula:
+                    formulas.append(key)
+                elif cell is FormulaBook.unsupported:
+                    self.results[key] = cell
+
+        self.users = {}
+        for key in formulas:
+            self.link(key)
+        self.run(formulas)
+        return dict(self.results)
+
+    def link(self, key, unlink=False):
+        # Add, or remove, key as a user of its references.
+        for dep in set(self.deps(key)):
+            self.cell(dep)
+            if unlink:
+                self.users[dep].remove(key)
+            else:
+                self.users.setdefault(dep, []).append(key)
+
+    def sort(self, keys) -> list:
+        # keys in topological order of the references between them, cells on a cycle left out.
+        keys = set(keys)
+        pending = {k: sum(1 for dep in set(self.deps(k)) if dep in keys) for k in keys}
+        ready = [k for k, n in pending.items() if n == 0]
+        order = []
+        while ready:
+            key = ready.pop()
+            order.append(key)
+            for user in self.users.get(key, ()):
+                if user in pending:
+                    pending[user] -= 1
+                    if pending[user] == 0:
+                        ready.append(user)
+        return order
+
+    def run(self, keys) -> list:
+        # Evaluate keys in topological order of the references between them, into results.
+        # Returns keys in evaluation order, cells left on a cycle last.
+        keys = set(keys)
+        order = self.sort(keys)
+        for key in order:
+            self.results[key] = result = self.compute_result(key)
+            if isinstance(result, FormulaError):
+                self.values.pop(key, None)
+            else:
+                self.values[key] = result
+
+        for key in keys.difference(order):
+            # Left on a cycle, or waiting on one
+            order.append(key)
+            self.results[key] = FormulaBook.circular
+            self.values.pop(key, None)
+        return order
+
+    def compute_result(self, key):
+        # Value of key from the results of its references, errors as FormulaError.
+        cell = self.cells[key]
+        if type(cell) is not Formula:
+            return self.constant(key)
+        if len(cell.code) == 1 and cell.code[0][0] == Formula.Ref:
+            # A label such as '=A1' shows the text it references
+            ref = cell.code[0][1]
+            value = self.results[ref] if ref in self.results else self.cells[ref]
+            if isinstance(value, str):
+                return value
+        refs = {x: self.results[x] if x in self.results else self.constant(x) for x in cell.refs}
+        result = next((x for x in refs.values() if isinstance(x, FormulaError)), None)
+        if result is None:
+            try:
+                result = cell.run(refs)
+            except tuple(FormulaBook.errors) as e:
+                result = next(v for k, v in FormulaBook.errors.items() if isinstance(e, k))
+        return result
+
+    def constant(self, key):
+        # Value of a constant cell referenced in recalculate(): a number, an error, or text that
+        # Formula.run() reads as #VALUE! in arithmetic and skips in a range
+        cell = self.cells[key]
+        if type(cell) in (float, int, Blank) or isinstance(cell, str):
+            return cell
+        return FormulaBook.errors[TypeError]
+
+    def result(self, cell):
+        # Recalculated value of cell such as 'B29', a FormulaError for a failed cell.
+        if self.users is None:
+            self.recalculate()
+        column, row = Formula.ref(cell)
+        key = row, column
+        self.cell(key)
+        return self.results[key] if key in self.results else self.constant(key)
+
+    def users_of(self, keys) -> set:
+        # Transitive users of keys, including keys
+        affected = set(keys)
+        stack = list(keys)
+        while stack:
+            for user in self.users.get(stack.pop(), ()):
+                if user not in affected:
+                    affected.add(user)
+                    stack.append(user)
+        return affected
+
+    def batch(self, inputs: dict, outputs) -> dict:
+        # Vectorized what-if leaving the sheet unchanged. inputs: cell such as 'B33' to an array of
+        # values, one per scenario, in place of its formula. Returns each cell of outputs to the
+        # array of its values over the scenarios, NaN where a scenario fails.
+        if self.users is None:
+            self.recalculate()
+        values = {}
+        for cell, v in inputs.items():
+            column, row = Formula.ref(cell)
+            self.cell((row, column))
+            values[row, column] = np.asarray(v, dtype=np.float64)
+        shape = np.broadcast_shapes(*(v.shape for v in values.values()))
+
+        def current(key):
+            if key in values:
+                return values[key]
+            result = self.results[key] if key in self.results else self.constant(key)
+            # Text is left to run_array(), as run() does
+            return np.nan if isinstance(result, FormulaError) else result
+
+        affected = self.users_of(values).difference(values)
+        order = self.sort(affected)
+        with np.errstate(all='ignore'):
+            for key in order:
+                cell = self.cells[key]
+                try:
+                    values[key] = cell.run_array({x: current(x) for x in cell.refs})
+                except tuple(FormulaBook.errors):
+                    # Only scalars in the failing part of the formula
+                    values[key] = np.nan
+        for key in affected.difference(order):
+            # On a cycle
+            values[key] = np.nan
+
+        result = {}
+        for cell in outputs:
+            column, row = Formula.ref(cell)
+            self.cell((row, column))
+            value = current((row, column))
+            # An output of text, such as a label '=A1', has no value
+            value = np.nan if isinstance(value, str) else value
+            result[cell] = np.broadcast_to(np.asarray(value, dtype=np.float64), shape)
+        return result
+
+    def set(self, cell, value) -> dict:
+        # What-if edit of cell such as 'B29' to a number or a formula, written to the sheet.
+        # Only the cells depending on it are recomputed. Returns (row, column) to the new value
+        # of the cells that changed, including the edited cell.
+        if self.users is None:
+            self.recalculate()
+        column, row = Formula.ref(cell)
+        key = row, column
+        self.sheet.cell(row=row, column=column).value = value
+
+        self.cell(key)
+        self.link(key, unlink=True)
+        self.cells.pop(key)
+        self.cell(key)
+        self.link(key)
+
+        affected = self.users_of([key])
+        before = {k: self.results.get(k) for k in affected}
+        changed = {}
+        for k in self.run(affected):
+            if self.results[k] != before[k]:
+                changed[k] = self.results[k]
+        if type(self.cells[key]) is not Formula:
+            # A constant is only kept in results while it is being edited
+            self.results.pop(key)
+        return changed
+
+
 def calculate(cell, d):
     start_time = time.time()
-    calc = Calculator()
-    result = calc.evaluate_cell(cell, d)
+    result = d.excel.formulas().evaluate(cell)
     print("DCF computation took time {:.2f} ms".format((time.time()-start_time)*1e3))
 
     # The calculate function took average 51 ms without cache.
     # With cache, the calculate function took average of 2 ms.
-    # Without cache the function took 25x slower than cached version
+    # Compiled formulas share their values with later calls on the same workbook, see
+    # scripts/bench_calculator.py.
     return result
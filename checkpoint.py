@@ -0,0 +1,53 @@
+import json
+import os
+from typing import Optional
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines log of screened tickers, one record per finished ticker:
+        {"name": ..., "sha1": ..., "metrics": [...], "status": "ok", "prof": Prof.to_dict()}
+        {"name": ..., "sha1": ..., "metrics": [...], "status": "failed", "error": ...}
+    The last record of a ticker wins. A record is reused while the sha1 of the spreadsheet and the
+    sorted metrics selected are unchanged.
+    """
+    Ok = 'ok'
+    Failed = 'failed'
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip() == '':
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Truncated line from an interrupted run
+                        continue
+                    self.records[record['name']] = record
+
+    def lookup(self, name, sha1, metrics, retry_failed=False) -> Optional[dict]:
+        record = self.records.get(name)
+        if record is None or record['sha1'] != sha1 or record.get('metrics') != sorted(metrics):
+            return None
+        if retry_failed and record['status'] == Checkpoint.Failed:
+            return None
+        return record
+
+    def write(self, name, sha1, metrics, prof: Optional[dict] = None, error: Optional[str] = None):
+        metrics = sorted(metrics)
+        if error is None:
+            record = {'name': name, 'sha1': sha1, 'metrics': metrics, 'status': Checkpoint.Ok, 'prof': prof}
+        else:
+            record = {'name': name, 'sha1': sha1, 'metrics': metrics, 'status': Checkpoint.Failed, 'error': error}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self.records[name] = record
+        return record
+
+    def failures(self, names):
+        return [(n, self.records[n]['error']) for n in names
+                if n in self.records and self.records[n]['status'] == Checkpoint.Failed]
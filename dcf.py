@@ -9,7 +9,8 @@ from tabulate import tabulate
 from typing import List
 from enum import Enum
 
-from spread import Spread
+from spread import Spread, load_spread
+from series import Series
 from utils import *
 from bcolors import colour_print, bcolors
 
@@ -104,7 +105,7 @@ class ExcelOut:
 
 class DCF(Spread):
     def __init__(self, tick, path, modes: [Mode]):
-        self.wb = load_workbook(path + '/' + tick + '.xlsx')
+        self.wb = load_spread(path + '/' + tick + '.xlsx')
         super().__init__(self.wb, tick)
 
         # TODO approximate WACC based on highest transaction recorded that investors willing to pay
@@ -120,9 +121,9 @@ class DCF(Spread):
         self.modes = modes
 
     def fcf(self, estimates=False):
-        cashflow = self.cashflow
-        if estimates:
-            cashflow = self.estimates
+        if not estimates:
+            return self.fcf_per_share()
+        cashflow = self.estimates
 
         earning_not_strip = cashflow.match_title('Free Cash Flow$', none_is_optional=True)
         if earning_not_strip is not None:
@@ -131,11 +132,11 @@ class DCF(Spread):
             cfo = self.strip(cashflow.match_title('Cash from Operations$'))
             opt_acq_real_assets = cashflow.match_title('Acquisition of Real Estate Assets$',
                                                        none_is_optional=True)
-            earning = cfo
+            earning = Series(cfo)
             if opt_acq_real_assets is not None:
                 acq_real_assets = self.strip(opt_acq_real_assets)
-                earning = list_add_list(cfo, acq_real_assets)
-        return list_over_list(earning, self.wa_diluted_shares_out())
+                earning = earning + acq_real_assets
+        return Series(earning).over(self.wa_diluted_shares_out())
 
     def tv_ev_ov_ebit(self):
         ev_over_ebit = self.strip2(self.values.match_title('LTM Total Enterprise Value / EBIT$'))
@@ -148,10 +149,9 @@ class DCF(Spread):
         ni = self.strip(self.income.match_title('Net Income$'))
         tax = self.strip(self.income.match_title('Income Tax Expense$'))
         # ie = self.strip(self.income.match_title('Interest Expense$'))
-        nopat = list_add_list(ni, tax)
+        nopat = Series(ni) + tax
         # ebit = list_add_list(ebit, ie)
-        ni_per_share = list_over_list(nopat[self.half_len:],
-                                      self.wa_diluted_shares_out()[self.half_len:])
+        ni_per_share = nopat[self.half_len:].over(self.wa_diluted_shares_out()[self.half_len:])
         return average(ni_per_share) * 5. * (1+self.tgr) * self.term_dr
 
         # hmm, not preferred when comparing company. The preferred is EBITDA
@@ -241,36 +241,33 @@ class DCF(Spread):
 class UFCF:
     def __init__(self, src: DCF):
         net_income = src.strip(src.income.match_title('Net Income$'))
-        ufcf = net_income
+        ufcf = Series(net_income)
 
         depreciation_not_strip = src.cashflow.match_title('Total Depreciation', none_is_optional=True)
         if depreciation_not_strip is not None:
             depreciation = src.strip(depreciation_not_strip)
-            ufcf = list_add_list(ufcf, depreciation)
+            ufcf = ufcf + depreciation
 
         interest = src.strip(src.income.match_title('Interest Expense$'))
-        interest = list_abs(interest)
-        ufcf = list_add_list(ufcf, interest)
+        ufcf = ufcf + abs(Series(interest))
 
         tax_not_strip = src.income.match_title('Income Tax Expense$', none_is_optional=True)
         if tax_not_strip is not None:
-            _ = src.strip(tax_not_strip)
-            _ = [0 if v is None else v for v in _]
-            tax = list_negate(_)
-            ufcf = list_add_list(ufcf, tax)
+            tax = Series(src.strip(tax_not_strip))
+            ufcf = ufcf - tax
 
         capex_not_strip = src.cashflow.match_title('Capital Expenditure$', none_is_optional=True)
         if capex_not_strip is not None:
             capex = src.strip(capex_not_strip)
         else:
             capex = src.strip(src.cashflow.match_title('Acquisition of Real Estate Assets$'))
-        ufcf = list_add_list(ufcf, capex)
+        ufcf = ufcf + capex
 
         _ = src.cashflow.match_title(
             'Memo: Change in Net Working Capital$', none_is_optional=True)
         if _ is not None:
             work_cap = src.strip(_)
-            ufcf = list_add_list(ufcf, work_cap)
+            ufcf = ufcf + work_cap
         else:
             colour_print('Missing Net working capital entry', bcolors.WARNING)
 
@@ -284,29 +281,27 @@ class UFCF:
             # debt_issued = src.strip(src.cashflow.match_title('Total Debt Issued$'))
             debt_repaid = src.strip(src.cashflow.match_title('Total Debt Repaid$'))
             # earning = list_add_list(earning, debt_issued)
-            ufcf = list_add_list(ufcf, debt_repaid)
+            ufcf = ufcf + debt_repaid
 
-        self.ufcf_per_share = list_over_list(
-            ufcf[src.half_len:], src.wa_diluted_shares_out()[src.half_len:])
+        self.ufcf_per_share = ufcf[src.half_len:].over(src.wa_diluted_shares_out()[src.half_len:])
         self.tgr = src.tgr
         self.term_dr = src.term_dr
 
 
 class UFCF_Estimates:
     def __init__(self, src: DCF):
-        ufcf = src.strip(src.estimates.match_title(r'EBITDA$'))
+        ufcf = Series(src.strip(src.estimates.match_title(r'EBITDA$')))
         ebt = src.strip(src.estimates.match_title(r'EBT \(GAAP\) Actual$'))
         etr = src.strip(src.estimates.match_title(r'Effective Tax Rate \(%\)$'))
-        etr = list_over_list(etr, [-100] * len(ufcf))
-        tax = list_multiply_list(ebt, etr)
-        ufcf = list_add_list(ufcf, tax)
+        etr = Series(etr).over(-100)
+        tax = Series(ebt) * etr
+        ufcf = ufcf + tax
 
         capex = src.strip(src.estimates.match_title('Capital Expenditure$'))
-        ufcf = list_add_list(ufcf, capex)
+        ufcf = ufcf + capex
 
         # ebit = list_add_list(ebit, ie)
-        self.ufcf_per_share = list_over_list(
-            ufcf[src.half_len:], src.wa_diluted_shares_out()[src.half_len:])
+        self.ufcf_per_share = ufcf[src.half_len:].over(src.wa_diluted_shares_out()[src.half_len:])
         # ufcf, src.wa_diluted_shares_out())
         # TODO option for half_len?
         self.tgr = src.tgr
@@ -1,7 +1,12 @@
 import re
+import time
+import numpy as np
 import pandas as pd
 
-from spread import Spread
+from spread import Spread, load_spread, derived
+from refdata import ReferenceData, Sheet, NearestIndex
+from sensitivity import write_grid, write_tornado
+from market import MarketData
 from utils import *
 from bcolors import colour_print, bcolors
 
@@ -9,7 +14,6 @@ from openpyxl import Workbook, load_workbook, worksheet
 from openpyxl.styles import Font, Alignment
 from collections import OrderedDict
 from typing import List
-import yfinance as yf
 from tabulate import tabulate
 
 total_main_col = 12
@@ -66,7 +70,7 @@ class ExcelOut:
 
         self.j += 1
 
-    def start(self):
+    def start(self, path='out.xlsx'):
         cls = self.__class__
         self.j = cls.row_margin + 1
         for i, key in enumerate(self.od):
@@ -82,7 +86,7 @@ class ExcelOut:
                 self.make_cell(val, self.styles[i])
 
             self.j += 1
-        self.wb.save('out.xlsx')
+        self.wb.save(path)
 
     def make_cell(self, val, style):
         cell = self.sheet.cell(row=self.j, column=self.i)
@@ -117,15 +121,15 @@ class DataSet:
         self.country = country
         self.industry = industry
 
+    def sheet(self, name, sheet) -> Sheet:
+        return ReferenceData.sheet(self.path + '/{}.xlsx'.format(name), sheet)
+
     def get_country_tax_rates(self):
         name = 'countrytaxrates'
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format(name))
-        ws = wb[name]
-        for i in range(1, ws.max_row):
-            if ws['A{}'.format(i)].value == self.country:
-                result = ws.cell(row=i, column=ws.max_column).value
-                break
+        ws = self.sheet(name, name)
+        i = ws.find_exact(self.country)
+        assert i is not None and i < ws.max_row
+        result = ws.cell(row=i, column=ws.max_column)
         assert result is not None
         return result
 
@@ -147,90 +151,56 @@ class DataSet:
         return tab[self.country]
 
     def get_wacc(self):
-        name = 'wacc'
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format(name))
-        ws = wb['Industry Averages']
-        for i in range(20, ws.max_row):
-            print(ws['A{}'.format(i)].value)
-            if re.match(self.industry, ws['A{}'.format(i)].value, re.IGNORECASE):
-                result = ws.cell(row=i, column=ws.max_column).value
-                break
+        ws = self.sheet('wacc', 'Industry Averages')
+        i = ws.find_title(self.industry, start=20, flags=re.IGNORECASE)
+        assert i is not None
+        result = ws.cell(row=i, column=ws.max_column)
         assert result is not None
         return result
 
     def get_equity_risk_premium(self):
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format('ERPs by country'))
-        ws = wb['Sheet1']
-        for i in range(8, ws.max_row):
-            if re.match(self.country, ws['A{}'.format(i)].value):
-                result = ws.cell(row=i, column=5).value
-                break
+        ws = self.sheet('ERPs by country', 'Sheet1')
+        i = ws.find_title(self.country, start=8)
+        assert i is not None
+        result = ws.cell(row=i, column=5)
         assert result is not None
         return result
 
     def get_currency_suffix(self, sticky_price):
         assert self.country is not None
-        result = None
-        with open(self.path + '/yahoo_currency_suffix.txt', encoding='utf-8') as infile:
-            # https://www.gnucash.org/docs/v4/C/gnucash-help/fq-spec-yahoo.html
-            suffix_index = None
-            for i, field in enumerate(infile.readline().split('|')):
-                if re.match('suffix', field, re.IGNORECASE):
-                    suffix_index = i
-                    break
-            assert suffix_index is not None
-            for line in infile:
-                a = line[:-1].split('|')
-                if re.match(a[suffix_index][1:], sticky_price):
-                    result = a[suffix_index][1:]
-                    break
-        return result
+        suffixes = ReferenceData.currency_suffixes(self.path + '/yahoo_currency_suffix.txt')
+        return next((x for x in suffixes if re.match(x, sticky_price)), None)
 
-    def get_sales_to_cap_ratio(self):
-        name = 'capex'
-        sales_to_cap_index = None
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format(name))
-        ws = wb['Industry Averages']
-        for i in range(1, ws.max_column+1):
-            a = ws.cell(row=8, column=i).value
-            if re.match(r'Sales/ Invested Capital', a):
-                sales_to_cap_index = i
-                break
+    def sales_to_cap_sheet(self):
+        ws = self.sheet('capex', 'Industry Averages')
+        sales_to_cap_index = ws.find_header(r'Sales/ Invested Capital', row=8)
         assert sales_to_cap_index is not None
-        for i in range(8, ws.max_row):
-            if re.match(self.industry, ws['A{}'.format(i)].value, re.IGNORECASE):
-                result = ws.cell(row=i, column=sales_to_cap_index).value
-                break
+        return ws, sales_to_cap_index
+
+    def get_sales_to_cap_ratio(self):
+        ws, sales_to_cap_index = self.sales_to_cap_sheet()
+        i = ws.find_title(self.industry, start=8, flags=re.IGNORECASE)
+        assert i is not None
+        result = ws.cell(row=i, column=sales_to_cap_index)
         assert result is not None
         return result
 
-    def match_sales_to_cap_ratio(self, sales_to_cap_ratio):
-        name = 'capex'
-        sales_to_cap_index = None
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format(name))
-        ws = wb['Industry Averages']
-        for i in range(1, ws.max_column + 1):
-            a = ws.cell(row=8, column=i).value
-            if re.match(r'Sales/ Invested Capital', a):
-                sales_to_cap_index = i
-                break
-        assert sales_to_cap_index is not None
-        result = []
-        for i in range(9, ws.max_row):
-            diff = ws.cell(row=i, column=sales_to_cap_index).value - sales_to_cap_ratio
-            # print(ws.cell(row=i, column=1).value, diff)
-            result.append([
-                ws.cell(row=i, column=1).value,
-                ws.cell(row=i, column=sales_to_cap_index).value, abs(diff), ])
-        return sorted(result, key=lambda e: e[2])
+    def sales_to_cap_index(self) -> NearestIndex:
+        ws, sales_to_cap_index = self.sales_to_cap_sheet()
+        return ws.nearest_index(sales_to_cap_index, start=9)
+
+    def match_sales_to_cap_ratio(self, sales_to_cap_ratio, k=None):
+        # [[industry, Sales/ Invested Capital, error], ...] of the k closest industries
+        return self.sales_to_cap_index().nearest(sales_to_cap_ratio, k)
+
+    def match_sales_to_cap_ratios(self, sales_to_cap_ratios, k):
+        # Batch of match_sales_to_cap_ratio() as (industries, ratios, errors) arrays, one row per ratio
+        return self.sales_to_cap_index().nearest_many(sales_to_cap_ratios, k)
 
 
 class DCF(Spread):
-    def __init__(self, tick, country=None, industry=None, path=None):
+    def __init__(self, tick, country=None, industry=None, path=None, dataset=None, market=None):
+        # dataset and market: DataSet and MarketData shared by a batch of tickers, see dcf_batch.py
         colour_print("Company's ticker '{}'".format(tick), bcolors.UNDERLINE)
 
         if country is None:
@@ -245,11 +215,14 @@ class DCF(Spread):
             path = 'spreads'
             print("Set path to '{}'".format(path))
 
-        self.wb = load_workbook(path + '/' + tick + '.xlsx')
+        self.wb = load_spread(path + '/' + tick + '.xlsx')
         super().__init__(self.wb, tick)
 
-        self.dataset = DataSet(country, industry)
+        self.dataset = DataSet(country, industry) if dataset is None else dataset
+        self.market = MarketData() if market is None else market
         self.cached_ticker = None
+        # Computed rows by title, set by compute()
+        self.results = None
 
         # Revenues, Operating Income, Interest Expense, ...
 
@@ -314,7 +287,8 @@ class DCF(Spread):
                 result = est[nlead:]
         return result
 
-    def compute(self):
+    def compute(self, path='out.xlsx') -> dict:
+        # Saves the DCF workbook to path, returns summary()
         d = OrderedDict()
         self.compute_revenue(d)
         self.compute_ebit(d)
@@ -341,7 +315,15 @@ class DCF(Spread):
                 # Sales to cap 
                 '', 'Comma', 'Percent',
             ])
-        excel.start()
+        self.compute_sensitivity(excel, d)
+        excel.start(path)
+        self.results = d
+        return self.summary()
+
+    def summary(self) -> dict:
+        # Title to value of the computed DCF, as ranked by dcf_batch.py
+        titles = ['Price', 'Estimated value / share', 'Price as % of value', 'Terminal cost of capital']
+        return {title: float(self.results[title]) for title in titles}
 
     def compute_revenue(self, d):
         # Compute past
@@ -455,19 +437,7 @@ class DCF(Spread):
         #   (forward_2y_sales-forward_sales)/sales_to_cap))))
         # https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/capex.html
 
-        # Latest sales to book value of equity
-        sales_to_cap_source = self.sales[-1] / self.book_value_equity[-1]
-        print("Computed Sales to cap ratio {:.2f}".format(sales_to_cap_source))
-        # TODO Asia countries not in U.S. coverage
-        if True:
-            print("Probable Sales to cap ratio:")
-            matches = self.dataset.match_sales_to_cap_ratio(sales_to_cap_source)[:5]
-            heads = ['Company', 'Sales to Cap', 'Error']
-            print(tabulate(matches, headers=heads, floatfmt=".2f"), "\n")
-            # Selecting mid of the 5 matches
-            sales_to_cap_ratio = matches[2][1]
-        else:
-            sales_to_cap_ratio = sales_to_cap_source
+        sales_to_cap_ratio = self.sales_to_cap_ratio()
 
         reinvestment = d['- Reinvestment'] = []
         reinvestment.append(None)
@@ -485,6 +455,23 @@ class DCF(Spread):
 
         # Alternatively Sales to IC ratio = FCFF (computed by TIKR) + NOPAT
 
+    @derived
+    def sales_to_cap_ratio(self):
+        # Latest sales to book value of equity, matched once per ticker
+        sales_to_cap_source = self.sales[-1] / self.book_value_equity[-1]
+        print("Computed Sales to cap ratio {:.2f}".format(sales_to_cap_source))
+        # TODO Asia countries not in U.S. coverage
+        if True:
+            print("Probable Sales to cap ratio:")
+            matches = self.dataset.match_sales_to_cap_ratio(sales_to_cap_source, 5)
+            heads = ['Company', 'Sales to Cap', 'Error']
+            print(tabulate(matches, headers=heads, floatfmt=".2f"), "\n")
+            # Selecting mid of the 5 matches
+            sales_to_cap_ratio = matches[2][1]
+        else:
+            sales_to_cap_ratio = sales_to_cap_source
+        return sales_to_cap_ratio
+
     def compute_fcff(self, d):
         fcff = d['FCFF'] = []
         nopat = d['NOPAT']
@@ -495,7 +482,9 @@ class DCF(Spread):
             else:
                 fcff.append(None)
 
-    def compute_cost_of_capital(self, d):
+    @derived
+    def cost_of_capital_inputs(self):
+        # (cost of debt, debt, market cap, beta, equity risk premium), fetched once per ticker
         # Cost of debt
         interest_expense = 0
         if self.ie[-1] is not None:
@@ -522,8 +511,12 @@ class DCF(Spread):
             colour_print("Invalid beta: defaulting beta to 1.0", bcolors.WARNING)
             beta = 1.0
         mrp = self.dataset.get_equity_risk_premium()
-        cost_of_equity = self.riskfree_rate + beta * mrp
         market_cap = yf_ticker.info['marketCap'] / 1e6
+        return cost_of_debt, debt, market_cap, beta, mrp
+
+    def compute_cost_of_capital(self, d):
+        cost_of_debt, debt, market_cap, beta, mrp = self.cost_of_capital_inputs()
+        cost_of_equity = self.riskfree_rate + beta * mrp
 
         total_cap = market_cap + debt
         initial_coc = market_cap/total_cap * cost_of_equity + debt/total_cap * cost_of_debt
@@ -573,35 +566,37 @@ class DCF(Spread):
         d['Sum of PV'] =  d['PV (Terminal value)'] + d['PV (Cash flow over next 10 years)']
         d['Value of operating assets'] =  d['Sum of PV']
 
+        d['- Debt'], d['- Minority interest'], d['+ Cash'], d['+ Non-operating assets'] = self.equity_bridge()
+        d['Value of equity'] = (d['Value of operating assets']
+                                - d['- Debt'] - d['- Minority interest']
+                                + d['+ Cash'] + d['+ Non-operating assets'])
+        d['Number of shares'] = self.shares[-1]
+        d['Estimated value / share'] = d['Value of equity'] / d['Number of shares']
+
+        avg_price = self.last_price()
+        # d['Price'] = self.strip(self.values.match_title('Price$'))[-1]
+        d['Price'] = avg_price
+        d['Price as % of value'] = avg_price / d['Estimated value / share']
+
+    def equity_bridge(self):
+        # (debt, minority interest, cash, non-operating assets) from operating assets to equity
         debt = 0
         if self.debt[-1] is not None:
             debt = self.debt[-1]
-        d['- Debt'] = debt
 
-        d['- Minority interest'] = 0
-        d['+ Cash'] = self.cash[-1]
+        non_op = 0
         if type(self.investments) is list:
             # type: List[float]
-            non_op = 0
             if self.investments[-1] is not None:
                 non_op = self.investments[-1]
             elif self.investments[-2] is not None:
                 colour_print("Latest investment was not defined. Fallback to previous year", bcolors.WARNING)
                 non_op = self.investments[-2]
-            d['+ Non-operating assets'] = non_op
-        else:
-            d['+ Non-operating assets'] = 0
-        d['Value of equity'] = (d['Value of operating assets']
-                                - d['- Debt'] - d['- Minority interest']
-                                + d['+ Cash'] + d['+ Non-operating assets'])
-        d['Number of shares'] = self.shares[-1]
-        d['Estimated value / share'] = d['Value of equity'] / d['Number of shares']
+        return debt, 0, self.cash[-1], non_op
 
+    def last_price(self):
         ticker = self.get_ticker()
-        avg_price = (ticker.info['regularMarketDayLow'] + ticker.info['regularMarketDayHigh']) / 2.
-        # d['Price'] = self.strip(self.values.match_title('Price$'))[-1]
-        d['Price'] = avg_price
-        d['Price as % of value'] = avg_price / d['Estimated value / share']
+        return (ticker.info['regularMarketDayLow'] + ticker.info['regularMarketDayHigh']) / 2.
 
     def get_ticker(self):
         if self.cached_ticker is None:
@@ -612,12 +607,12 @@ class DCF(Spread):
                 tick_name = tick_name + '.{}'.format(suffix)
 
             # Test the ticker by obtaining beta
-            ticker = yf.Ticker(tick_name)
+            ticker = self.market.ticker(tick_name)
             if 'beta' not in ticker.info:
                 assert len(self.head) > 0
                 initial_query = ' '.join(self.head.split()[:-1])
                 print("Waiting to query Yahoo Finance server with '{}'".format(initial_query))
-                ticker = yf.Ticker(get_symbol(initial_query))
+                ticker = self.market.ticker(self.market.symbol(initial_query))
             self.cached_ticker = ticker
         else:
             ticker = self.cached_ticker
@@ -654,6 +649,182 @@ class DCF(Spread):
         # invested_return.append(d['Cost of capital'][-1])
 
 
+    # Defaults of simulate() around the deterministic value x of each input:
+    # numpy Generator method and its arguments, or a number to hold the input fixed.
+    Distributions = {
+        'stable_growth': lambda x: ('normal', x, .01),
+        'terminal_margin': lambda x: ('normal', x, .02),
+        'cost_of_capital': lambda x: ('normal', x, .005),
+        'sales_to_cap': lambda x: ('triangular', .8 * x, x, 1.2 * x),
+        'beta': lambda x: ('normal', x, .2),
+        # Held at the risk free rate unless given
+        'terminal_growth': lambda x: x,
+    }
+
+    # Low and high values of each input around its deterministic value x for tornado()
+    Swings = {
+        'stable_growth': lambda x: (x - .01, x + .01),
+        'terminal_margin': lambda x: (x - .02, x + .02),
+        'cost_of_capital': lambda x: (x - .01, x + .01),
+        'sales_to_cap': lambda x: (.8 * x, 1.2 * x),
+        'beta': lambda x: (x - .2, x + .2),
+        'terminal_growth': lambda x: (x - .005, x + .005),
+    }
+
+    def simulation_base(self, d=None) -> dict:
+        # Deterministic path of compute() that the simulated inputs start from.
+        # d: rows already computed by compute(), the revenue, EBIT and tax steps are run otherwise
+        if d is None:
+            d = OrderedDict()
+            self.compute_revenue(d)
+            self.compute_ebit(d)
+            self.compute_tax(d)
+        cost_of_debt, debt, market_cap, beta, mrp = self.cost_of_capital_inputs()
+        return {
+            'forward': len(self.forward_sales[-4:]),
+            'forward_ebit': len(self.forward_ebit),
+            'growth': d['Revenue growth rate'], 'sales': d['Revenue'], 'ebit': d['EBIT'],
+            'tax_rate': d['Tax rate'],
+            'cost_of_debt': cost_of_debt, 'debt': debt, 'market_cap': market_cap, 'mrp': mrp,
+            'equity_bridge': self.equity_bridge(), 'shares': self.shares[-1],
+            # Simulated inputs
+            'stable_growth': d['Revenue growth rate'][len(self.forward_sales[-4:])-1],
+            'terminal_margin': d['EBIT margin'][-1],
+            'cost_of_capital': self.riskfree_rate + .045,
+            'sales_to_cap': self.sales_to_cap_ratio(),
+            'beta': beta,
+            'terminal_growth': self.riskfree_rate,
+        }
+
+    def project(self, base, stable_growth, terminal_margin, cost_of_capital, sales_to_cap, beta,
+                terminal_growth):
+        # Value per share of compute() over arrays of scenarios, columns as in compute().
+        # cost_of_capital is the terminal one, the cost of capital fades to it from year 6.
+        # Growth fades to terminal_growth, the risk free rate in compute().
+        n = len(stable_growth)
+        g = stable_growth[:, None]
+        rf = self.riskfree_rate
+        tg = terminal_growth[:, None]
+        forward, forward_ebit = base['forward'], base['forward_ebit']
+
+        # Revenue: forward estimates, stable growth to year 5, then fading to the terminal growth
+        growth = np.empty((n, total_main_col))
+        growth[:, :forward] = base['growth'][:forward]
+        growth[:, forward:total_half_col] = g
+        fade = np.arange(1, total_half_col)
+        growth[:, total_half_col:total_main_col-1] = g - (g-tg)/5 * fade
+        growth[:, -1] = stable_growth - (stable_growth-terminal_growth)/5 * 5
+        sales = np.empty((n, total_main_col))
+        sales[:, :forward] = base['sales'][:forward]
+        sales[:, forward:] = base['sales'][forward-1] * np.cumprod(1 + growth[:, forward:], axis=1)
+
+        # EBIT: forward estimates then the terminal margin
+        ebit = terminal_margin[:, None] * sales
+        ebit[:, :forward_ebit] = base['ebit'][:forward_ebit]
+        nopat = ebit
+        if len(base['tax_rate']) > 0:
+            nopat = ebit - ebit * np.array(base['tax_rate'])
+
+        reinvestment = np.zeros((n, total_main_col))
+        reinvestment[:, 1:-1] = (sales[:, 2:] - sales[:, 1:-1]) / sales_to_cap[:, None]
+        roic = .15
+        reinvestment[:, -1] = growth[:, -1] / roic * nopat[:, -1]
+        fcff = nopat - reinvestment
+        # No reinvestment in base year, so no FCFF to discount
+        fcff[:, 0] = 0
+
+        cost_of_equity = rf + beta * base['mrp']
+        total_cap = base['market_cap'] + base['debt']
+        initial_coc = base['market_cap']/total_cap * cost_of_equity + base['debt']/total_cap * base['cost_of_debt']
+        coc = np.empty((n, total_main_col))
+        coc[:, 0] = 0
+        coc[:, 1:total_half_col] = initial_coc[:, None]
+        coc[:, total_half_col:-1] = (initial_coc - (initial_coc - cost_of_capital)/5)[:, None]
+        coc[:, -1] = cost_of_capital
+
+        cumulated_df = np.cumprod(1/(1+coc[:, :-1]), axis=1)
+        pv = (fcff[:, :-1] * cumulated_df).sum(axis=1)
+        terminal_value = fcff[:, -1] / (coc[:, -1] - growth[:, -1])
+        operating_assets = terminal_value * cumulated_df[:, -1] + pv
+
+        debt, minority, cash, non_op = base['equity_bridge']
+        return (operating_assets - debt - minority + cash + non_op) / base['shares']
+
+    def simulate(self, n=100000, seed=None, percentiles=(5, 25, 50, 75, 95), **distributions) -> dict:
+        # Monte Carlo over the inputs in DCF.Distributions, e.g.
+        #   dcf.simulate(beta=('uniform', .8, 1.4), sales_to_cap=1.2)
+        # Returns the value per share at each percentile, and prints them against the last price.
+        for name in distributions:
+            assert name in DCF.Distributions, "Unknown simulated input '{}'".format(name)
+        base = self.simulation_base()
+        rng = np.random.default_rng(seed)
+        inputs = {}
+        for name, default in DCF.Distributions.items():
+            spec = distributions.get(name, default(base[name]))
+            if type(spec) in (int, float):
+                inputs[name] = np.full(n, float(spec))
+            else:
+                inputs[name] = getattr(rng, spec[0])(*spec[1:], size=n)
+
+        start_time = time.time()
+        value = self.project(base, **inputs)
+        result = dict(zip(percentiles, np.percentile(value, percentiles)))
+        print("Simulated {} scenarios in {:.2f} ms".format(n, (time.time()-start_time)*1e3))
+
+        price = self.last_price()
+        heads = ['Percentile', 'Value / share', 'Price as % of value']
+        print(tabulate([[p, v, price / v] for p, v in result.items()], headers=heads, floatfmt=".2f"))
+        print("Price is below value in {:.1f}% of scenarios".format((value > price).mean() * 100))
+        return result
+
+    def fixed_inputs(self, base, n) -> dict:
+        # Simulated inputs held at their deterministic value over n scenarios
+        return {name: np.full(n, float(base[name])) for name in DCF.Distributions}
+
+    def sensitivity(self, x, x_values, y, y_values, base=None) -> np.ndarray:
+        # Value per share over the grid of two inputs of DCF.Distributions, one row per y value.
+        # e.g. dcf.sensitivity('cost_of_capital', [.07, .08, .09], 'terminal_growth', [.02, .03])
+        assert x in DCF.Distributions and y in DCF.Distributions and x != y
+        base = self.simulation_base() if base is None else base
+        xs, ys = np.meshgrid(np.asarray(x_values, dtype=float), np.asarray(y_values, dtype=float))
+        inputs = self.fixed_inputs(base, xs.size)
+        inputs[x] = xs.ravel()
+        inputs[y] = ys.ravel()
+        return self.project(base, **inputs).reshape(xs.shape)
+
+    def tornado(self, base=None) -> list:
+        # One input at a time to its DCF.Swings low and high, all in one batch.
+        # Returns [input, low, high, value at low, value at high] by decreasing spread of value.
+        base = self.simulation_base() if base is None else base
+        names = list(DCF.Swings)
+        inputs = self.fixed_inputs(base, 2 * len(names))
+        swings = []
+        for i, name in enumerate(names):
+            low, high = DCF.Swings[name](base[name])
+            inputs[name][2*i:2*i+2] = low, high
+            swings.append((low, high))
+        value = self.project(base, **inputs)
+        result = [[name, float(low), float(high), float(value[2*i]), float(value[2*i+1])]
+                  for i, (name, (low, high)) in enumerate(zip(names, swings))]
+        return sorted(result, key=lambda e: -abs(e[4] - e[3]))
+
+    # Grids written by compute(): sheet title, (x input, step), (y input, step) around the base values
+    Grids = [
+        ('Cost of capital x growth', ('cost_of_capital', .01), ('terminal_growth', .005)),
+        ('Margin x sales growth', ('terminal_margin', .02), ('stable_growth', .02)),
+    ]
+
+    def compute_sensitivity(self, excel: 'ExcelOut', d, steps=2):
+        base = self.simulation_base(d)
+        for title, (x, dx), (y, dy) in DCF.Grids:
+            offsets = np.arange(-steps, steps+1)
+            x_values = base[x] + dx * offsets
+            y_values = base[y] + dy * offsets
+            grid = self.sensitivity(x, x_values, y, y_values, base=base)
+            write_grid(excel.wb, title, x, x_values, y, y_values, grid)
+        write_tornado(excel.wb, self.tornado(base=base), self.project(base, **self.fixed_inputs(base, 1))[0])
+
+
 class Ticks:
     pass
     # def __init__(self, ticks, path):
@@ -710,9 +881,11 @@ class Ticks:
     #     # excel.start()
 
 
-dcf = DCF('intc', country='United States')
-dcf.compute()
-print("XXX", dcf)
+if __name__ == '__main__':
+    dcf = DCF('intc', country='United States')
+    dcf.compute()
+    print("XXX", dcf)
+    dcf.simulate()
 
 # Damodaran main data page
 # https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datacurrent.html
\ No newline at end of file
@@ -0,0 +1,165 @@
+import argparse
+import importlib
+import io
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from openpyxl import Workbook
+from openpyxl.styles import Font
+from tabulate import tabulate
+
+from bcolors import bcolors, colour_print
+import market
+from utils import colnum_string
+
+# Modules of the DCF models, both expose DataSet and DCF(tick, ..., dataset=, market=)
+Models = ['dcf2', 'dcf_excel']
+
+
+class ThreadLog(io.TextIOBase):
+    """sys.stdout of a batch, the prints of a worker thread are buffered for the parent to print in order."""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+    def write(self, s):
+        buffer = getattr(self.local, 'buffer', None)
+        return (self.stdout if buffer is None else buffer).write(s)
+
+    def flush(self):
+        self.stdout.flush()
+
+    def capture(self):
+        self.local.buffer = io.StringIO()
+
+    def release(self) -> str:
+        buffer, self.local.buffer = self.local.buffer, None
+        return buffer.getvalue()
+
+
+def value(tick, model, dataset, market, path="spreads", out="dcfs", log=None):
+    # DCF of one ticker saved to out/dcf_<tick>.xlsx.
+    # Returns (tick, summary or None, workbook, console log, error).
+    if log is not None:
+        log.capture()
+    workbook = os.path.join(out, 'dcf_{}.xlsx'.format(tick))
+    summary = error = None
+    try:
+        dcf = model.DCF(tick, country=dataset.country, industry=dataset.industry, path=path,
+                        dataset=dataset, market=market)
+        summary = dcf.compute(workbook)
+    except Exception as e:
+        error = traceback.format_exception_only(e)[-1].strip()
+        colour_print("Failed to value {}: {}".format(tick, error), bcolors.FAIL)
+    return tick, summary, workbook, log.release() if log is not None else '', error
+
+
+def rank(results) -> list:
+    # Valued tickers by price as % of value, cheapest first, negative values and failures last
+    def key(r):
+        pct = r[1]['Price as % of value'] if r[1] is not None else None
+        return type(pct) is not float, type(pct) is float and pct <= 0, pct if type(pct) is float else 0
+    return sorted(results, key=key)
+
+
+def write_summary(results, path):
+    heads = ['Rank', 'Ticker', 'Price', 'Estimated value / share', 'Price as % of value',
+             'Terminal cost of capital', 'Workbook', 'Error']
+    formats = [None, None, '#,0.00', '#,0.00', '0.00%', '0.00%', None, None]
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Summary'
+    ft = Font(name='Calibri', size=11)
+    for j, h in enumerate(heads):
+        ws.cell(row=1, column=j+1).value = h
+        ws.column_dimensions[colnum_string(j+1)].width = 24
+    for i, (tick, summary, workbook, _, error) in enumerate(results):
+        summary = summary or {}
+        row = [i+1, tick] + [summary.get(h) for h in heads[2:6]] + \
+              [os.path.basename(workbook) if error is None else None, error]
+        for j, val in enumerate(row):
+            cell = ws.cell(row=i+2, column=j+1)
+            # Excel errors of dcf_excel such as '#DIV/0!' are written as text
+            cell.value = str(val) if isinstance(val, str) else val
+            cell.font = ft
+            if formats[j] is not None and type(val) is float:
+                cell.number_format = formats[j]
+    wb.save(path)
+
+
+def run(tickers, model='dcf2', country='United States', industry='semiconductor', path="spreads",
+        out="dcfs", jobs=4) -> list:
+    # Value tickers in a pool of worker threads sharing one DataSet and one MarketData, so that
+    # reference workbooks, Yahoo Finance lookups and the S&P 500 return are loaded once.
+    # Returns the ranked (tick, summary, workbook, log, error) and writes out/summary.xlsx.
+    module = importlib.import_module(model)
+    dataset = module.DataSet(country, industry)
+    market_data = market.MarketData()
+    os.makedirs(out, exist_ok=True)
+
+    results = []
+    if jobs > 1:
+        log = ThreadLog(sys.stdout)
+        task = partial(value, model=module, dataset=dataset, market=market_data, path=path, out=out, log=log)
+        sys.stdout = log
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                # map() keeps the ticker order, so the logs print as in the serial run.
+                for result in executor.map(task, tickers):
+                    log.stdout.write(result[3])
+                    results.append(result)
+        finally:
+            sys.stdout = log.stdout
+    else:
+        for tick in tickers:
+            results.append(value(tick, module, dataset, market_data, path, out))
+
+    results = rank(results)
+    rows = [[i+1, r[0]] + [r[1][h] for h in ('Price', 'Estimated value / share', 'Price as % of value')]
+            for i, r in enumerate(results) if r[1] is not None]
+    print(tabulate(rows, headers=['Rank', 'Ticker', 'Price', 'Value / share', 'Price as % of value'],
+                   floatfmt=".2f"))
+    for r in results:
+        if r[4] is not None:
+            colour_print("Failed: {} {}".format(r[0], r[4]), bcolors.FAIL)
+    summary = os.path.join(out, 'summary.xlsx')
+    write_summary(results, summary)
+    print("Valued {} tickers, {} failed, summary in '{}'".format(
+        len(results), sum(1 for r in results if r[4] is not None), summary))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Value tickers with DCF into ranked dcfs/summary.xlsx")
+    parser.add_argument('tickers', nargs='*', help="tickers with spreads/<ticker>.xlsx")
+    parser.add_argument('--model', choices=Models, default='dcf2', help="DCF model of each ticker")
+    parser.add_argument('--country', default='United States')
+    parser.add_argument('--industry', default='semiconductor')
+    parser.add_argument('--tradingview', action='store_true',
+                        help="add the tickers of the TradingView sector configured in tradingview.py")
+    parser.add_argument('--jobs', '-j', type=int, default=4, help="number of worker threads")
+    parser.add_argument('--out', default='dcfs', help="directory of the DCF workbooks and summary.xlsx")
+    parser.add_argument('--offline', action='store_true', help="replay the market data cache only")
+    parser.add_argument('--fake', metavar='FILE',
+                        help="market data from a FakeProvider file such as scripts/data/market-fake.json")
+    parser.add_argument('--cache', metavar='FILE', help="market data cache, market_cache.sqlite by default")
+    args = parser.parse_args()
+    market.configure(offline=args.offline or None, fake=args.fake, cache=args.cache)
+
+    tickers = list(args.tickers)
+    if args.tradingview:
+        # Selenium is only needed here
+        import tradingview
+        tickers.extend(t for t in tradingview.TradingView().fetch() if t not in tickers)
+    if len(tickers) == 0:
+        parser.error("no tickers given")
+    run(tickers, args.model, args.country, args.industry, out=args.out, jobs=args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,16 @@
 import datetime
 import re
+import numpy as np
 import pandas as pd
 
 from bcolors import colour_print, bcolors
 from typing import List
 from enum import IntEnum
-import yfinance as yf
 from tabulate import tabulate
 from calculator import *
+from refdata import ReferenceData, Sheet, NearestIndex
+from sensitivity import write_grid, write_tornado
+from market import MarketData
 
 
 class RowIndex(IntEnum):
@@ -29,6 +32,7 @@ class RowIndex(IntEnum):
 
     number_shares = 27
     adr_ratio = 29
+    sales_to_cap_ratio = 33
 
     returns = 34
     invested_capital = 35
@@ -51,15 +55,15 @@ class DataSet:
         self.country = country
         self.industry = industry
 
+    def sheet(self, name, sheet) -> Sheet:
+        return ReferenceData.sheet(self.path + '/{}.xlsx'.format(name), sheet)
+
     def get_country_tax_rates(self):
         name = 'countrytaxrates'
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format(name))
-        ws = wb[name]
-        for i in range(1, ws.max_row):
-            if ws['A{}'.format(i)].value == self.country:
-                result = ws.cell(row=i, column=ws.max_column).value
-                break
+        ws = self.sheet(name, name)
+        i = ws.find_exact(self.country)
+        assert i is not None and i < ws.max_row
+        result = ws.cell(row=i, column=ws.max_column)
         assert result is not None
         return result
 
@@ -81,90 +85,56 @@ class DataSet:
         return tab[self.country]
 
     def get_wacc(self):
-        name = 'wacc'
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format(name))
-        ws = wb['Industry Averages']
-        for i in range(20, ws.max_row):
-            print(ws['A{}'.format(i)].value)
-            if re.match(self.industry, ws['A{}'.format(i)].value, re.IGNORECASE):
-                result = ws.cell(row=i, column=ws.max_column).value
-                break
+        ws = self.sheet('wacc', 'Industry Averages')
+        i = ws.find_title(self.industry, start=20, flags=re.IGNORECASE)
+        assert i is not None
+        result = ws.cell(row=i, column=ws.max_column)
         assert result is not None
         return result
 
     def get_equity_risk_premium(self):
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format('ERPs by country'))
-        ws = wb['Sheet1']
-        for i in range(8, ws.max_row):
-            if re.match(self.country, ws['A{}'.format(i)].value):
-                result = ws.cell(row=i, column=total_half_elem).value
-                break
+        ws = self.sheet('ERPs by country', 'Sheet1')
+        i = ws.find_title(self.country, start=8)
+        assert i is not None
+        result = ws.cell(row=i, column=total_half_elem)
         assert result is not None
         return result
 
     def get_currency_suffix(self, sticky_price):
         assert self.country is not None
-        result = None
-        with open(self.path + '/yahoo_currency_suffix.txt', encoding='utf-8') as infile:
-            # https://www.gnucash.org/docs/v4/C/gnucash-help/fq-spec-yahoo.html
-            suffix_index = None
-            for i, field in enumerate(infile.readline().split('|')):
-                if re.match('suffix', field, re.IGNORECASE):
-                    suffix_index = i
-                    break
-            assert suffix_index is not None
-            for line in infile:
-                a = line[:-1].split('|')
-                if re.match(a[suffix_index][1:], sticky_price):
-                    result = a[suffix_index][1:]
-                    break
-        return result
+        suffixes = ReferenceData.currency_suffixes(self.path + '/yahoo_currency_suffix.txt')
+        return next((x for x in suffixes if re.match(x, sticky_price)), None)
 
-    def get_sales_to_cap_ratio(self):
-        name = 'capex'
-        sales_to_cap_index = None
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format(name))
-        ws = wb['Industry Averages']
-        for i in range(1, ws.max_column+1):
-            a = ws.cell(row=8, column=i).value
-            if re.match(r'Sales/ Invested Capital', a):
-                sales_to_cap_index = i
-                break
+    def sales_to_cap_sheet(self):
+        ws = self.sheet('capex', 'Industry Averages')
+        sales_to_cap_index = ws.find_header(r'Sales/ Invested Capital', row=8)
         assert sales_to_cap_index is not None
-        for i in range(8, ws.max_row):
-            if re.match(self.industry, ws['A{}'.format(i)].value, re.IGNORECASE):
-                result = ws.cell(row=i, column=sales_to_cap_index).value
-                break
+        return ws, sales_to_cap_index
+
+    def get_sales_to_cap_ratio(self):
+        ws, sales_to_cap_index = self.sales_to_cap_sheet()
+        i = ws.find_title(self.industry, start=8, flags=re.IGNORECASE)
+        assert i is not None
+        result = ws.cell(row=i, column=sales_to_cap_index)
         assert result is not None
         return result
 
-    def match_sales_to_cap_ratio(self, sales_to_cap_ratio):
-        name = 'capex'
-        sales_to_cap_index = None
-        result = None
-        wb = load_workbook(self.path + '/{}.xlsx'.format(name))
-        ws = wb['Industry Averages']
-        for i in range(1, ws.max_column + 1):
-            a = ws.cell(row=8, column=i).value
-            if re.match(r'Sales/ Invested Capital', a):
-                sales_to_cap_index = i
-                break
-        assert sales_to_cap_index is not None
-        result = []
-        for i in range(9, ws.max_row):
-            diff = ws.cell(row=i, column=sales_to_cap_index).value - sales_to_cap_ratio
-            # print(ws.cell(row=i, column=1).value, diff)
-            result.append([
-                ws.cell(row=i, column=1).value,
-                ws.cell(row=i, column=sales_to_cap_index).value, abs(diff), ])
-        return sorted(result, key=lambda e: e[2])
+    def sales_to_cap_index(self) -> NearestIndex:
+        ws, sales_to_cap_index = self.sales_to_cap_sheet()
+        return ws.nearest_index(sales_to_cap_index, start=9)
+
+    def match_sales_to_cap_ratio(self, sales_to_cap_ratio, k=None):
+        # [[industry, Sales/ Invested Capital, error], ...] of the k closest industries
+        return self.sales_to_cap_index().nearest(sales_to_cap_ratio, k)
+
+    def match_sales_to_cap_ratios(self, sales_to_cap_ratios, k):
+        # Batch of match_sales_to_cap_ratio() as (industries, ratios, errors) arrays, one row per ratio
+        return self.sales_to_cap_index().nearest_many(sales_to_cap_ratios, k)
 
 
 class DCF(Spread):
-    def __init__(self, tick, country=None, industry=None, path=None):
+    def __init__(self, tick, country=None, industry=None, path=None, dataset=None, market=None):
+        # dataset and market: DataSet and MarketData shared by a batch of tickers, see dcf_batch.py
         colour_print("Company's ticker '{}'".format(tick), bcolors.UNDERLINE)
 
         if country is None:
@@ -179,12 +149,15 @@ class DCF(Spread):
             path = 'spreads'
             print("Set path to '{}'".format(path))
 
-        self.wb = load_workbook(path + '/' + tick + '.xlsx')
+        self.wb = load_spread(path + '/' + tick + '.xlsx')
         super().__init__(self.wb, tick)
 
         self.excel = ExcelWriter(tick)
-        self.dataset = DataSet(country, industry)
+        self.dataset = DataSet(country, industry) if dataset is None else dataset
+        self.market = MarketData() if market is None else market
         self.cached_ticker = None
+        # Title to (row, column) of the what-if outputs, see what_if()
+        self.outputs = None
 
         # Revenues, Operating Income, Interest Expense, ...
 
@@ -269,29 +242,11 @@ class DCF(Spread):
         return result
 
     def sp500_return(self):
-        # Get S&P 500 data from the last 10 years
-        today = datetime.datetime.today()
-        sp500 = yf.download('^GSPC',
-                            start='{}-01-01'.format(str(today.year-11)),
-                            end='{}-01-01'.format(str(today.year-1)))
-        # Calculate the total return (closing prices)
-        initial_value = sp500['Close'].iloc[0]
-        final_value = sp500['Close'].iloc[-1]
-        total_return = (final_value - initial_value) / initial_value
-
-        # Number of years
-        years = (sp500.index[-1] - sp500.index[0]).days / 365.25
-
-        # Calculate the annualized return
-        a = (1 + total_return) ** (1 / years) - 1
-        annualized_return = float(a.array[0])
-
-        print(f"The annualized return over the last {years:.2f} years is {annualized_return:.2%}")
-        # Convert the numbers from numpy.float64 to float.
-        # yfinance numpy.float64 need to be convert to regular float
-        return annualized_return
-
-    def compute(self):
+        # Annualized S&P 500 return, downloaded once per MarketData
+        return self.market.sp500_return()
+
+    def compute(self, path='aaa.xlsx') -> dict:
+        # Saves the DCF workbook to path, returns summary()
         d = self.excel.create_dict()
         self.compute_revenue(d)
         self.compute_ebit(d)
@@ -306,8 +261,16 @@ class DCF(Spread):
         self.compute_trade(d)
 
         self.collect(d)
+        self.compute_sensitivity()
 
-        self.excel.wb.save('aaa.xlsx')
+        self.excel.save(path)
+        return self.summary()
+
+    def summary(self) -> dict:
+        # Title to value of the computed DCF, as ranked by dcf_batch.py
+        book = self.excel.formulas()
+        titles = ['Price', 'Estimated value / share', 'Price as % of value', 'Terminal cost of capital']
+        return {title: book.result(self.output_cell(title)) for title in titles}
 
     def compute_revenue(self, d):
         # Compute past
@@ -488,7 +451,7 @@ class DCF(Spread):
         # TODO Asia countries not in U.S. coverage
         if True:
             print("Probable Sales to cap ratio:")
-            matches = self.dataset.match_sales_to_cap_ratio(sales_to_cap_source)[:total_half_elem]
+            matches = self.dataset.match_sales_to_cap_ratio(sales_to_cap_source, total_half_elem)
             heads = ['Company', 'Sales to Cap', 'Error']
             print(tabulate(matches, headers=heads, floatfmt=".2f"), "\n")
             # Selecting mid of the 5 matches
@@ -496,6 +459,10 @@ class DCF(Spread):
         else:
             sales_to_cap_ratio = sales_to_cap_source
 
+        # Own cell so that a what-if edit reaches every year of reinvestment
+        d.set('Sales to capital ratio', sales_to_cap_ratio, RowIndex.sales_to_cap_ratio)
+        sales_to_cap_cell = '{}{}'.format(colnum_string(2), RowIndex.sales_to_cap_ratio)
+
         reinvestment = d.create_array('- Reinvestment', RowIndex.reinvestment)
         # Current year based on Reinvestment is derived from current year for Capex + D&A + Changes in NWC
         capex = self.strip(self.cashflow.match_title('Capital Expenditure'))
@@ -511,7 +478,7 @@ class DCF(Spread):
         for i in range(1, elem_end):
             r = "=({next_year}{sales}-{start_year}{sales})/{sales_to_cap_ratio}".format(
                 next_year=colnum_string(i+next_year_offset), sales=RowIndex.sales,
-                start_year=colnum_string(i+start_year_offset), sales_to_cap_ratio=sales_to_cap_ratio)
+                start_year=colnum_string(i+start_year_offset), sales_to_cap_ratio=sales_to_cap_cell)
             reinvestment.append(r)
 
         # Terminal growth rate / End of ROIC * End of NOPAT
@@ -777,12 +744,12 @@ class DCF(Spread):
 
             # Test the ticker by obtaining beta
             print("Querying ticker name: \"{}\"".format(tick_name))
-            ticker = yf.Ticker(tick_name)
+            ticker = self.market.ticker(tick_name)
             if 'beta' not in ticker.info:
                 assert len(self.head) > 0
                 initial_query = ' '.join(self.head.split()[:-1])
                 print("Waiting to query Yahoo Finance server with '{}'".format(initial_query))
-                ticker = yf.Ticker(get_symbol(initial_query))
+                ticker = self.market.ticker(self.market.symbol(initial_query))
             self.cached_ticker = ticker
         else:
             ticker = self.cached_ticker
@@ -892,6 +859,93 @@ class DCF(Spread):
         a = self.title_value('- Reinvestment', d).last()
         print("Last reinvested was {:,.2f}".format(calculate('#'+a, d)))
 
+    def what_if(self, cell, value) -> dict:
+        # Edit one input of the computed DCF and recompute only the cells depending on it.
+        # cell: 'B29' or a row title such as 'ADR ratio', 'Terminal cost of capital' or
+        #   'Sales to capital ratio' for its value in column B, a year of a row as 'F6' for tax rate.
+        # Returns the outputs that changed by title, e.g. {'Price as % of value': 0.85, ...}
+        d = self.excel.dict
+        if self.outputs is None:
+            self.outputs = {}
+            for title in ('Estimated value / share', 'Value per share after ADR', 'Price as % of value'):
+                column, row = Formula.ref(self.title_value(title, d).value())
+                self.outputs[title] = row, column
+        if not re.match(r'[A-Z]+\d+$', cell):
+            cell = self.title_value(cell, d).value()
+        changed = self.excel.formulas().set(cell, value)
+        return {title: changed[key] for title, key in self.outputs.items() if key in changed}
+
+    def drivers(self) -> dict:
+        # Input of sensitivity() and tornado() to the cell it overrides, later years follow it.
+        # Terminal cost of capital is the last year of the cost of capital row, years 6 to 10 fade to it.
+        def cell(column, row):
+            return '{}{}'.format(colnum_string(column), row)
+        return {
+            'Sales growth': cell(len(self.forward_sales)+1, RowIndex.sales_growth_rate),
+            'EBIT margin': cell(len(self.forward_ebit)+1, RowIndex.ebit_margin),
+            'Cost of capital': cell(start_year_offset+1, RowIndex.cost_of_capital),
+            'Terminal cost of capital': cell(total_main_col+1, RowIndex.cost_of_capital),
+            'Terminal growth': cell(total_main_col+1, RowIndex.sales_growth_rate),
+            'Sales to capital ratio': cell(2, RowIndex.sales_to_cap_ratio),
+        }
+
+    # Low and high values of each driver around its computed value x for tornado()
+    Swings = {
+        'Sales growth': lambda x: (x - .01, x + .01),
+        'EBIT margin': lambda x: (x - .02, x + .02),
+        'Cost of capital': lambda x: (x - .01, x + .01),
+        'Terminal cost of capital': lambda x: (x - .01, x + .01),
+        'Terminal growth': lambda x: (x - .005, x + .005),
+        'Sales to capital ratio': lambda x: (.8 * x, 1.2 * x),
+    }
+
+    # Grids written by compute(): sheet title, (x driver, step), (y driver, step) around the computed values
+    Grids = [
+        ('Cost of capital x growth', ('Terminal cost of capital', .01), ('Terminal growth', .005)),
+        ('Margin x sales growth', ('EBIT margin', .02), ('Sales growth', .02)),
+    ]
+
+    def output_cell(self, title='Estimated value / share'):
+        return self.title_value(title, self.excel.dict).value()
+
+    def sensitivity(self, x, x_values, y, y_values, output='Estimated value / share') -> np.ndarray:
+        # Output over the grid of two drivers, one row per y value, in one batch of the compiled sheet.
+        # e.g. dcf.sensitivity('Terminal cost of capital', [.07, .08], 'Terminal growth', [.03, .04])
+        drivers = self.drivers()
+        assert x in drivers and y in drivers and x != y
+        xs, ys = np.meshgrid(np.asarray(x_values, dtype=float), np.asarray(y_values, dtype=float))
+        cell = self.output_cell(output)
+        result = self.excel.formulas().batch({drivers[x]: xs.ravel(), drivers[y]: ys.ravel()}, [cell])
+        return result[cell].reshape(xs.shape)
+
+    def tornado(self, output='Estimated value / share') -> list:
+        # One driver at a time to its DCF.Swings low and high, every driver in one batch.
+        # Returns [driver, low, high, output at low, output at high] by decreasing spread of output.
+        drivers = self.drivers()
+        book = self.excel.formulas()
+        names = list(DCF.Swings)
+        inputs = {}
+        for i, name in enumerate(names):
+            base = book.result(drivers[name])
+            inputs[drivers[name]] = np.full(2 * len(names), float(base))
+            inputs[drivers[name]][2*i:2*i+2] = DCF.Swings[name](base)
+        cell = self.output_cell(output)
+        value = book.batch(inputs, [cell])[cell]
+        result = [[name, float(inputs[drivers[name]][2*i]), float(inputs[drivers[name]][2*i+1]),
+                   float(value[2*i]), float(value[2*i+1])] for i, name in enumerate(names)]
+        return sorted(result, key=lambda e: -abs(e[4] - e[3]))
+
+    def compute_sensitivity(self, steps=2):
+        # Extra sheets of the saved workbook
+        drivers = self.drivers()
+        book = self.excel.formulas()
+        offsets = np.arange(-steps, steps+1)
+        for title, (x, dx), (y, dy) in DCF.Grids:
+            x_values = book.result(drivers[x]) + dx * offsets
+            y_values = book.result(drivers[y]) + dy * offsets
+            write_grid(self.excel.wb, title, x, x_values, y, y_values, self.sensitivity(x, x_values, y, y_values))
+        write_tornado(self.excel.wb, self.tornado(), book.result(self.output_cell()))
+
     @staticmethod
     def title_value(title, d):
         return d.get(title)
@@ -1,6 +1,6 @@
 from calculator import *
 from bcolors import colour_print, bcolors
-import yfinance as yf
+from market import MarketData
 from openpyxl import Workbook, worksheet
 from collections import OrderedDict
 
@@ -55,16 +55,17 @@ class _Spread:
 
 
 class Dividend(Spread):
-    def __init__(self, tick, spread, path='spreads'):
+    def __init__(self, tick, spread, path='spreads', market=None):
         colour_print("Company's ticker '{}'".format(tick), bcolors.UNDERLINE)
 
-        self.wb: Workbook = load_workbook(path + '/' + tick + '.xlsx')
+        self.wb = load_spread(path + '/' + tick + '.xlsx')
         super().__init__(self.wb, tick)
 
         self.spread = _Spread(spread, tick)
         self.shares_out = self.income.match_title('Weighted Average Diluted Shares Outstanding')
         self.div_paid = self.cashflow.match_title('Common Dividends Paid')
-        self.ticker = yf.Ticker(get_symbol(self.tick)[0])
+        self.market = MarketData() if market is None else market
+        self.ticker = self.market.ticker(self.market.symbol(self.tick))
         self.mcap = self.ticker.info['marketCap'] / 1e6
 
     def trim_estimates(self, title, **kwargs):
@@ -117,13 +118,7 @@ class Dividend(Spread):
 
     def _dividend_yield_past_years(self):
         # 4 years dividend yield
-        market_cap = self.strip(self.values.match_title('Market Cap'))
-        i = 0
-        MC = []
-        while i < len(market_cap):
-            MC.append(average(market_cap[i:i+4]))
-            # print(a, i, j)
-            i += 4
+        MC = self.annual('Market Cap')
 
         div_yield = []
         for i in range(1, 5):
@@ -156,13 +151,7 @@ class Dividend(Spread):
         # For example, if an investor purchased a stock five years ago for $20,
         # and its current dividend is $1.50 per share,
         # then the YOC for that stock would be 7.5%.
-        price = self.strip(self.values.match_title('Price$'))
-        i = 0
-        P = []
-        while i < len(price):
-            P.append(average(price[i:i + 4]))
-            # print(a, i, j)
-            i += 4
+        P = self.annual('Price$')
 
         div_paid = self.cashflow.match_title('Common Dividends Paid')
         dps = abs(average(div_paid[r0:r1])) / average(self.shares_out[r0:r1])
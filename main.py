@@ -3,56 +3,133 @@
 # Press Shift+F10 to execute it or replace it with your code.
 # Press Double Shift to search everywhere for classes, files, tool windows, actions, and settings.
 
+import argparse
+import contextlib
+import io
 import os.path
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from openpyxl import load_workbook
-from tikr_terminal import ProfManager, SpreadX
+from tikr_terminal import ProfManager, Prof, SpreadX, DefaultMetrics, Metrics, schedule
+from spread import load_spread, SpreadCache
+from checkpoint import Checkpoint
 from bcolors import bcolors, colour_print
 import tradingview
 
 
+def screen(c, path="spreads", metrics=DefaultMetrics):
+    # Load one ticker and compute its metrics. Returns the picklable Prof, or None if the spread is missing.
+    xls_path = path+'/' + c + '.xlsx'
+    if not os.path.isfile(xls_path):
+        colour_print("Excel file is missing: '{}'".format(xls_path), bcolors.WARNING)
+        return None
+
+    print('Ticker {}'.format(c))
+    wb = load_spread(xls_path)
+    pf = Prof(c)
+    t = SpreadX(wb, c, pf, pf.long_name_ref)
+    t.run(metrics)
+    print("Derived series cache: {hits} hits, {misses} misses".format(**t.cache_info()))
+    print()
+    return pf
+
+
+def screen_task(c, path="spreads", metrics=DefaultMetrics, keep_going=False, quiet=False):
+    # Returns (Prof, console log, error). The log is only buffered for quiet workers, to be printed in
+    # ticker order by the parent. With keep_going, a failed ticker reports its error rather than raising.
+    out = io.StringIO()
+    error = None
+    with contextlib.redirect_stdout(out) if quiet else contextlib.nullcontext():
+        try:
+            pf = screen(c, path, metrics)
+        except Exception as e:
+            if not keep_going:
+                raise
+            pf = None
+            error = traceback.format_exception_only(e)[-1].strip()
+            colour_print("Failed to screen {}: {}".format(c, error), bcolors.FAIL)
+    return pf, out.getvalue(), error
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Screen TIKR spreads into output.xlsx")
+    parser.add_argument('tickers', nargs='*', help="tickers with spreads/<ticker>.xlsx")
+    parser.add_argument('--metrics', default=','.join(DefaultMetrics),
+                        help="comma separated metrics to compute, from: {}".format(', '.join(Metrics)))
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="number of worker processes to screen the tickers")
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help="JSON lines checkpoint to resume from; failed tickers are reported instead of "
+                             "aborting the run and unchanged spreads are not recomputed")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="recompute tickers that failed in the checkpoint even if their spread is unchanged")
+    parser.add_argument('--scores', metavar='FILE',
+                        help="JSON file of the bucket assignments; only the recomputed tickers are re-scored")
+    args = parser.parse_args()
+    metrics = args.metrics.split(',')
+    try:
+        schedule(metrics)
+    except ValueError as e:
+        parser.error(str(e))
+
+    path = "spreads"
     prof = ProfManager()
     # tickers = tradingview.TradingView().fetch()
-    tickers = []
+    tickers = args.tickers
+
+    checkpoint = None
+    sha1 = {}
+    results = {}
+    if args.checkpoint is not None:
+        checkpoint = Checkpoint(args.checkpoint)
+        for c in tickers:
+            xls_path = path+'/' + c + '.xlsx'
+            if not os.path.isfile(xls_path):
+                continue
+            sha1[c] = SpreadCache.fingerprint(xls_path)
+            record = checkpoint.lookup(c, sha1[c], metrics, retry_failed=args.retry_failed)
+            if record is not None:
+                results[c] = Prof.from_dict(record['prof']) if record['status'] == Checkpoint.Ok else None
+        print("Resuming {} of {} tickers from checkpoint '{}'".format(len(results), len(tickers), args.checkpoint))
+
+    def done(c, pf, log, error):
+        print(log, end='')
+        results[c] = pf
+        if checkpoint is not None and c in sha1:
+            checkpoint.write(c, sha1[c], metrics, prof=None if pf is None else pf.to_dict(), error=error)
+
+    todo = [c for c in tickers if c not in results]
+    task = partial(screen_task, path=path, metrics=metrics, keep_going=checkpoint is not None)
+    if args.jobs > 1:
+        # map() keeps the ticker order, so the output is the same as the serial run.
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            for c, result in zip(todo, executor.map(partial(task, quiet=True), todo)):
+                done(c, *result)
+    else:
+        for c in todo:
+            done(c, *task(c))
 
-    path = "spreads"
     for c in tickers:
-        xls_path = path+'/' + c + '.xlsx'
-        if not os.path.isfile(xls_path):
-            colour_print("Excel file is missing: '{}'".format(xls_path), bcolors.WARNING)
-            continue
-
-        print('Ticker {}'.format(c))
-        wb = load_workbook(path+'/' + c + '.xlsx')
-        pf = prof.create_folder(c)
-        t = SpreadX(wb, c, pf, pf.long_name_ref)
-        t.revenue()
-        # t.epu()
-        t.op_yield()
-        t.owner_yield()
-        # t.cfo()
-        # AFFO commented diff
-        # t.affo()
-        # t.nav()
-        # Tangible commented diff
-        # t.tangible_book()
-        # t.return_equity()
-        t.return_invested_cap()
-        t.net_debt_over_ebit()
-        # t.net_debt_over_fcf()
-        # t.retained_earnings_ratio()
-        # t.market_cap_over_retained_earnings_ratio()
-        # t.op_margin()
-        t.ev_over_ebit()
-        # t.dividend_payout_ratio()
-        t.div_yield()
-        t.last_price()
-        print()
-
-    prof.profile()
+        if results.get(c) is not None:
+            prof.add_folder(results[c])
+
+    if checkpoint is not None:
+        failures = checkpoint.failures(tickers)
+        for c, error in failures:
+            colour_print("Failed: {} {}".format(c, error), bcolors.FAIL)
+        print("Screened {} tickers, {} failed".format(len(tickers), len(failures)))
+
+    if args.scores is not None:
+        prof.load_scores(args.scores)
+        changed = [results[c] for c in tickers
+                   if results.get(c) is not None and (c in todo or c not in prof.assigned)]
+        removed = [c for c in prof.assigned if results.get(c) is None]
+        prof.profile_incremental(changed, removed)
+        prof.save_scores(args.scores)
+    else:
+        prof.profile()
 
 
 if __name__ == '__main__':
     main()
-
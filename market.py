@@ -0,0 +1,232 @@
+import datetime
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+import yahooquery as yq
+import yfinance as yf
+
+from utils import get_symbol
+
+# Info snapshot of a symbol, in place of yf.Ticker for ticker.info lookups
+Quote = namedtuple('Quote', 'symbol info')
+
+
+class MarketDataMissing(LookupError):
+    pass
+
+
+class YahooProvider:
+    """Live Yahoo Finance: info snapshots and OHLCV history from yfinance, symbol searches from yahooquery."""
+
+    def info(self, symbol) -> dict:
+        return yf.Ticker(symbol).info
+
+    def search(self, query) -> dict:
+        return yq.search(query)
+
+    def history(self, symbols, start, end) -> pd.DataFrame:
+        # symbols: a symbol or a list of them, columns as yf.download such as ('Close', '^GSPC')
+        return yf.download(symbols, start=start, end=end)
+
+
+class CachedProvider:
+    """
+    On-disk TTL cache of a provider in SQLite, one row per lookup:
+        cache(kind, key, fetched, value)
+    kind is 'info', 'search' or 'history'. Info and searches are kept as JSON, history as a pickled
+    DataFrame. History ending before today never expires. Offline, every cached row is replayed
+    whatever its age and a lookup missing from the cache raises MarketDataMissing.
+    """
+    # Seconds a lookup is reused for
+    ttl = {'info': 24 * 3600, 'search': 30 * 24 * 3600, 'history': 24 * 3600}
+
+    def __init__(self, provider=None, path='market_cache.sqlite', offline=False):
+        assert provider is not None or offline, "A live provider is needed unless offline"
+        self.provider = provider
+        self.path = path
+        self.offline = offline
+        self.hits = self.misses = 0
+        # One connection shared by the worker threads of a batch
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache ("
+                            "kind TEXT, key TEXT, fetched REAL, value BLOB, PRIMARY KEY (kind, key))")
+
+    def get(self, kind, key, fetch, expires=True):
+        with self.lock:
+            row = self.db.execute("SELECT fetched, value FROM cache WHERE kind = ? AND key = ?",
+                                  (kind, key)).fetchone()
+        if row is not None and (self.offline or not expires or time.time() - row[0] < self.ttl[kind]):
+            self.hits += 1
+            return self.decode(kind, row[1])
+        if self.offline:
+            raise MarketDataMissing("{} '{}' is not in the market data cache '{}'".format(kind, key, self.path))
+
+        self.misses += 1
+        value = fetch()
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                            (kind, key, time.time(), self.encode(kind, value)))
+        return value
+
+    @staticmethod
+    def encode(kind, value):
+        return pickle.dumps(value) if kind == 'history' else json.dumps(value)
+
+    @staticmethod
+    def decode(kind, value):
+        return pickle.loads(value) if kind == 'history' else json.loads(value)
+
+    def info(self, symbol) -> dict:
+        return self.get('info', symbol.upper(), lambda: self.provider.info(symbol))
+
+    def search(self, query) -> dict:
+        return self.get('search', query, lambda: self.provider.search(query))
+
+    def history(self, symbols, start, end) -> pd.DataFrame:
+        key = '{} {} {}'.format(history_key(symbols), start, end)
+        past = end is not None and str(end) < datetime.date.today().isoformat()
+        return self.get('history', key, lambda: self.provider.history(symbols, start, end), expires=not past)
+
+
+class FakeProvider:
+    """
+    Market data read from local files for offline runs and benchmarks, described by a JSON file:
+        {"info": {"INTC": {"beta": ..., "marketCap": ..., ...}, ...},
+         "search": {"Intel Corporation": {"quotes": [...]}, ...},
+         "history": {"^GSPC": "wsj-s&p500-historical.csv", ...}}
+    History files are CSV with Date, Open, High, Low, Close and optional Volume columns, as the
+    WSJ downloads in scripts/data, relative to the JSON file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path) as f:
+            self.data = json.load(f)
+
+    def lookup(self, kind, key):
+        try:
+            return self.data[kind][key]
+        except KeyError:
+            raise MarketDataMissing("{} '{}' is not in '{}'".format(kind, key, self.path)) from None
+
+    def info(self, symbol) -> dict:
+        return self.lookup('info', symbol.upper())
+
+    def search(self, query) -> dict:
+        return self.lookup('search', query)
+
+    def history(self, symbols, start, end) -> pd.DataFrame:
+        frames = {}
+        for symbol in [symbols] if type(symbols) is str else symbols:
+            name = os.path.join(os.path.dirname(self.path), self.lookup('history', symbol.upper()))
+            df = pd.read_csv(name, skipinitialspace=True)
+            df.index = pd.to_datetime(df.pop('Date'), format='mixed')
+            frames[symbol] = df.sort_index()
+        # Columns as yf.download, price field then symbol
+        df = pd.concat(frames, axis=1).swaplevel(axis=1).sort_index(axis=1)
+        df.index.name = 'Date'
+        return df.loc[(df.index >= pd.Timestamp(start)) & (df.index < pd.Timestamp(end))]
+
+
+def history_key(symbols):
+    return symbols.upper() if type(symbols) is str else ','.join(sorted(s.upper() for s in symbols))
+
+
+# Provider of MarketData() and utils.get_symbol() unless given, see configure()
+provider = None
+
+
+def configure(offline=None, fake=None, cache=None):
+    # Set the process-wide provider. Defaults come from the environment:
+    #   MARKET_DATA_FAKE=scripts/data/market-fake.json  FakeProvider of the file
+    #   MARKET_DATA_OFFLINE=1                            replay of the cache only
+    #   MARKET_DATA_CACHE=market_cache.sqlite            cache of the live Yahoo Finance lookups
+    global provider
+    fake = os.environ.get('MARKET_DATA_FAKE') if fake is None else fake
+    offline = os.environ.get('MARKET_DATA_OFFLINE', '') not in ('', '0') if offline is None else offline
+    cache = os.environ.get('MARKET_DATA_CACHE', 'market_cache.sqlite') if cache is None else cache
+    if fake:
+        provider = FakeProvider(fake)
+    else:
+        provider = CachedProvider(None if offline else YahooProvider(), cache, offline=offline)
+    return provider
+
+
+def default_provider():
+    return configure() if provider is None else provider
+
+
+class MarketData:
+    """Market data lookups of the DCF models, each fetched once and shared by every DCF given it.
+
+    A batch of tickers shares one MarketData, so that the S&P 500 history is downloaded once and
+    a ticker or a company name is only queried once across worker threads.
+    """
+
+    def __init__(self, provider=None):
+        self.provider = default_provider() if provider is None else provider
+        # Symbol to Quote
+        self.tickers = {}
+        # Company name to its Yahoo symbol
+        self.symbols = {}
+        self.sp500 = None
+        # Lookups of different keys run concurrently, the S&P 500 download is only done once.
+        self.lock = threading.Lock()
+        self.sp500_lock = threading.Lock()
+
+    def ticker(self, symbol) -> Quote:
+        ticker = self.tickers.get(symbol)
+        if ticker is None:
+            ticker = Quote(symbol, self.provider.info(symbol))
+            with self.lock:
+                ticker = self.tickers.setdefault(symbol, ticker)
+        return ticker
+
+    def symbol(self, query):
+        symbol = self.symbols.get(query)
+        if symbol is None:
+            symbol, _ = get_symbol(query, search=self.provider.search)
+            with self.lock:
+                symbol = self.symbols.setdefault(query, symbol)
+        return symbol
+
+    def history(self, symbols, start, end) -> pd.DataFrame:
+        return self.provider.history(symbols, start, end)
+
+    def sp500_return(self) -> float:
+        # Annualized return of the S&P 500 over the last 10 full years
+        with self.sp500_lock:
+            if self.sp500 is None:
+                self.sp500 = self.download_sp500_return()
+        return self.sp500
+
+    def download_sp500_return(self) -> float:
+        # Get S&P 500 data from the last 10 years
+        today = datetime.datetime.today()
+        sp500 = self.history('^GSPC',
+                             start='{}-01-01'.format(str(today.year-11)),
+                             end='{}-01-01'.format(str(today.year-1)))
+        # Calculate the total return (closing prices)
+        initial_value = sp500['Close'].iloc[0]
+        final_value = sp500['Close'].iloc[-1]
+        total_return = (final_value - initial_value) / initial_value
+
+        # Number of years
+        years = (sp500.index[-1] - sp500.index[0]).days / 365.25
+
+        # Calculate the annualized return
+        a = (1 + total_return) ** (1 / years) - 1
+        annualized_return = float(a.array[0])
+
+        print(f"The annualized return over the last {years:.2f} years is {annualized_return:.2%}")
+        # Convert the numbers from numpy.float64 to float.
+        # yfinance numpy.float64 need to be convert to regular float
+        return annualized_return
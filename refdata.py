@@ -0,0 +1,226 @@
+import os
+import re
+import bisect
+import threading
+import numpy as np
+from typing import Optional
+from openpyxl import load_workbook
+
+from spread import SpreadCache
+
+
+class Sheet:
+    """Rows of a reference worksheet, 1-based like openpyxl's ws.cell(row, column).
+
+    Titles in the first column are indexed by exact value, and pattern lookups are memoized so a
+    country or industry is only scanned once per process.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.max_row = len(rows)
+        self.max_column = len(rows[0]) if rows else 0
+        # Title to the first row holding it
+        self.exact_title = {}
+        for i, r in enumerate(rows, 1):
+            if r[0] is not None:
+                self.exact_title.setdefault(r[0], i)
+        # Memoized (pattern, flags, first row) to row, None when nothing matched.
+        self.matched_title = {}
+        # (column, first row) to NearestIndex
+        self.indexes = {}
+
+    def cell(self, row, column):
+        return self.rows[row-1][column-1]
+
+    def column(self, column, start=1, stop=None):
+        # Values of rows in range(start, stop), stop defaults to max_row as the legacy scans did.
+        stop = self.max_row if stop is None else stop
+        return [self.rows[i-1][column-1] for i in range(start, stop)]
+
+    def find_exact(self, title) -> Optional[int]:
+        return self.exact_title.get(title)
+
+    def find_title(self, reg, start=1, flags=0) -> Optional[int]:
+        # First row from start matching re.match(reg, title, flags), the last row is not scanned.
+        key = reg, flags, start
+        if key not in self.matched_title:
+            self.matched_title[key] = next(
+                (i for i in range(start, self.max_row)
+                 if type(self.rows[i-1][0]) is str and re.match(reg, self.rows[i-1][0], flags)), None)
+        return self.matched_title[key]
+
+    def find_header(self, reg, row) -> Optional[int]:
+        # Column of the header cell in row matching reg.
+        return next((j for j, a in enumerate(self.rows[row-1], 1)
+                     if type(a) is str and re.match(reg, a)), None)
+
+    def nearest_index(self, column, start=1) -> 'NearestIndex':
+        # Index of the numeric values of column keyed by the title of their row, built once per sheet.
+        key = column, start
+        if key not in self.indexes:
+            titles = self.column(1, start)
+            values = self.column(column, start)
+            self.indexes[key] = NearestIndex([(t, v) for t, v in zip(titles, values)
+                                              if type(v) in (int, float)])
+        return self.indexes[key]
+
+
+class NearestIndex:
+    """Sorted array of (title, value) pairs for k nearest neighbour lookups by value.
+
+    Neighbours are ordered by distance, ties by the original row order, as a stable sort of the
+    rows by abs(value - x) would give.
+    """
+
+    def __init__(self, pairs):
+        order = sorted(range(len(pairs)), key=lambda i: pairs[i][1])
+        # Row order of each sorted value, breaks ties in distance.
+        self.rank = np.array(order, dtype=np.int64)
+        self.titles = np.array([pairs[i][0] for i in order], dtype=object)
+        self.values = np.array([pairs[i][1] for i in order], dtype=np.float64)
+        self.sorted = self.values.tolist()
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def nearest(self, x, k=None) -> list:
+        # [[title, value, abs(value - x)], ...] of the k nearest values, all of them when k is None.
+        k = len(self) if k is None else min(k, len(self))
+        hi = bisect.bisect_left(self.sorted, x)
+        lo = hi - 1
+        result = []
+        while len(result) < k:
+            # Walk outwards from x, taking the closer side first.
+            if lo < 0:
+                take_hi = True
+            elif hi >= len(self):
+                take_hi = False
+            else:
+                d_lo, d_hi = x - self.sorted[lo], self.sorted[hi] - x
+                take_hi = (d_hi, self.rank[hi]) < (d_lo, self.rank[lo])
+            i = hi if take_hi else lo
+            if take_hi:
+                hi += 1
+            else:
+                lo -= 1
+            result.append([self.titles[i], self.sorted[i], abs(self.sorted[i] - x)])
+        return result
+
+    def nearest_many(self, xs, k):
+        # Vectorized nearest() over an array of values.
+        # Returns (titles, values, distances) arrays of shape (len(xs), k), nearest first.
+        xs = np.asarray(xs, dtype=np.float64)
+        k = min(k, len(self))
+        # The k nearest of x lie within k positions on either side of its insertion point.
+        hi = np.searchsorted(self.values, xs, side='left')
+        window = hi[:, None] + np.arange(-k, k)[None, :]
+        valid = (window >= 0) & (window < len(self))
+        window = np.clip(window, 0, len(self) - 1)
+        distance = np.where(valid, np.abs(self.values[window] - xs[:, None]), np.inf)
+        # Sort each row by distance then row order, lexsort takes its primary key last.
+        order = np.lexsort((self.rank[window], distance), axis=-1)[:, :k]
+        picked = np.take_along_axis(window, order, axis=1)
+        return self.titles[picked], self.values[picked], np.take_along_axis(distance, order, axis=1)
+
+
+class ReferenceData:
+    """Process-wide store of the Damodaran workbooks in datacurrent/.
+
+    A worksheet is parsed once and kept as a .npz sidecar next to the workbook, keyed by the
+    workbook mtime, so later processes skip openpyxl as well. Sheets are shared by every DataSet.
+    """
+    version = '1'
+    suffix = '.npz'
+
+    # (workbook path, sheet name) to (mtime, Sheet)
+    sheets = {}
+    # Worker threads of a batch share the sheets and their sidecars
+    lock = threading.RLock()
+
+    @classmethod
+    def sheet(cls, path, name) -> Sheet:
+        with cls.lock:
+            return cls.load_sheet(path, name)
+
+    @classmethod
+    def load_sheet(cls, path, name) -> Sheet:
+        mtime = os.stat(path).st_mtime
+        key = path, name
+        cached = cls.sheets.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        sidecar = '{}.{}{}'.format(path, re.sub(r'\W', '_', name), cls.suffix)
+        rows = cls.load(sidecar, mtime)
+        if rows is None:
+            rows = cls.read(path, name)
+            try:
+                cls.save(sidecar, mtime, rows)
+            except OSError as e:
+                print("Warning: unable to write reference cache '{}': {}".format(sidecar, e))
+        sheet = Sheet(rows)
+        cls.sheets[key] = mtime, sheet
+        return sheet
+
+    @staticmethod
+    def read(path, name):
+        wb = load_workbook(path, read_only=True)
+        try:
+            rows = [list(r) for r in wb[name].iter_rows(values_only=True)]
+        finally:
+            wb.close()
+        width = max((len(r) for r in rows), default=0)
+        for r in rows:
+            r.extend([None] * (width-len(r)))
+        return rows
+
+    @classmethod
+    def save(cls, sidecar, mtime, rows):
+        kinds, nums, text = SpreadCache.encode(rows)
+        with open(sidecar, 'wb') as f:
+            np.savez(f, meta=np.array([cls.version]), mtime=np.array([mtime]),
+                     kinds=kinds, nums=nums, text=text)
+
+    @classmethod
+    def load(cls, sidecar, mtime) -> Optional[list]:
+        if not os.path.isfile(sidecar):
+            return None
+        try:
+            with np.load(sidecar, allow_pickle=False) as z:
+                if z['meta'][0] != cls.version or z['mtime'][0] != mtime:
+                    return None
+                return SpreadCache.decode(z['kinds'], z['nums'], z['text'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # Parsed yahoo_currency_suffix.txt, (mtime, suffixes)
+    suffixes = None
+
+    @classmethod
+    def currency_suffixes(cls, path) -> list:
+        # Yahoo symbol suffixes such as '.KL', in file order.
+        with cls.lock:
+            return cls.load_currency_suffixes(path)
+
+    @classmethod
+    def load_currency_suffixes(cls, path) -> list:
+        mtime = os.stat(path).st_mtime
+        if cls.suffixes is not None and cls.suffixes[0] == mtime:
+            return cls.suffixes[1]
+
+        result = []
+        with open(path, encoding='utf-8') as infile:
+            # https://www.gnucash.org/docs/v4/C/gnucash-help/fq-spec-yahoo.html
+            suffix_index = None
+            for i, field in enumerate(infile.readline().split('|')):
+                if re.match('suffix', field, re.IGNORECASE):
+                    suffix_index = i
+                    break
+            assert suffix_index is not None
+            for line in infile:
+                a = line[:-1].split('|')
+                if len(a) > suffix_index:
+                    result.append(a[suffix_index][1:])
+        cls.suffixes = mtime, result
+        return result
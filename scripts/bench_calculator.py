@@ -0,0 +1,121 @@
+import contextlib
+import io
+import random
+import time
+import numpy as np
+from calculator import ExcelWriter, Calculator, calculate, colnum_string, total_main_col
+
+
+def dcf_sheet(tick):
+    # Rows and formulas shaped as dcf_excel.DCF writes them, over 10 years and a terminal year.
+    excel = ExcelWriter(tick)
+    d = excel.create_dict()
+    years = range(3, total_main_col+1)
+
+    def array(key, row, base, fn):
+        a = d.create_array(key, row)
+        a.append(base)
+        for i in years:
+            a.append(fn(colnum_string(i-1), colnum_string(i)))
+        return a
+
+    array('Revenue growth rate', 2, None, lambda p, c: random.uniform(.02, .2))
+    array('Revenue', 3, random.uniform(1e3, 1e5), lambda p, c: '={c}2*{p}3+{p}3'.format(p=p, c=c))
+    array('EBIT margin', 4, random.uniform(.05, .3), lambda p, c: '={p}4'.format(p=p))
+    array('EBIT', 5, None, lambda p, c: '={c}3*{c}4'.format(c=c))
+    array('Tax rate', 6, .21, lambda p, c: '={p}6'.format(p=p))
+    array('NOPAT', 7, None, lambda p, c: '={c}5*(1-{c}6)'.format(c=c))
+    array('- Reinvestment', 8, None, lambda p, c: '=({c}3-{p}3)/1.5'.format(p=p, c=c))
+    array('FCFF', 9, None, lambda p, c: '={c}7-{c}8'.format(c=c))
+    array('Cost of capital', 11, .09, lambda p, c: '={p}11'.format(p=p))
+    array('Cumulated discount factor', 12, 1, lambda p, c: '={p}12*(1/(1+{c}11))'.format(p=p, c=c))
+    array('PV (FCFF)', 13, None, lambda p, c: '={c}9*{c}12'.format(c=c))
+    last, second_last = colnum_string(total_main_col+1), colnum_string(total_main_col)
+    d.set('Terminal value', '{l}9/({l}11-0.03)'.format(l=last), 14)
+    d.set('PV (Terminal value)', 'B14*{}12'.format(second_last), 15)
+    d.set('PV (Cash flow over next 10 years)', 'SUM(C13:{}13)'.format(second_last), 16)
+    d.set('Value of operating assets', 'B15+B16', 17)
+    d.set('Number of shares', str(random.randint(100, 10000)), 18)
+    d.set('Estimated value / share', 'B17/B18', 19)
+    d.set('Price', str(random.randint(1, 100)), 20)
+    d.set('Price as % of value', 'B20/B19', 21)
+    return d
+
+
+def zero_check():
+    # ExcelArray writes a zero as '', saved as a blank that Excel reads as 0 in arithmetic and leaves
+    # out of SUM, AVERAGE, MIN and MAX. The recalculated values must be the numbers Excel shows.
+    excel = ExcelWriter('zero')
+    d = excel.create_dict()
+    a = d.create_array('Values', 2)
+    for v in (0, 4, 0, 2):
+        a.append(v)
+    d.set('Plus one', 'B2+1', 3)
+    d.set('Sum', 'SUM(B2:E2)', 4)
+    d.set('Average', 'AVERAGE(B2:E2)', 5)
+    d.set('Min', 'MIN(B2:E2)', 6)
+    d.set('Zero', 'B2', 7)
+    d.set('Label', 'A2', 8)
+    expected = {(3, 2): 1., (4, 2): 6., (5, 2): 3., (6, 2): 2., (7, 2): 0., (8, 2): 'Values'}
+    results = excel.formulas().recalculate()
+    for key, value in expected.items():
+        assert results[key] == value, (key, results[key], value)
+
+
+def collect(d, calc):
+    # Same lookups as DCF.collect
+    return calc('#' + d.get('Price as % of value').value(), d), calc('#' + d.get('- Reinvestment').last(), d)
+
+
+def legacy(cell, d):
+    return Calculator().evaluate_cell(cell, d)
+
+
+def bench(label, sheets, calc):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = [collect(d, calc) for d in sheets]
+    elapsed = time.perf_counter() - start
+    print("{:<22} {:8.2f} ms per DCF".format(label, elapsed * 1e3 / len(sheets)))
+    return elapsed, result
+
+
+def main(n=200):
+    zero_check()
+    sheets = [dcf_sheet('t{}'.format(i)) for i in range(n)]
+    print("Evaluating {} DCF workbooks".format(n))
+    a, legacy_result = bench('Calculator', sheets, legacy)
+    b, compiled_result = bench('compiled calculate()', sheets, calculate)
+    assert legacy_result == compiled_result
+    c, _ = bench('cached values', sheets, calculate)
+    print("Compiled formulas are {:.1f}x faster, {:.0f}x on a second lookup".format(a / b, a / c))
+
+    start = time.perf_counter()
+    for d in sheets:
+        d.excel.touch()
+        d.excel.formulas().recalculate()
+    elapsed = time.perf_counter() - start
+    print("{:<22} {:8.2f} ms per DCF, every formula cell".format('recalculate()', elapsed * 1e3 / n))
+
+    # What-if edits on a recalculated sheet: number of shares, then the first year cost of capital.
+    book = sheets[0].excel.formulas()
+    for cell, label, value in (('B18', 'set() shares', lambda i: 1000 + i),
+                               ('C11', 'set() cost of capital', lambda i: .09 + i * 1e-6)):
+        rounds = 1000
+        start = time.perf_counter()
+        for i in range(rounds):
+            book.set(cell, value(i))
+        elapsed = time.perf_counter() - start
+        print("{:<22} {:8.1f} us per edit".format(label, elapsed * 1e6 / rounds))
+
+    # Vectorized what-if over a grid of cost of capital and shares, as DCF.sensitivity() does.
+    n = 100000
+    coc, shares = np.meshgrid(np.linspace(.06, .12, n // 100), np.linspace(500, 1500, 100))
+    start = time.perf_counter()
+    book.batch({'C11': coc.ravel(), 'B18': shares.ravel()}, ['B19'])
+    elapsed = time.perf_counter() - start
+    print("{:<22} {:8.1f} us per scenario, {} scenarios".format('batch()', elapsed * 1e6 / n, n))
+
+
+if __name__ == "__main__":
+    main()
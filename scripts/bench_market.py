@@ -0,0 +1,51 @@
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import market
+import dcf2
+
+Fake = os.path.join(os.path.dirname(__file__), 'data', 'market-fake.json')
+
+
+def value(tickers, provider):
+    # dcf2 valuations of tickers sharing one MarketData, without writing workbooks
+    data = market.MarketData(provider)
+    dataset = dcf2.DataSet('United States', 'semiconductor')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for tick in tickers:
+            dcf = dcf2.DCF(tick, dataset=dataset, market=data)
+            dcf.simulation_base()
+
+
+def bench(label, tickers, provider):
+    start = time.perf_counter()
+    value(tickers, provider)
+    elapsed = time.perf_counter() - start
+    print("{:<22} {:8.1f} ms per ticker".format(label, elapsed * 1e3 / len(tickers)))
+
+
+def main(tickers=('intc', 'qcom', 'meta'), lookups=1000):
+    print("Valuing {} offline with {}".format(', '.join(tickers), Fake))
+    fake = market.FakeProvider(Fake)
+    bench('FakeProvider', tickers, fake)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'market_cache.sqlite')
+        # Recorded once from the fake provider in place of Yahoo Finance, then replayed offline
+        bench('CachedProvider cold', tickers, market.CachedProvider(fake, path))
+        offline = market.CachedProvider(None, path, offline=True)
+        bench('CachedProvider offline', tickers, offline)
+
+        start = time.perf_counter()
+        for _ in range(lookups):
+            offline.info('INTC')
+        elapsed = time.perf_counter() - start
+        print("{:<22} {:8.1f} us per info lookup".format('cache hit', elapsed * 1e6 / lookups))
+        offline.db.close()
+
+
+if __name__ == "__main__":
+    main()
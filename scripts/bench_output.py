@@ -0,0 +1,40 @@
+import os
+import random
+import tempfile
+import time
+from tikr_terminal import Prof, ProfMethod, Scored, WorkWrap, BulkWorkWrap
+
+
+def company(i):
+    prof = Prof('t{:04d}'.format(i))
+    prof.long_name_ref.append('Company {}'.format(i))
+    for x in Scored:
+        prof._collect(random.uniform(-.5, .5), x, ProfMethod.Average,
+                      val2=random.uniform(-.5, .5), val3=random.uniform(-.5, .5))
+    prof.collect_last_price({'last_price': random.uniform(.1, 100), 'market_cap': random.uniform(10, 1e5),
+                             'revenue': random.uniform(10, 1e5), 'op_income': random.uniform(1, 1e4),
+                             'net_profit': random.uniform(1, 1e4), 'dpu': random.uniform(0, .1)})
+    prof.profile()
+    return prof
+
+
+def bench(label, cls, companies, benched, path):
+    start = time.perf_counter()
+    cls(companies, benched).start(path)
+    elapsed = time.perf_counter() - start
+    print("{:<14} {:8.1f} ms {:8.1f} KiB".format(label, elapsed * 1e3, os.path.getsize(path) / 1024))
+    return elapsed
+
+
+def main(n=1000):
+    companies = [company(i) for i in range(n)]
+    benched = {'score': {c.name: random.uniform(0, 10) for c in companies}}
+    print("Writing output.xlsx for {} companies".format(n))
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = bench('WorkWrap', WorkWrap, companies, benched, os.path.join(tmp, 'a.xlsx'))
+        bulk = bench('BulkWorkWrap', BulkWorkWrap, companies, benched, os.path.join(tmp, 'b.xlsx'))
+    print("Bulk writer is {:.1f}x faster".format(legacy / bulk))
+
+
+if __name__ == "__main__":
+    main()
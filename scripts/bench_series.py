@@ -0,0 +1,44 @@
+import random
+import time
+from series import Series
+from utils import list_over_list, list_add_list, list_multiply_list, list_one
+
+
+def roic_lists(op_income, tax, debt, equity, cash):
+    tax_rate = list_over_list(tax, op_income)
+    nopat = list_multiply_list(op_income, list_add_list(list_one(1, len(tax)), tax_rate))
+    return list_over_list(nopat, list_add_list(list_add_list(debt, equity), cash), percent=True)
+
+
+def roic_series(op_income, tax, debt, equity, cash):
+    nopat = Series(op_income) * (1 + Series(tax).over(op_income))
+    return nopat.over(Series(debt) + equity + cash, percent=True)
+
+
+def bench(label, fn, rows, rounds=5):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(*rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("{:<16} {:8.2f} ms".format(label, best * 1e3))
+    return best
+
+
+def main(years=12, tickers=2000):
+    # Concatenate the yearly rows of many tickers, as a batch run would go through them.
+    n = years * tickers
+    rows = [[random.uniform(1e3, 1e6) for _ in range(n)] for _ in range(5)]
+    a = roic_lists(*rows)
+    b = roic_series(*rows)
+    assert all(abs(x - y) < 1e-9 * max(1., abs(x)) for x, y in zip(a, b))
+
+    print("ROIC chain over {} values".format(n))
+    legacy = bench('utils list_*', roic_lists, rows)
+    vector = bench('Series', roic_series, rows)
+    print("Series is {:.1f}x faster".format(legacy / vector))
+
+
+if __name__ == "__main__":
+    main()
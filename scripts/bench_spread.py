@@ -0,0 +1,38 @@
+import glob
+import time
+from openpyxl import load_workbook
+from spread import SpreadCache, read_spread
+
+
+def bench(label, loader, paths, rounds=3):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for p in paths:
+            loader(p)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("{:<28} {:8.1f} ms total {:8.2f} ms/spread".format(
+        label, best * 1e3, best * 1e3 / len(paths)))
+    return best
+
+
+def main(path='spreads'):
+    paths = sorted(glob.glob(path + '/*.xlsx'))
+    assert len(paths) > 0, "No spreadsheet found in '{}'".format(path)
+    print("Parsing {} spreadsheets in '{}'".format(len(paths), path))
+
+    # Both loaders should agree before their timings are compared.
+    for p in paths:
+        a = read_spread(p, stream=False)
+        b = read_spread(p, stream=True)
+        assert a.tables == b.tables, p
+
+    legacy = bench('Table (cell lookup)', lambda p: read_spread(p, stream=False), paths)
+    stream = bench('Table.from_iter_rows', lambda p: read_spread(p, stream=True), paths)
+    bench('load_workbook only', load_workbook, paths)
+    print("Streaming loader is {:.1f}x faster".format(legacy / stream))
+
+
+if __name__ == "__main__":
+    main()
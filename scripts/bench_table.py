@@ -0,0 +1,90 @@
+import io
+import math
+import random
+import sys
+import time
+from bs4 import BeautifulSoup
+
+import bootstrap
+from table import Page, extract_tables, fix_percent
+
+
+def tikr_page(rows=120, periods=45):
+    # Page source shaped as a TIKR financials table: Vuetify wrappers, a header of period ends and
+    # rows of a title followed by amounts, negatives in parentheses, percents and missing values.
+    def amount():
+        x = random.uniform(-1e5, 1e5)
+        kind = random.random()
+        if kind < .1:
+            return '-'
+        if kind < .15:
+            return 'NM'
+        if kind < .35:
+            return '{:.2f}%'.format(x / 1e3)
+        if kind < .4:
+            return '{:.2f}x'.format(abs(x) / 1e4)
+        text = '{:,.1f}'.format(abs(x))
+        return '({})'.format(text) if x < 0 else text
+
+    head = ''.join('<th class="text-right"><span>{}/{}/{}</span></th>'.format(
+        random.randint(1, 12), random.randint(1, 28), 13 + i // 4) for i in range(periods))
+    body = []
+    for i in range(rows):
+        cells = ''.join('<td class="text-right"><span class="primaryAction--text">{}</span></td>'.format(amount())
+                        for _ in range(periods))
+        body.append('<tr><td class="text-left fixedfirstrow"><div><span>Line item {}</span>'
+                    '<!-- tooltip --></div></td>{}</tr>'.format(i, cells))
+    table = ('<table><thead><tr><th class="text-left"></th>{}</tr></thead>'
+             '<tbody>{}</tbody></table>').format(head, '\n'.join(body))
+    return ('<html><head><style>.v-data-table td {{ height: 24px; }}</style>'
+            '<script>var table = "<table>";</script></head><body><div class="v-application">'
+            '<div class="v-data-table__wrapper">{}</div>'
+            '<div class="v-data-table__wrapper">{}</div></div></body></html>').format(table, table)
+
+
+def legacy(html):
+    # Clipboard.write_excel before TableExtractor: BeautifulSoup, Page and the percent fix
+    soup = BeautifulSoup(html, 'lxml')
+    bootstrap.Out = io.StringIO()
+    page = Page(soup.find_all('table')[0])
+    page.parse_top()
+    data = []
+    for row in page.data:
+        data.append([fix_percent(x) if type(x) is str and Page.re_percent.match(x) else x for x in row])
+    return data
+
+
+def same(a, b):
+    # NaN free equality of the cells, floats from the same text are identical
+    return len(a) == len(b) and all(
+        len(r) == len(s) and all(x == y or (type(x) is float and math.isnan(x) and math.isnan(y))
+                                 for x, y in zip(r, s)) for r, s in zip(a, b))
+
+
+def bench(label, fn, pages):
+    start = time.perf_counter()
+    result = [fn(html) for html in pages]
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:8.1f} ms per page".format(label, elapsed * 1e3 / len(pages)))
+    return elapsed, result
+
+
+def main(paths):
+    # Saved page sources of TIKR, e.g. driver.page_source written to a file, or generated pages
+    if paths:
+        pages = [open(p, encoding='utf-8').read() for p in paths]
+    else:
+        random.seed(1)
+        pages = [tikr_page() for _ in range(10)]
+    print("Extracting the first table of {} pages".format(len(pages)))
+    a, expected = bench('BeautifulSoup + Page', legacy, pages)
+    b, tables = bench('TableExtractor', lambda html: extract_tables(html)[0], pages)
+    c, _ = bench('TableExtractor logged', lambda html: extract_tables(html, log=io.StringIO())[0], pages)
+    for e, t in zip(expected, tables):
+        assert same(e, t.data)
+    cells = sum(len(r) for t in tables for r in t.data)
+    print("TableExtractor is {:.1f}x faster, {:.0f} cells per ms".format(a / b, cells / (b * 1e3)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,55 @@
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench_table import tikr_page
+
+# server/ is not a package, run_transfer is imported as the script it is
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+import run_transfer
+
+
+def snapshots(path, tickers):
+    # Page sources of TIKR-shaped tables as Clipboard(snapshots=...) saves them, one directory a ticker
+    periods = {'values': 60, 'estimates': 12}
+    for tick in tickers:
+        directory = os.path.join(path, tick)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'header.txt'), 'w', encoding='utf-8') as f:
+            f.write('{} Corp. (NasdaqGS:{})\n$42.00\n'.format(tick.upper(), tick.upper()))
+        for _, selection, _ in run_transfer.Tabs:
+            for title in [selection] if type(selection) is str else selection:
+                name = run_transfer.snapshot_name(title)
+                with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+                    f.write(tikr_page(periods=periods.get(name[:-5], 45)))
+
+
+def main(path=None, tickers=20):
+    # path: directory of page sources saved by run_transfer.py --snapshots, generated unless given
+    with tempfile.TemporaryDirectory() as tmp:
+        if path is None:
+            random.seed(1)
+            path = os.path.join(tmp, 'snapshots')
+            snapshots(path, ['t{:02}'.format(i) for i in range(tickers)])
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            clips = run_transfer.replay(path, out=os.path.join(tmp, 'spreads'))
+        elapsed = time.perf_counter() - start
+
+    n = len(clips)
+    print("Replayed {} tickers in {:.2f} s, {:.2f} tickers/s".format(n, elapsed, n / elapsed))
+    stages = {k: sum(c.elapsed[k] for c in clips) for k in ('source', 'parse', 'write', 'save')}
+    # The browser stage of a replay is reading the saved page sources in place of driver.page_source
+    print("{:<22} {:8.1f} ms per ticker".format('browser (page source)', stages['source'] * 1e3 / n))
+    for k in ('parse', 'write', 'save'):
+        print("{:<22} {:8.1f} ms per ticker".format(k, stages[k] * 1e3 / n))
+    work = stages['parse'] + stages['write'] + stages['save']
+    print("parse and write stage  {:8.2f} tickers/s".format(n / work))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
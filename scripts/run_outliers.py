@@ -3,9 +3,9 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.ticker as tick
 from matplotlib.backend_bases import MouseButton
-import yfinance as yf
 import numpy as np
 from scipy import stats
+from market import default_provider
 
 # Step 1: Download historical data for market and stock_
 market = 'SPY'
@@ -30,8 +30,9 @@ stock = 'INTC'
 # stock = 'SOXX'
 
 tickers = [market, stock]
-data = yf.download(tickers, start='2024-03-03', end='2025-03-03')
-# data = yf.download(tickers, start='2019-12-10', end='2024-12-10')
+# Cached, or offline with MARKET_DATA_OFFLINE=1, see market.configure()
+data = default_provider().history(tickers, start='2024-03-03', end='2025-03-03')
+# data = default_provider().history(tickers, start='2019-12-10', end='2024-12-10')
 print("market {} and stock {}".format(market, stock))
 
 # Step 2: Calculate daily returns
@@ -1,9 +1,10 @@
-import yfinance as yf
 import matplotlib.pyplot as plt
+from market import default_provider
 
 # Fetch VIX data
-vix_data = yf.download('^VIX', start='2023-12-01', end='2024-12-31')
-# vix_data = yf.download('^VIX', start='2004-12-01', end='2024-12-31')
+# Cached, or offline with MARKET_DATA_OFFLINE=1, see market.configure()
+vix_data = default_provider().history('^VIX', start='2023-12-01', end='2024-12-31')
+# vix_data = default_provider().history('^VIX', start='2004-12-01', end='2024-12-31')
 
 # Extract the dates and VIX closing values
 dates = vix_data.index
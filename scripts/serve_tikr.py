@@ -0,0 +1,109 @@
+import argparse
+import functools
+import html
+import os
+import random
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_transfer import run_transfer, snapshots
+
+# Static stand-in of TIKR for run_transfer.py --url, serving the page sources saved by
+# run_transfer.py --snapshots DIR as /<tick>/ and /<tick>/<table>.html. Each page has the links,
+# the header, the decimal button and the year slider MainTable reads, then the saved table.
+# The decimal button changes the text of the page and the slider only its attributes, as the
+# aria-valuenow of TIKR's slider, so that Waits.settled() is run on both kinds of mutation.
+# The slider is 2000px to the right for MainTable to drag it left in the window of run_static().
+Page = """<html><body>
+<div class="nav">{links}</div>
+<div class="container header">{header}</div>
+<button class="mdi-decimal-increase" onclick="changed()">+</button>
+<div class="v-slider__thumb"></div>
+<div id="slider" aria-valuemax="36" aria-valuenow="36" style="margin-left: 2000px; width: 600px; height: 10px"></div>
+<span id="changes"></span>
+<script>
+function changed() {{ document.getElementById('changes').textContent += '.'; }}
+function slid() {{
+    var slider = document.getElementById('slider');
+    slider.setAttribute('aria-valuenow', Math.max(0, +slider.getAttribute('aria-valuenow') - 1));
+}}
+document.addEventListener('mouseup', slid);
+</script>
+{table}
+</body></html>"""
+
+
+def links():
+    # Tabs of TIKR, then the tables of the Financials tab
+    result = []
+    for title, selection, _ in run_transfer.Tabs:
+        first = selection[0] if type(selection) is list else selection
+        result.append('<a href="{}">{}</a>'.format(run_transfer.snapshot_name(first), title))
+    for title in run_transfer.Tabs[0][1]:
+        result.append('<a href="{}">{}</a>'.format(run_transfer.snapshot_name(title), title))
+    return ' '.join(result)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def __init__(self, *args, path=None, delay=0., **kwargs):
+        self.root = path
+        self.delay = delay
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        parts = [x for x in self.path.split('?')[0].split('/') if x != '']
+        tick = parts[0] if len(parts) > 0 else ''
+        directory = os.path.join(self.root, os.path.basename(tick))
+        name = os.path.basename(parts[1]) if len(parts) > 1 else None
+        if tick == '' or not os.path.isfile(os.path.join(directory, 'header.txt')) or \
+                (name is not None and not os.path.isfile(os.path.join(directory, name))):
+            self.send_error(404)
+            return
+
+        with open(os.path.join(directory, 'header.txt'), encoding='utf-8') as f:
+            header, sticky_price = f.read().split('\n')[:2]
+        # MainTable.run() reads the first and the seventh line of the header
+        lines = [header, 'Ticker', 'Exchange', 'Currency', 'Sector', 'Industry', sticky_price]
+        table = ''
+        if name is not None:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                table = f.read()
+        # Time TIKR takes to load a table
+        time.sleep(self.delay)
+        body = Page.format(links=links(), header=''.join('<div>{}</div>'.format(html.escape(x)) for x in lines),
+                           table=table).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve saved TIKR page sources for run_transfer.py --url")
+    parser.add_argument('snapshots', nargs='?', help="directory of run_transfer.py --snapshots, generated if not given")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--delay', type=float, default=0., help="seconds before serving a page")
+    parser.add_argument('--tickers', type=int, default=3, help="number of tickers generated")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.snapshots
+        if path is None:
+            random.seed(1)
+            path = tmp
+            snapshots(path, ['t{:02}'.format(i) for i in range(args.tickers)])
+        tickers = sorted(x for x in os.listdir(path) if os.path.isfile(os.path.join(path, x, 'header.txt')))
+        server = ThreadingHTTPServer(('localhost', args.port),
+                                     functools.partial(Handler, path=path, delay=args.delay))
+        print("Serving {} at http://localhost:{}/<tick>/".format(', '.join(tickers), args.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from openpyxl import Workbook
+from openpyxl.styles import Font
+from utils import colnum_string
+
+
+# Extra sheets of the DCF output workbooks, see dcf2.DCF.compute_sensitivity()
+# and dcf_excel.DCF.compute_sensitivity()
+
+def number_format(v):
+    # Rates as percent, ratios and prices as decimals
+    return '0.00%' if abs(v) < 1 else '0.00'
+
+
+def write_cell(ws, row, column, val, fmt=None):
+    cell = ws.cell(row=row, column=column)
+    cell.value = val
+    cell.font = Font(name='Calibri', size=11)
+    if fmt is not None:
+        cell.number_format = fmt
+    return cell
+
+
+def write_grid(wb: Workbook, title, x, x_values, y, y_values, grid, output='Estimated value / share'):
+    # Sheet of output over a 2-D grid, x values across and y values down, grid[i][j] at y_values[i]
+    ws = wb.create_sheet(title)
+    write_cell(ws, 1, 1, output)
+    write_cell(ws, 1, 2, x)
+    write_cell(ws, 2, 1, y)
+    ws.column_dimensions[colnum_string(1)].width = 32
+    for j, v in enumerate(x_values):
+        write_cell(ws, 2, j+3, float(v), number_format(v))
+    for i, v in enumerate(y_values):
+        write_cell(ws, i+3, 2, float(v), number_format(v))
+        for j in range(len(x_values)):
+            write_cell(ws, i+3, j+3, float(grid[i][j]), '#,0.00')
+    return ws
+
+
+def write_tornado(wb: Workbook, rows, value, output='Estimated value / share'):
+    # rows: [input, low, high, output at low, output at high], largest spread first
+    ws = wb.create_sheet('Tornado')
+    heads = ['Input', 'Low', 'High', 'At low', 'At high', 'Spread']
+    for j, h in enumerate(heads):
+        write_cell(ws, 1, j+1, h)
+        ws.column_dimensions[colnum_string(j+1)].width = 32 if j == 0 else 14
+    for i, (name, low, high, value_low, value_high) in enumerate(rows):
+        write_cell(ws, i+2, 1, name)
+        write_cell(ws, i+2, 2, low, number_format(low))
+        write_cell(ws, i+2, 3, high, number_format(high))
+        for j, v in enumerate((value_low, value_high, abs(value_high - value_low))):
+            write_cell(ws, i+2, j+4, v, '#,0.00')
+    write_cell(ws, len(rows)+3, 1, output)
+    write_cell(ws, len(rows)+3, 4, float(value), '#,0.00')
+    return ws
@@ -0,0 +1,119 @@
+import numpy as np
+
+
+class Series:
+    """
+    Float64 vector over a spread row such as the stripped years of 'Total Revenues'.
+
+    Missing TIKR values (None in Table rows) are stored as NaN. The arithmetic follows the
+    utils list_* helpers it replaces:
+    - `a + b`, `a - b`, `abs(a)` and `a.sum()` count a missing value as 0.
+    - `a * b` stays missing when either side is missing.
+    - `a.over(b)` gives 0 for a missing numerator and missing for a missing denominator.
+      A zero denominator raises ZeroDivisionError by default, or gives missing with
+      on_zero='missing'.
+    Binary operations truncate to the shorter operand, as map() does over two lists.
+    Indexing and iterating return Python floats, or None for a missing value.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        if isinstance(values, Series):
+            values = values.values
+        # None converts to NaN
+        self.values = np.asarray(values, dtype=np.float64)
+
+    @classmethod
+    def of(cls, x, size=None):
+        if isinstance(x, Series):
+            return x
+        if np.isscalar(x):
+            return cls(np.full(size, x, dtype=np.float64))
+        return cls(x)
+
+    @property
+    def missing(self):
+        return np.isnan(self.values)
+
+    def filled(self, value=0.):
+        return np.where(self.missing, value, self.values)
+
+    def _pair(self, other):
+        other = Series.of(other, len(self))
+        n = min(len(self), len(other))
+        return self.values[:n], other.values[:n]
+
+    def __add__(self, other):
+        a, b = self._pair(other)
+        return Series(np.nan_to_num(a, nan=0.) + np.nan_to_num(b, nan=0.))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        a, b = self._pair(other)
+        return Series(np.nan_to_num(a, nan=0.) - np.nan_to_num(b, nan=0.))
+
+    def __rsub__(self, other):
+        return Series.of(other, len(self)) - self
+
+    def __mul__(self, other):
+        a, b = self._pair(other)
+        return Series(a * b)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Series(-self.values)
+
+    def __abs__(self):
+        return Series(np.abs(np.nan_to_num(self.values, nan=0.)))
+
+    def over(self, other, percent=False, on_zero='raise'):
+        assert on_zero in ('raise', 'missing')
+        a, b = self._pair(other)
+        present = ~np.isnan(a)
+        zero = present & (b == 0)
+        if on_zero == 'raise' and zero.any():
+            raise ZeroDivisionError('Series.over: division by zero at index {}'.format(
+                int(np.flatnonzero(zero)[0])))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = a / b
+        if percent:
+            result *= 100
+        result[~present] = 0.
+        # Missing denominator, or zero denominator with on_zero='missing'
+        result[present & (np.isnan(b) | zero)] = np.nan
+        return Series(result)
+
+    def first_present(self):
+        # Index of the first value that is not missing, len(self) when all are missing.
+        present = np.flatnonzero(~self.missing)
+        return int(present[0]) if len(present) else len(self)
+
+    def sum(self):
+        return float(np.nansum(self.values))
+
+    def tolist(self):
+        result = self.values.tolist()
+        for i in np.flatnonzero(self.missing):
+            result[i] = None
+        return result
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Series(self.values[index])
+        x = self.values[index]
+        return None if np.isnan(x) else float(x)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values if dtype is None else self.values.astype(dtype)
+
+    def __repr__(self):
+        return repr(self.tolist())
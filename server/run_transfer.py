@@ -6,21 +6,44 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver import ActionChains
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import MoveTargetOutOfBoundsException
+from selenium.common.exceptions import JavascriptException, MoveTargetOutOfBoundsException, TimeoutException
 from openpyxl import Workbook, worksheet
-from bs4 import BeautifulSoup
 import pyperclip
+import argparse
+import os
 import re
 import time
+from collections import defaultdict
 from tkinter import *
 import math
+from tabulate import tabulate
 
-from table import Page, fix_currency, fix_percent
+from table import Page, TableData, extract_tables, fix_currency, fix_percent
 from bcolors import colour_print, bcolors
 import bootstrap
 
 global driver, one_time_pass
 
+# File the cells of the last table read are logged to, such as 'console.log', None to skip logging
+console_log = None
+# Directory the page sources of each ticker are saved to for replay(), None to skip saving
+snapshot_dir = None
+
+# Tabs of TIKR, the tables read from each and the MainTable.open() offsets of the year slider,
+# in the order MainTable.run() reads them. replay() reads the same tables.
+# Offsets tried:
+#   max case for full span, offset = 15*start_offset/years
+#   based on initial number of years setting + fudge factor, offset = 5*start_offset/years
+Tabs = [
+    # Load half of the full years range of 10 years
+    # {"start_offset": -1050, "period_offset": 5}
+    ('Financials', ["Income Statement", "Balance Sheet", "Cash Flow Statement"], {}),
+    # Load half of the total range of 58.
+    # No change to start offset. Period offset based on 10 years in quarterly period
+    ('Valuation', "Values", {"start_offset": -1050, "period_offset": 23.2}),
+    ('Estimates', "Estimates", {}),
+]
+
 
 class WaitCapture:
     def __init__(self):
@@ -40,25 +63,93 @@ class WaitCapture:
         self.ticker = elem.text.lower()
 
 
+class Waits:
+    """
+    Waits of MainTable on the page instead of fixed sleeps, with the time each phase took.
+    settled() waits for the first table to have rows and the DOM to be quiet for settle seconds
+    after an action, watched by a MutationObserver installed in the page. An action that may
+    change nothing, such as a slider already at its range, only waits for settle seconds.
+    """
+    # Seconds without DOM mutations for a table to be loaded
+    settle = 0.5
+    timeout = 30
+    poll = 0.1
+
+    observe_js = """
+        if (!window.transferObserver) {
+            window.transferMutation = Date.now();
+            window.transferObserver = new MutationObserver(function () { window.transferMutation = Date.now(); });
+            window.transferObserver.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true});
+        }
+        var table = document.querySelector('table');
+        return [table ? table.querySelectorAll('tr').length : 0, window.transferMutation, Date.now()];
+    """
+
+    def __init__(self):
+        # (phase, seconds, met or timed out)
+        self.phases = []
+
+    def until(self, phase, condition, timeout=None):
+        # WebDriverWait on condition, a timeout is logged and the run goes on as after a sleep
+        start = time.perf_counter()
+        result = None
+        try:
+            # A script run while a page is replaced fails, the next poll reads the new page
+            result = WebDriverWait(driver, timeout or self.timeout, poll_frequency=self.poll,
+                                   ignored_exceptions=(JavascriptException,)).until(condition)
+        except TimeoutException:
+            colour_print("Timed out waiting for {}".format(phase), bcolors.WARNING)
+        elapsed = time.perf_counter() - start
+        self.phases.append((phase, elapsed, result is not None))
+        print("{} in {:.2f}s".format(phase, elapsed))
+        return result
+
+    def mark(self):
+        # Browser time before an action, settled() waits for mutations after it
+        return driver.execute_script(self.observe_js)[2]
+
+    def settled(self, phase, mark, timeout=None, changes=True):
+        # changes: the action is known to change the page, such as opening a tab, and a mutation
+        # after mark is waited for. Otherwise the quiet time counts from mark or the last mutation.
+        def quiet(d):
+            rows, mutation, now = d.execute_script(self.observe_js)
+            if changes and mutation <= mark:
+                return False
+            return rows > 0 and now - max(mark, mutation) >= self.settle * 1000
+        return self.until(phase, quiet, timeout)
+
+    def report(self, ticker, elapsed=None):
+        # Time of each phase of a ticker, with the stages of its Clipboard when given
+        rows = [[p, '{:.2f}'.format(t), '' if ok else 'timed out'] for p, t, ok in self.phases]
+        for stage, t in (elapsed or {}).items():
+            rows.append([stage, '{:.2f}'.format(t), ''])
+        print(tabulate(rows, headers=['Phase of {}'.format(ticker), 'Seconds', '']))
+        print("Waited {:.2f}s".format(sum(t for _, t, _ in self.phases)))
+
+
 class MainTable:
     def __init__(self, ticker):
         self.ticker = ticker
+        self.waits = Waits()
 
     def open(self, title, start_offset=None, period_offset=None):
         print("waiting to load {title}".format(title=title))
-        time.sleep(5)
-
-        driver.find_element(By.PARTIAL_LINK_TEXT, "{title}".format(title=title)).click()
-        # TODO 5 secs sleep might not work in Valuation spread.
-        time.sleep(8)
+        tab = self.waits.until("{} tab".format(title),
+                               EC.element_to_be_clickable((By.PARTIAL_LINK_TEXT, "{title}".format(title=title))))
+        if tab is None:
+            tab = driver.find_element(By.PARTIAL_LINK_TEXT, "{title}".format(title=title))
+        mark = self.waits.mark()
+        tab.click()
+        self.waits.settled("{} table".format(title), mark)
 
         global one_time_pass
         # 3 times of one_time_pass for Financials, Valuation and Estimates for one round.
         if one_time_pass < 3:
             elem = driver.find_element(By.CLASS_NAME, 'mdi-decimal-increase')
+            mark = self.waits.mark()
             elem.click()
             elem.click()
-            time.sleep(2)
+            self.waits.settled("{} decimals".format(title), mark, changes=False)
             one_time_pass += 1
 
         if start_offset is not None:
@@ -71,6 +162,7 @@ class MainTable:
             # https://stackoverflow.com/questions/40485157/how-to-move-range-input-using-selenium-in-python
             key = "aria-valuemax"
             elem = driver.find_element(By.CSS_SELECTOR, "div[{}]".format(key))
+            mark = self.waits.mark()
             avail_period = int(elem.get_dom_attribute('{}'.format(key)))
 
             offset = period_offset*start_offset/avail_period
@@ -92,55 +184,47 @@ class MainTable:
                 print("period_offset {} start_offset {} avail_period {} offset {:.2f}".format(
                     fixed, start_offset, avail_period, x))
                 move.click_and_hold(elem).move_by_offset(x, 0).release().perform()
-            time.sleep(5)
+            self.waits.settled("{} years".format(title), mark, changes=False)
         else:
             print("Skip start offset")
 
     def run(self):
         print("Waiting to prompt header dialog")
-        time.sleep(3)
-        header_containers = driver.find_element(
+        header_containers = self.waits.until("header", EC.visibility_of_element_located((
             By.XPATH,
-            "//div[contains(@class, 'container') and contains(@class, 'header')]")
+            "//div[contains(@class, 'container') and contains(@class, 'header')]")))
         line = header_containers.text.split('\n')
         assert len(line) > 6
         header = line[0]
         sticky_price = line[6]
 
         # Parse the first line text only at the time being.
-        clip = Clipboard(header, sticky_price)
-
-        # max case for full span
-        # offset = 15*start_offset/years# self.open('Financials', start_offset=0)
-
-        # Based on initial number of years setting + fudge factor
-        # offset = 5*start_offset/years
-
-        use_offset = True
-        kwargs = {}
-        # Load half of the full years range of 10 years
-        # if use_offset:
-        #     kwargs = {"start_offset": -1050, "period_offset": 5}
-        self.open('Financials', **kwargs)
-        clip.run(selection=["Income Statement", "Balance Sheet", "Cash Flow Statement"])
+        snapshots = os.path.join(snapshot_dir, self.ticker) if snapshot_dir is not None else None
+        clip = Clipboard(header, sticky_price, log=console_log, snapshots=snapshots, waits=self.waits)
 
-        if use_offset:
-            # use_offset to load half of the total range of 58.
-            kwargs = {"start_offset": -1050, "period_offset": 23.2}
-        # No change to start offset. Period offset based on 10 years in quarterly period
-        self.open('Valuation', **kwargs)
-
-        clip.run(selection="Values")
-
-        self.open('Estimates')
-        clip.run(selection="Estimates")
+        for title, selection, kwargs in Tabs:
+            self.open(title, **kwargs)
+            clip.run(selection=selection)
 
         clip.save(self.ticker)
         print("Saved to {}".format(self.ticker))
+        self.waits.report(self.ticker, clip.elapsed)
 
 
 class Clipboard:
-    def __init__(self, header, sticky_price):
+    def __init__(self, header, sticky_price, log=None, snapshots=None, waits=None):
+        # log: path of the file the cells of each table are written to
+        # snapshots: directory the page source of each table is saved to, see replay()
+        # waits: Waits of the MainTable, for the table selected to load
+        self.log = log
+        self.snapshots = snapshots
+        self.waits = waits
+        # Seconds spent reading page sources, parsing them, writing cells and saving the workbook
+        self.elapsed = defaultdict(float)
+        if snapshots is not None:
+            os.makedirs(snapshots, exist_ok=True)
+            with open(os.path.join(snapshots, 'header.txt'), 'w', encoding='utf-8') as f:
+                f.write('{}\n{}\n'.format(header, sticky_price))
         self.wb = Workbook()
         ws = self.wb.create_sheet('Header')
         # set cell to header
@@ -169,7 +253,12 @@ class Clipboard:
     def select(self, title):
         # https://stackoverflow.com/questions/21713280/find-div-element-by-multiple-class-names
         txt = "//*[contains(text(), '{title}')]".format(title=title)
-        driver.find_element(By.XPATH, txt).click()
+        if self.waits is None:
+            driver.find_element(By.XPATH, txt).click()
+        else:
+            mark = self.waits.mark()
+            driver.find_element(By.XPATH, txt).click()
+            self.waits.settled("{} table".format(title), mark)
         # driver.find_element(By.XPATH, "//*[text()='Income Statement']").click()
         # driver.find_element(By.XPATH, "//*[text()='Balance Sheet']").click()
         # driver.find_element(By.XPATH, "//*[contains(text(), 'Cash Flow Statement')]").click()
@@ -229,46 +318,95 @@ class Clipboard:
                 elif per_flag:
                     cell.number_format = '0.00%'
 
+    def page_source(self, title) -> str:
+        source = driver.page_source
+        if self.snapshots is not None:
+            with open(os.path.join(self.snapshots, snapshot_name(title)), 'w', encoding='utf-8') as f:
+                f.write(source)
+        return source
+
     def write_excel(self, title):
-        soup = BeautifulSoup(driver.page_source, 'lxml')
-        a = [x for x in soup.find_all('table')]
-        if len(a) == 0:
+        start = time.perf_counter()
+        source = self.page_source(title)
+        parse = time.perf_counter()
+        self.elapsed['source'] += parse - start
+
+        # One pass of lxml over the page source in place of BeautifulSoup and Page
+        if self.log is not None:
+            with open(self.log, 'w') as out:
+                tables = extract_tables(source, log=out)
+        else:
+            tables = extract_tables(source)
+        write = time.perf_counter()
+        self.elapsed['parse'] += write - parse
+        if len(tables) == 0:
             colour_print("Empty table: \"{}\"".format(title), bcolors.WARNING)
             return
 
-        bootstrap.Out = open('console.log', 'w')
-        with bootstrap.Out as out:
-            page = Page(a[0])
-            page.parse_top()
-            first_word = title.split()[0]
-            ws = self.wb.create_sheet(first_word)
-            # Increasing number format from 2 digit to 4 digits.
-            pref_num_format = '0.0000'
-            for row, row_data in enumerate(page.data, start=1):
-                for col, cell_val in enumerate(row_data, start=1):
-                    number_flag = False
-                    per_flag = False
-                    val = cell_val
-                    if type(cell_val) is float:
-                        number_flag = True
-                    elif type(cell_val) is str:
-                        if re.match(Page.re_percent, val):
-                            per_flag = True
-                            val = fix_percent(val)
-                    cell = ws.cell(row=row, column=col, value=val)
-                    if number_flag:
-                        if pref_num_format is not None:
-                            cell.number_format = pref_num_format
-                            if len(str(abs(math.floor(cell_val)))) > 3:
-                                # Numerical number larger than 3 digits add prefix
-                                cell.number_format = "0,00" + pref_num_format
-                        else:
-                            cell.number_format = '0,00'
-                    elif per_flag:
-                        cell.number_format = '0.00%'
+        table = tables[0]
+        first_word = title.split()[0]
+        ws = self.wb.create_sheet(first_word)
+        # Increasing number format from 2 digit to 4 digits.
+        pref_num_format = '0.0000'
+        for row, (row_data, row_kinds) in enumerate(zip(table.data, table.kinds), start=1):
+            for col, (val, kind) in enumerate(zip(row_data, row_kinds), start=1):
+                cell = ws.cell(row=row, column=col, value=val)
+                if kind == TableData.Float:
+                    if pref_num_format is not None:
+                        cell.number_format = pref_num_format
+                        if len(str(abs(math.floor(val)))) > 3:
+                            # Numerical number larger than 3 digits add prefix
+                            cell.number_format = "0,00" + pref_num_format
+                    else:
+                        cell.number_format = '0,00'
+                elif kind == TableData.Percent:
+                    cell.number_format = '0.00%'
+        self.elapsed['write'] += time.perf_counter() - write
+
+    def save(self, ticker, out='.'):
+        start = time.perf_counter()
+        path = os.path.join(out, '{}.xlsx'.format(ticker))
+        self.wb.save(path)
+        self.elapsed['save'] += time.perf_counter() - start
+        return path
+
+
+class ReplayClipboard(Clipboard):
+    """Clipboard of the page sources saved by Clipboard(snapshots=...), without a browser."""
+
+    def __init__(self, snapshots, log=None):
+        with open(os.path.join(snapshots, 'header.txt'), encoding='utf-8') as f:
+            header, sticky_price = f.read().split('\n')[:2]
+        super().__init__(header, sticky_price, log=log)
+        self.path = snapshots
+
+    def select(self, title):
+        pass
+
+    def page_source(self, title) -> str:
+        with open(os.path.join(self.path, snapshot_name(title)), encoding='utf-8') as f:
+            return f.read()
+
+
+def snapshot_name(title):
+    # File of the page source of a table, named as its sheet: income.html, values.html, ...
+    return '{}.html'.format(title.split()[0].lower())
 
-    def save(self, ticker):
-        self.wb.save('{}.xlsx'.format(ticker))
+
+def replay(path, tickers=None, out='spreads', log=None) -> list:
+    # spreads/<tick>.xlsx of the page sources saved in path/<tick>/, all tickers saved unless given.
+    # Returns the ReplayClipboard of each ticker, elapsed holds the time of each stage.
+    if not tickers:
+        tickers = sorted(x for x in os.listdir(path) if os.path.isfile(os.path.join(path, x, 'header.txt')))
+    os.makedirs(out, exist_ok=True)
+    clips = []
+    for tick in tickers:
+        clip = ReplayClipboard(os.path.join(path, tick), log=log)
+        for _, selection, _ in Tabs:
+            clip.run(selection=selection)
+        print("Saved to {}".format(clip.save(tick, out)))
+        clips.append(clip)
+    return clips
 
 
 def run_main():
@@ -324,8 +462,51 @@ def run_main():
         # time.sleep(3600)
 
 
+def run_static(url, tickers):
+    # MainTable of each ticker on a static stand-in of TIKR serving url/<tick>/, such as
+    # scripts/serve_tikr.py, in headless Chrome without logging in
+    global driver, one_time_pass
+    one_time_pass = 0
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    # Wide enough for the year slider of MainTable.open() to be dragged
+    options.add_argument('--window-size=3000,1000')
+    driver = webdriver.Chrome(options=options)
+    try:
+        for tick in tickers:
+            driver.get('{}/{}/'.format(url.rstrip('/'), tick))
+            MainTable(tick).run()
+    finally:
+        driver.quit()
+
+
+def main():
+    global console_log, snapshot_dir
+    parser = argparse.ArgumentParser(description="Spreads of TIKR tables, live in Chrome or replayed offline")
+    parser.add_argument('tickers', nargs='*',
+                        help="tickers to replay, all of the replay directory by default, or to read from --url")
+    parser.add_argument('--replay', metavar='DIR', help="write spreads of the page sources saved in DIR/<tick>/")
+    parser.add_argument('--snapshots', metavar='DIR', help="save the page sources read live to DIR/<tick>/")
+    parser.add_argument('--out', default='spreads', help="directory of the replayed spreads")
+    parser.add_argument('--log', metavar='FILE', help="log the cells of each table read, e.g. console.log")
+    parser.add_argument('--url', help="read the tickers from a static stand-in of TIKR such as "
+                                      "scripts/serve_tikr.py at http://localhost:8000")
+    args = parser.parse_args()
+    console_log = args.log
+    if args.replay is not None:
+        replay(args.replay, args.tickers, args.out, args.log)
+    elif args.url is not None:
+        if len(args.tickers) == 0:
+            parser.error("no tickers given")
+        snapshot_dir = args.snapshots
+        run_static(args.url, args.tickers)
+    else:
+        snapshot_dir = args.snapshots
+        run_main()
+
+
 if __name__ == '__main__':
-    run_main()
+    main()
 
 # Footnotes
 # - Selenium manpage.
@@ -1,17 +1,47 @@
-from openpyxl import Workbook, worksheet
-from functools import partial
+from openpyxl import Workbook, worksheet, load_workbook
+from functools import partial, wraps
+from typing import Union, Optional
+import numpy as np
+import hashlib
+import itertools
 import re
+import os
 import datetime
 
 from utils import strip, strip2, colnum_string
+from series import Series
 
 max_row = max_col = 99
 
+# Match multiple such as n.nnx where n is a digit and x prefix is char
+re_multiple = re.compile(r'[-–]|(?:[,\d]+(?:(\.\d+))?)x$')
+
+# Title pattern without any regex construct other than escapes, anchored at the end such as 'Net Income$'
+re_literal_title = re.compile(r'(?:[^\\.^$*+?{}\[\]|()]|\\[^A-Za-z0-9])*\$')
+
+
+def derived(fn):
+    # Memoize a derived series on the Spread instance, keyed by method name and arguments.
+    # The cached list is shared between callers, copy it before mutating.
+    @wraps(fn)
+    def wrapper(self, *args):
+        key = (fn.__name__,) + args
+        if key in self.derived_cache:
+            self.cache_hits += 1
+            return self.derived_cache[key]
+        self.cache_misses += 1
+        result = self.derived_cache[key] = fn(self, *args)
+        return result
+    return wrapper
+
 
 class Spread:
     Percent_Denominator = 100
 
-    def __init__(self, wb: Workbook, tick: str):
+    # Named input series shared by metrics, name to (input dependencies, function of the Spread).
+    Inputs = {}
+
+    def __init__(self, wb: Union[Workbook, 'SpreadCache'], tick: str):
         self.tick = tick
         self.tabs = []
         self.income = None
@@ -21,19 +51,24 @@ class Spread:
         self.estimates = None
         self.head = None
 
+        # Per ticker intermediates, see derived()
+        self.derived_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
         prefix_index = 1
         self.start_prefix = prefix_index
         self.strip = partial(strip, prefix=prefix_index)
         self.strip2 = partial(strip2, prefix=prefix_index)
 
-        for index, name in enumerate(wb.sheetnames):
-            if name == 'Header':
-                ws = wb[name]
-                self.head = ws['A1'].value
-                self.sticky_price = ws['A2'].value
-                continue
+        # Rebuild the tables from the parsed cache, openpyxl workbook is only walked on a cache miss.
+        book = wb if isinstance(wb, SpreadCache) else SpreadCache.from_workbook(wb)
+        if book.has_header:
+            self.head = book.head
+            self.sticky_price = book.sticky_price
 
-            tab = Table(wb[name])
+        for name, rows, date_range in book.tables:
+            tab = Table.from_rows(rows, date_range)
             self.tabs.append(tab)
             if re.match(r'Income', name):
                 self.income = tab
@@ -83,6 +118,21 @@ class Spread:
         result = list(filter(None, reversed(x[self.start_prefix:])))[0]
         return result
 
+    def cache_info(self):
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.derived_cache)}
+
+    @derived
+    def row(self, tab, title, optional=False, flags=0) -> Optional[list]:
+        # Stripped row of the 'income', 'balance', 'cashflow', 'values' or 'estimates' table.
+        result = getattr(self, tab).match_title(title, none_is_optional=optional, flags=flags)
+        return None if result is None else self.strip(result)
+
+    @derived
+    def input(self, name):
+        _, fn = self.Inputs[name]
+        return fn(self)
+
+    @derived
     def wa_diluted_shares_out(self) -> [float]:
         shares_out = self.strip(self.income.match_title('Weighted Average Diluted Shares Outstanding'))
 
@@ -91,10 +141,136 @@ class Spread:
         result = list(map(lambda x: x if x is not None else last_item, shares_out))
         return result
 
+    @derived
+    def revenue_per_share(self) -> Series:
+        return Series(self.row('income', 'Total Revenues$')).over(self.wa_diluted_shares_out())
+
+    @derived
+    def levered_fcf(self) -> Series:
+        # also known as Levered FCF, otherwise CFO after acquisition of real estate assets for REITs.
+        fcf = self.row('cashflow', 'Free Cash Flow$', True)
+        if fcf is not None:
+            return Series(fcf)
+
+        cfo = Series(self.row('cashflow', 'Cash from Operations$'))
+        opt_acq_real_assets = self.cashflow.match_title('Acquisition of Real Estate Assets$',
+                                                        none_is_optional=True)
+        fcf = cfo
+        if opt_acq_real_assets is not None:
+            acq_real_assets = self.strip(opt_acq_real_assets)
+            fcf = cfo + acq_real_assets
+        return fcf
+
+    @derived
+    def fcf_per_share(self) -> Series:
+        return self.levered_fcf().over(self.wa_diluted_shares_out())
+
+    @derived
+    def fiscal_year_ends(self) -> np.ndarray:
+        # Year end dates of the stripped Income columns, NaT for LTM.
+        return to_datetime64(self.strip(self.income.tab[0]))
+
+    @derived
+    def quarter_ends(self) -> np.ndarray:
+        # Dates of the stripped Values columns, NaT for a column without date.
+        return to_datetime64(self.strip(self.values.tab[0]))
+
+    @derived
+    def fiscal_quarters(self) -> np.ndarray:
+        # Income column of each Values quarter, -1 when it falls outside of the sampled years.
+        # A fiscal year holds the quarters after the previous year end up to its own year end.
+        # Quarters after the last year end go to LTM, the first year spans the length of the second.
+        ends = self.fiscal_year_ends()
+        closed = ends[~np.isnat(ends)]
+        quarters = self.quarter_ends()
+        index = np.searchsorted(closed, quarters, side='left')
+        if len(closed) > 1:
+            first = closed[0] - (closed[1] - closed[0])
+        else:
+            first = closed[0] - np.timedelta64(365, 'D')
+        outside = np.isnat(quarters) | (quarters <= first) | (index >= len(ends))
+        index[outside] = -1
+        return index
+
+    @derived
+    def annual(self, title) -> Series:
+        # Quarterly Values row averaged over the fiscal years of Income, see fiscal_quarters().
+        # Aligned with the stripped Income rows such as wa_diluted_shares_out(), a partial year is
+        # averaged over its available quarters and a year without any quarter is missing.
+        quarterly = Series(self.row('values', title)).values
+        index = self.fiscal_quarters()[:len(quarterly)]
+        present = (index >= 0) & ~np.isnan(quarterly)
+        years = len(self.fiscal_year_ends())
+        total = np.bincount(index[present], weights=quarterly[present], minlength=years)
+        count = np.bincount(index[present], minlength=years)
+        with np.errstate(invalid='ignore'):
+            return Series(np.where(count > 0, total / count, np.nan))
+
+
+def to_datetime64(dates) -> np.ndarray:
+    # TIKR header cells such as '12/28/13', '3/31/2024' or datetime, NaT for LTM and empty cells.
+    result = []
+    for x in dates:
+        if type(x) is datetime.datetime:
+            x = x.date()
+        elif type(x) is str and re.match(r'\d+/\d+/\d+$', x):
+            m, d, y = map(int, x.split('/'))
+            x = datetime.date(y + 2000 if y < 100 else y, m, d)
+        else:
+            x = None
+        result.append(np.datetime64(x, 'D') if x is not None else np.datetime64('NaT', 'D'))
+    return np.array(result, dtype='datetime64[D]')
+
 
 class Table:
     col_limit = 0
 
+    @classmethod
+    def from_rows(cls, rows, date_range):
+        # Table built from rows that have been parsed ahead, e.g. by SpreadCache.
+        self = cls.__new__(cls)
+        self.date_range = date_range
+        self.tab = rows
+        self.build_index()
+        return self
+
+    @classmethod
+    def from_iter_rows(cls, rows):
+        # Single pass over ws.iter_rows(values_only=True), meant for read-only workbooks where
+        # the per cell coordinate lookup in __init__ is expensive.
+        rows = iter(rows)
+        header = next(rows, ())
+        date_range = []
+        col_limit = Table.col_limit
+        for j in range(2, max_col):
+            value = header[j-1] if j-1 < len(header) else None
+            if type(value) is datetime.datetime:
+                date_range.append('{}/{}/{}'.format(value.month, value.day, value.year))
+            else:
+                date_range.append(value)
+
+            if type(date_range[-1]) is not str:
+                # Header ends on the first empty cell
+                col_limit = j if value is None else j+1
+                break
+            if re.match(r'LTM$', date_range[-1]):
+                col_limit = j + 1
+                break
+        Table.col_limit = col_limit
+
+        width = col_limit - 1
+        tab = []
+        for r in itertools.chain((header,), rows):
+            r = list(r[:width])
+            if len(r) < width:
+                r.extend([None] * (width-len(r)))
+            for j, a in enumerate(r):
+                if type(a) is str and re_multiple.match(a):
+                    a = a.replace(',', '')
+                    r[j] = float(a.replace('x', ''))
+            tab.append(r)
+        return cls.from_rows(tab, date_range)
+
     def __init__(self, sheet_ranges: worksheet):
         self.date_range = []
         last_limit = 0
@@ -127,22 +303,240 @@ class Table:
                 c1 = "{}{}".format(colnum_string(j), i)
                 a = sheet_ranges[c1].value
                 if type(sheet_ranges[c1].value) is str:
-                    if re.match(r'[-–]|(?:[,\d]+(?:(\.\d+))?)x$', a):
-                        # Match multiple such as n.nnx where n is a digit and x prefix is char
+                    if re_multiple.match(a):
                         a = a.replace(',', '')
                         a = float(a.replace('x', ''))
                 r.append(a)
             self.tab.append(r)
+        self.build_index()
+
+    def build_index(self):
+        # Row index by exact title and by lower case title, first row wins as in a top down scan.
+        self.exact_title = {}
+        self.normalized_title = {}
+        for i, r in enumerate(self.tab):
+            if type(r[0]) is str:
+                title = r[0].strip()
+                self.exact_title.setdefault(title, i)
+                self.normalized_title.setdefault(title.lower(), i)
+        # Memoized (pattern, flags) to row index, None when nothing matched.
+        self.matched_title = {}
+
+    def find_title(self, reg, flags=0) -> Optional[int]:
+        key = reg, flags
+        if key in self.matched_title:
+            return self.matched_title[key]
+
+        index = None
+        if type(reg) is str and flags in (0, re.IGNORECASE) and re_literal_title.fullmatch(reg):
+            # Literal title followed by $ is an exact match, no need to scan with regex.
+            title = re.sub(r'\\(.)', r'\1', reg[:-1])
+            if flags == 0:
+                index = self.exact_title.get(title)
+            else:
+                index = self.normalized_title.get(title.lower())
+        else:
+            for i, _ in enumerate(self.tab):
+                if _[0] is not None and re.match(reg, _[0].strip(), flags):
+                    index = i
+                    break
+        self.matched_title[key] = index
+        return index
 
     def match_title(self, reg, none_is_optional=False, flags=0):
-        result = None
-        for _ in self.tab:
-            if _[0] is not None and re.match(reg, _[0].strip(), flags):
-                result = _
-                break
+        index = self.find_title(reg, flags)
+        result = None if index is None else self.tab[index]
         if not none_is_optional:
             assert result is not None
         return result
 
     def remove(self, offset):
         self.tab = [row[:offset] for row in self.tab]
+
+
+class SpreadCache:
+    """Parsed TIKR workbook stored as a .npz sidecar next to the spreadsheet.
+
+    Each tab keeps its rows (title column followed by the values) and date_range. Cells are
+    encoded into a kind code, float64 and text matrix so that the cache loads without pickle.
+    The sidecar is keyed by the source mtime and sha1.
+    """
+    version = '1'
+    suffix = '.npz'
+
+    # Cell kinds
+    Empty, Float, Int, Text, Date = range(5)
+
+    def __init__(self, head=None, sticky_price=None, has_header=False, tables=None):
+        self.head = head
+        self.sticky_price = sticky_price
+        self.has_header = has_header
+        # List of (sheet name, rows, date_range)
+        self.tables = tables if tables is not None else []
+
+    @classmethod
+    def from_workbook(cls, wb: Workbook, stream=False):
+        # stream: walk each sheet once with iter_rows, expected a workbook opened in read-only mode
+        cache = cls()
+        for name in wb.sheetnames:
+            if name == 'Header':
+                ws = wb[name]
+                cache.head = ws['A1'].value
+                cache.sticky_price = ws['A2'].value
+                cache.has_header = True
+                continue
+
+            if stream:
+                tab = Table.from_iter_rows(wb[name].iter_rows(values_only=True))
+            else:
+                tab = Table(wb[name])
+            cache.tables.append((name, tab.tab, tab.date_range))
+        return cache
+
+    @staticmethod
+    def fingerprint(path):
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    @classmethod
+    def sidecar(cls, path):
+        return path + cls.suffix
+
+    @classmethod
+    def encode(cls, values):
+        # values: list of cells, or rectangular list of rows
+        matrix = len(values) > 0 and type(values[0]) is list
+        cells = [c for r in values for c in r] if matrix else values
+        kinds = np.zeros(len(cells), dtype=np.int8)
+        nums = np.full(len(cells), np.nan)
+        text = [''] * len(cells)
+        for i, v in enumerate(cells):
+            if v is None:
+                continue
+            if type(v) is float:
+                kinds[i], nums[i] = cls.Float, v
+            elif type(v) is int:
+                kinds[i], nums[i] = cls.Int, v
+            elif type(v) is str:
+                kinds[i], text[i] = cls.Text, v
+            elif type(v) is datetime.datetime:
+                kinds[i], text[i] = cls.Date, v.isoformat()
+            else:
+                assert False, 'Unsupported cell type {}'.format(type(v))
+        text = np.array(text, dtype=str)
+        if matrix:
+            shape = (len(values), len(values[0]))
+            return kinds.reshape(shape), nums.reshape(shape), text.reshape(shape)
+        return kinds, nums, text
+
+    @classmethod
+    def decode(cls, kinds, nums, text):
+        def cell(k, n, t):
+            if k == cls.Float:
+                return float(n)
+            elif k == cls.Int:
+                return int(n)
+            elif k == cls.Text:
+                return str(t)
+            elif k == cls.Date:
+                return datetime.datetime.fromisoformat(t)
+            return None
+
+        if kinds.ndim == 1:
+            return [cell(k, n, t) for k, n, t in zip(kinds, nums, text)]
+        return [[cell(k, n, t) for k, n, t in zip(*r)] for r in zip(kinds, nums, text)]
+
+    def save(self, path, mtime, sha1):
+        arrays = {'meta': np.array([self.version, sha1]),
+                  'mtime': np.array([mtime]),
+                  'names': np.array([name for name, _, _ in self.tables], dtype=str)}
+        header = [self.head, self.sticky_price] if self.has_header else []
+        arrays['head_kinds'], arrays['head_nums'], arrays['head_text'] = self.encode(header)
+        for i, (name, rows, date_range) in enumerate(self.tables):
+            for key, a in zip(('kinds', 'nums', 'text'), self.encode(rows)):
+                arrays['{}{}'.format(key, i)] = a
+            for key, a in zip(('date_kinds', 'date_nums', 'date_text'), self.encode(date_range)):
+                arrays['{}{}'.format(key, i)] = a
+        # np.savez would append .npz to a name without it, write through a file handle.
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            header = cls.decode(z['head_kinds'], z['head_nums'], z['head_text'])
+            cache = cls(has_header=len(header) > 0)
+            if cache.has_header:
+                cache.head, cache.sticky_price = header
+            for i, name in enumerate(z['names']):
+                rows = cls.decode(z['kinds{}'.format(i)], z['nums{}'.format(i)], z['text{}'.format(i)])
+                date_range = cls.decode(z['date_kinds{}'.format(i)], z['date_nums{}'.format(i)],
+                                        z['date_text{}'.format(i)])
+                cache.tables.append((str(name), rows, date_range))
+        return cache
+
+    @classmethod
+    def is_valid(cls, path, sidecar):
+        if not os.path.isfile(sidecar):
+            return False
+        try:
+            with np.load(sidecar, allow_pickle=False) as z:
+                version, sha1 = z['meta']
+                mtime = z['mtime'][0]
+        except (OSError, ValueError, KeyError):
+            return False
+        if version != cls.version:
+            return False
+        current = os.stat(path).st_mtime
+        if mtime == current:
+            return True
+        # Touching the file without any change is settled by the hash, once: the sidecar then
+        # records the new mtime.
+        if sha1 != cls.fingerprint(path):
+            return False
+        cls.touch(sidecar, current)
+        return True
+
+    @staticmethod
+    def touch(sidecar, mtime):
+        # Rewrite the mtime of a sidecar whose source is unchanged
+        try:
+            with np.load(sidecar, allow_pickle=False) as z:
+                arrays = {k: z[k] for k in z.files}
+            arrays['mtime'] = np.array([mtime])
+            tmp = sidecar + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, sidecar)
+        except OSError as e:
+            print("Warning: unable to write spread cache '{}': {}".format(sidecar, e))
+
+
+def read_spread(path: str, stream=True) -> SpreadCache:
+    # stream: open read-only and consume iter_rows in one pass, otherwise the per cell lookup in Table
+    if not stream:
+        return SpreadCache.from_workbook(load_workbook(path))
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        return SpreadCache.from_workbook(wb, stream=True)
+    finally:
+        # Read-only workbook holds the file handle open until closed.
+        wb.close()
+
+
+def load_spread(path: str, use_cache=True, stream=True) -> Union[Workbook, SpreadCache]:
+    # Load spreads/<tick>.xlsx through its .npz sidecar, rebuilding the sidecar when the source changed.
+    if not use_cache:
+        return read_spread(path) if stream else load_workbook(path)
+
+    sidecar = SpreadCache.sidecar(path)
+    if SpreadCache.is_valid(path, sidecar):
+        return SpreadCache.load(sidecar)
+
+    cache = read_spread(path, stream=stream)
+    try:
+        cache.save(sidecar, os.stat(path).st_mtime, SpreadCache.fingerprint(path))
+    except OSError as e:
+        print("Warning: unable to write spread cache '{}': {}".format(sidecar, e))
+    return cache
@@ -3,9 +3,10 @@ from bs4 import BeautifulSoup
 import bs4.element
 from typing import Optional, List, Dict, Generator, Callable, Tuple
 import re
+import io
+from lxml import etree
 
-from collections import namedtuple
-from uuid import uuid1
+from collections import OrderedDict, namedtuple
 import bootstrap
 
 
@@ -14,30 +15,110 @@ DivParcel = namedtuple('DivParcel',
                        ' multiline_factor contents text')
 
 
+re_thousands = re.compile(r',')
+re_parenthesis = re.compile(r'\(\s*([.\d]+)\s*\)?')
+re_percent_sign = re.compile(r'%$')
+
+
 def fix_currency(value):
     if value in ('-', '–'):
         return "NA"
 
-    val = re.sub(r',', '', value)
+    val = value.replace(',', '')
 
     # optional close parenthesis
-    m = re.match(r'\(\s*([.\d]+)\s*\)?', val)
+    m = re_parenthesis.match(val)
     if m is not None:
         val = "-" + m.group(1)
 
-    if re.search(r'\.', val):
+    if '.' in val:
         return float(val)
     return int(val)
 
 
 def fix_percent(value: str):
-    val = re.sub(r'%$', '', value)
-    val = re.sub(r'%$', '', val)
+    val = re_percent_sign.sub('', value)
+    val = re_percent_sign.sub('', val)
     val = fix_currency(val)
     # 100 fix the denominator
     return val/100
 
 
+# The cell forms of TIKR tables parse_cell() reads without Page.re_numerical, Page.re_percent and
+# fix_*(), each matched whole: amounts such as 1,234.5 or -12, negatives in parentheses such as
+# (1,234.5) and percents such as 12.5% or -3%
+re_amount = re.compile(r'-?[0-9][0-9,]*(?:\.[0-9]+)?')
+re_negative = re.compile(r'\(\s*([0-9][0-9,]*(?:\.[0-9]+)?)\s*\)')
+re_percent_cell = re.compile(r'-?[0-9]+(?:,[0-9]{1,3})*(?:\.[0-9]+)?%')
+# First characters of the cells Page.re_numerical or Page.re_percent match, the others are text
+number_starts = frozenset('-–(0123456789')
+
+
+def parse_cell(text: str) -> Tuple[object, int]:
+    # Value and TableData kind of the text of a cell, as Page.re_numerical then fix_currency() and,
+    # for the text left, Page.re_percent then fix_percent() would give it. Numbers are Integer or
+    # Float, '12.5%' is Percent 0.125 and a dash is Text "NA". The common forms take one match.
+    if not text or text[0] not in number_starts:
+        return text, TableData.Text
+    last = text[-1]
+    if last == '%':
+        if re_percent_cell.fullmatch(text) is not None:
+            val = text[:-1].replace(',', '')
+            return (float(val) if '.' in val else int(val)) / 100, TableData.Percent
+    elif last == ')':
+        m = re_negative.fullmatch(text)
+        if m is not None:
+            val = '-' + m.group(1).replace(',', '')
+            if '.' in val:
+                return float(val), TableData.Float
+            return int(val), TableData.Integer
+    elif last.isalpha():
+        # Multiples such as 8.17x, neither int() nor float() read a number ending in a letter
+        # and only a leading parenthesis makes fix_currency() read a part of the text
+        if text[0] != '(':
+            return text, TableData.Text
+    elif text in ('-', '–'):
+        return "NA", TableData.Text
+    elif re_amount.fullmatch(text) is not None:
+        val = text.replace(',', '')
+        if '.' in val:
+            return float(val), TableData.Float
+        return int(val), TableData.Integer
+    return parse_cell_slow(text)
+
+
+def parse_cell_slow(text: str) -> Tuple[object, int]:
+    # The regular expressions and fix_*() of parse_cell() for the rare forms it leaves out,
+    # such as '(5.2%)' that fix_currency() reads as -5.2 or '1.5e3'
+    val = text
+    if Page.re_numerical.match(text):
+        try:
+            val = fix_currency(text)
+        except ValueError:
+            pass
+    if type(val) is float:
+        return val, TableData.Float
+    if type(val) is int:
+        return val, TableData.Integer
+    if Page.re_percent.match(val):
+        try:
+            return fix_percent(val), TableData.Percent
+        except (ValueError, TypeError):
+            pass
+    return val, TableData.Text
+
+
+def parse_cells(texts) -> Tuple[list, list]:
+    # parse_cell() of a row or a column of cell texts, returns the values and their kinds
+    values = []
+    kinds = []
+    for text in texts:
+        val, kind = parse_cell(text)
+        values.append(val)
+        kinds.append(kind)
+    return values, kinds
+
+
 class Dim:
     def __init__(self, rsc_val: str):
         val: str
@@ -200,16 +281,9 @@ class Page:
                         text = x.text.strip()
                         text = re.sub(r'\n', ' ', text)
 
-                        if re.match(Page.re_numerical, text):
-                            try:
-                                sup_line_block.write(index, fix_currency(text))
-                            except ValueError:
-                                sup_line_block.write(index, text)
-
-                        elif re.match(Page.re_text, text):
-                            sup_line_block.write(index, text)
-                        else:
-                            sup_line_block.write(index, text)
+                        # fix_currency() of the numbers, percents are left as text
+                        val, kind = parse_cell(text)
+                        sup_line_block.write(index, text if kind == TableData.Percent else val)
 
                         index += 1
                         # else:
@@ -247,82 +321,281 @@ class Page:
         return result
 
 
-class StyleParser:
-    def __init__(self, gen: Generator):
-        self.generator = gen
-        self.hash = {}
-        self.stack = []     # List[str]
+class TableData:
+    """
+    Rows of one <table> as Page.data would hold them, with percent cells such as '12.5%' already
+    divided by 100 as Clipboard.write_excel did. kinds holds the kind of every cell, row by row.
+    """
+    Text, Integer, Float, Percent = range(4)
+
+    def __init__(self):
+        self.data = []
+        self.kinds = []
+        # Number of thead rows at the start of data
+        self.header_rows = 0
+
+    def columns(self, start=None) -> List[list]:
+        # Cells by column from row start, the first body row by default, None where a row is short
+        start = self.header_rows if start is None else start
+        rows = self.data[start:]
+        width = max((len(r) for r in rows), default=0)
+        return [[r[j] if j < len(r) else None for r in rows] for j in range(width)]
+
+
+class TableExtractor:
+    """
+    Single pass of lxml.etree.iterparse over an HTML page into TableData, in place of BeautifulSoup
+    and Page.parse_top(). As with Page on a <table>, thead rows keep the text of their th cells and
+    tbody rows, or rows directly under the table, convert their td cells with fix_currency().
+    Tables nested in a cell are part of its text. Each cell is written to log as Page did to
+    bootstrap.Out when log is given.
+    """
+    tags = ('table', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td')
+    # Left out of the text of a cell, as BeautifulSoup's .text does
+    hidden = ('script', 'style')
+
+    def __init__(self, log=None):
+        self.log = log
+
+    def extract(self, html, first=True) -> List[TableData]:
+        # html: page source as str or bytes. Stops after the first top level table unless first is False.
+        if type(html) is str:
+            html = html.encode('utf-8')
+        tables = []
+        table = row = kinds = section = None
+        depth = 0
+        for event, el in etree.iterparse(io.BytesIO(html), events=('start', 'end'), tag=self.tags,
+                                         html=True, encoding='utf-8'):
+            tag = el.tag
+            if tag == 'table':
+                if event == 'start':
+                    depth += 1
+                    if depth == 1:
+                        table = TableData()
+                        tables.append(table)
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        el.clear()
+                        if first:
+                            break
+            elif depth != 1:
+                # Outside of a table or inside a nested one
+                continue
+            elif tag == 'tr':
+                if event == 'start':
+                    row, kinds = [], []
+                else:
+                    if section == 'thead':
+                        if len(row) > 0:
+                            table.data.append(row)
+                            table.kinds.append(kinds)
+                            table.header_rows += 1
+                    elif section != 'tfoot':
+                        table.data.append(row)
+                        table.kinds.append(kinds)
+                        if self.log is not None and len(row) > 0:
+                            self.log.write('\n')
+                    el.clear()
+                    row = None
+            elif tag in ('td', 'th'):
+                if event == 'end' and row is not None:
+                    if section == 'thead':
+                        if tag == 'th':
+                            self.add(row, kinds, cell_text(el).strip(), convert=False)
+                    elif tag == 'td':
+                        self.add(row, kinds, cell_text(el).strip().replace('\n', ' '))
+            elif event == 'start':
+                section = tag
+            else:
+                section = None
+        return tables
+
+    def add(self, row, kinds, text, convert=True):
+        # Page.parse_td() then Clipboard.write_excel() on the text of a cell
+        if convert:
+            val, kind = parse_cell(text)
+            if self.log is not None:
+                # Page logs fix_currency() values, percents are still text at that point
+                self.log.write("{}|{}|".format(len(row), text if kind == TableData.Percent else val))
+        else:
+            val, kind = text, TableData.Text
+            if Page.re_percent.match(text):
+                try:
+                    val = fix_percent(text)
+                    kind = TableData.Percent
+                except (ValueError, TypeError):
+                    pass
+        row.append(val)
+        kinds.append(kind)
 
-    def compile_class(self, cls_name: str) -> Optional[Dict[str, str]]:
-        if cls_name[0] != ".":
-            cls_name = "." + cls_name
 
-        if (cls_name, 'str') in self.hash:
-            return self._compile(cls_name)
+def cell_text(el) -> str:
+    # Text of el and its descendants without comments, <script> and <style>
+    if len(el) == 0:
+        return el.text or ''
+    parts = [el.text or '']
+    for x in el.iterdescendants():
+        if type(x.tag) is str and x.tag not in TableExtractor.hidden:
+            parts.append(x.text or '')
+        parts.append(x.tail or '')
+    return ''.join(parts)
 
-        result = None
-        while True:
-            sp, block = next(self.generator)
 
-            sp1 = sp.span(1)
-            cls_current = block[sp1[0]:sp1[1]]
+def extract_tables(html, first=True, log=None) -> List[TableData]:
+    return TableExtractor(log).extract(html, first)
 
-            sp2 = sp.span(2)
-            self.hash[cls_current, 'str'] = block[sp2[0]:sp2[1]]
 
-            if cls_name == cls_current and (cls_current, 'str') in self.hash:
-                result = self.compile_class(cls_name)
+class StyleParser:
+    """
+    Index of a stylesheet by normalized selector, such as '.v-data-table td' or '#app .header':
+        rules[selector] -> declarations 'height: 24px; margin: 0px 4px 0px 4px'
+    Stylesheets given to load() are parsed whole. gen is the older source of rules, the
+    (match, block) of 'selector { declarations }' with the selector in group 1 and the
+    declarations in group 2, read only as far as a lookup needs. Declarations are compiled once
+    per selector, inline styles once per string in a bounded LRU.
+    """
+    re_comment = re.compile(r'/\*.*?\*/', re.DOTALL)
+    re_rule = re.compile(r'([^{}]+)\{([^{}]*)\}')
+    re_declaration = re.compile(r'([-–\w]+)\s*:\s*(.+)$', re.DOTALL)
+    # Values of the properties read as Dim, Margins or Props by style_value()
+    dims = ('width', 'height', 'min-width', 'min-height', 'max-width', 'max-height', 'line-height',
+            'font-size', 'padding-top', 'padding-bottom', 'margin-top', 'margin-bottom')
+    margins = ('margin', 'padding')
+    borders = ('border', 'border-top', 'border-right', 'border-bottom', 'border-left')
+
+    def __init__(self, gen: Optional[Generator] = None, css: Optional[str] = None, inline_size=256):
+        self.generator = gen
+        self.rules = {}     # Dict[str, str]
+        self.compiled = {}  # Dict[str, Dict[str, str]]
+        # Inline style to its declarations, least recently used first
+        self.inline = OrderedDict()
+        self.inline_size = inline_size
+        # Resolved styles of (classes, id context)
+        self.resolved = {}
+        # Dim, Margins and Props of (property, value)
+        self.values = {}
+        self.stack = []     # List[Optional[str]]
+        if css is not None:
+            self.load(css)
+
+    @staticmethod
+    def normalize(selector: str) -> str:
+        return ' '.join(selector.split())
+
+    def load(self, css: str):
+        # Rules of a whole stylesheet, a later rule of a selector adds to and overrides the earlier
+        css = self.re_comment.sub('', css)
+        for m in self.re_rule.finditer(css):
+            for selector in m.group(1).split(','):
+                self.add_rule(selector, m.group(2))
+
+    def add_rule(self, selector: str, declarations: str):
+        selector = self.normalize(selector)
+        if selector == '':
+            return
+        if selector in self.rules:
+            declarations = self.rules[selector] + ';' + declarations
+        self.rules[selector] = declarations
+        self.compiled.pop(selector, None)
+        self.resolved.clear()
+
+    def rule(self, selector: str) -> Optional[str]:
+        # Declarations of a normalized selector, reading gen on until it is found
+        while selector not in self.rules and self.generator is not None:
+            try:
+                sp, block = next(self.generator)
+            except StopIteration:
+                self.generator = None
                 break
-        return result
+            self.add_rule(block[slice(*sp.span(1))], block[slice(*sp.span(2))])
+        return self.rules.get(selector)
+
+    def compile_class(self, cls_name: str) -> Optional[Dict[str, str]]:
+        if cls_name[0] != ".":
+            cls_name = "." + cls_name
+        return self._compile(cls_name)
 
     def push_null(self):
-        self.stack.append('null')
+        # Element without an id, keeps push and pop balanced
+        self.stack.append(None)
 
-    def push_id_selector(self, id_selector: str):
+    def push_id_selector(self, id_selector: str) -> Optional[Dict[str, str]]:
         self.stack.append('#' + id_selector)
-        id_selector_cxt = ' '.join(self.stack[0:])
-        if (id_selector_cxt, 'str') in self.hash:
-            return self._compile(id_selector_cxt)
-
-        while True:
-            sp, block = next(self.generator)
-
-            sp1 = sp.span(1)
-            _ = block[sp1[0]:sp1[1]]  # type: str
-            current_cxt = re.sub(r'\s+', ' ', _)
-
-            sp2 = sp.span(2)
-            self.hash[current_cxt, 'str'] = block[sp2[0]:sp2[1]]
-
-            if (id_selector_cxt, 'str') in self.hash:
-                result = self._compile(id_selector_cxt)
-                break
-        return result
+        return self._compile(self.context())
 
     def push_inplace(self, style_str: str) -> Dict[str, str]:
-        key = 'inplace-{}'.format(str(uuid1()))
-        self.stack.append('#' + key)
-        self.hash[key, 'str'] = style_str
-        return self.hash[key, 'str']
+        self.stack.append(None)
+        return self.compile_inline(style_str)
 
     def pop_id_selector(self):
         self.stack.pop()
 
-    def _compile(self, cls_name) -> Dict[str, str]:
-        if (cls_name, 'compiled') not in self.hash:
-            self.hash[cls_name, 'compiled'] = self.compile_string(self.hash[cls_name, 'str'])
-        else:
-            # print("memoized", cls_name)
-            pass
-        return self.hash[cls_name, 'compiled']
+    def context(self) -> str:
+        # Descendant selector of the ids pushed, such as '#app #header'
+        return ' '.join(x for x in self.stack if x is not None)
+
+    def _compile(self, selector) -> Optional[Dict[str, str]]:
+        compiled = self.compiled.get(selector)
+        if compiled is None:
+            string = self.rule(selector)
+            if string is None:
+                return None
+            compiled = self.compiled[selector] = self.compile_string(string)
+        return compiled
+
+    def compile_inline(self, style_str: str) -> Dict[str, str]:
+        compiled = self.inline.get(style_str)
+        if compiled is not None:
+            self.inline.move_to_end(style_str)
+            return compiled
+        compiled = self.inline[style_str] = self.compile_string(style_str)
+        if len(self.inline) > self.inline_size:
+            self.inline.popitem(last=False)
+        return compiled
 
     def compile_string(self, string: str) -> Dict[str, str]:
         result = {}
         for x in string.split(';'):
-            if x != '':
-                m = re.match(r'([-–\w]+)\s*:\s*(.+)$', x)
-                if m is not None:
-                    # print(m.group(1), m.group(2))
-                    result[m.group(1)] = m.group(2)
-        # print(result)
+            m = self.re_declaration.match(x.strip())
+            if m is not None:
+                result[m.group(1)] = m.group(2)
         return result
+
+    def resolve(self, classes=(), id_selector: Optional[str] = None,
+                inline: Optional[str] = None) -> Dict[str, str]:
+        # Style of an element: its classes in order, then its id in the context of the ids pushed,
+        # then its inline style. Do not change the dict returned, it is shared.
+        key = tuple(classes), id_selector and ' '.join(filter(None, (self.context(), '#' + id_selector)))
+        style = self.resolved.get(key)
+        if style is None:
+            style = {}
+            for cls_name in key[0]:
+                style.update(self.compile_class(cls_name) or {})
+            if key[1]:
+                style.update(self._compile(key[1]) or {})
+            self.resolved[key] = style
+        if inline:
+            style = dict(style, **self.compile_inline(inline))
+        return style
+
+    def style_value(self, style: Dict[str, str], prop: str):
+        # A property of a resolved style as Dim, Margins or Props for the layout code, parsed once
+        # per value. Values they do not read, such as 'auto', stay text. None when not set.
+        val = style.get(prop)
+        if val is None:
+            return None
+        key = prop, val
+        if key not in self.values:
+            parsed = val
+            try:
+                if prop in self.dims:
+                    parsed = Dim(val.strip())
+                elif prop in self.margins:
+                    parsed = Margins(val)
+                elif prop in self.borders:
+                    parsed = Props(val)
+            except (AssertionError, ValueError):
+                pass
+            self.values[key] = parsed
+        return self.values[key]
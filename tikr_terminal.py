@@ -1,5 +1,6 @@
 from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Font, Alignment
+from openpyxl.styles import Font, Alignment, NamedStyle
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.worksheet import worksheet
 # from openpyxl.styles.differential import DifferentialStyle
 from openpyxl.formatting.rule import ColorScaleRule, CellIsRule, FormulaRule
@@ -7,6 +8,9 @@ from typing import List, Tuple, Dict, Union
 from collections import OrderedDict, namedtuple
 from enum import Enum
 import re
+import os
+import copy
+import json
 import decimal
 import statistics
 import datetime
@@ -14,6 +18,7 @@ from functools import partial
 import math
 from bcolors import bcolors, colour_print
 from spread import Table, Spread
+from series import Series
 from utils import *
 
 max_row = max_col = 99
@@ -27,19 +32,126 @@ RateVerbose = {RateType.above_avg: 'above',
                # TODO "do not perform" below level
                RateType.below_avg: 'below'}
 
+RateName = {getattr(RateType, x): x for x in RateType._fields}
+
+# Metric registry of SpreadX, metric name to its input series and the Tag names it collects.
+Metric = namedtuple('Metric', ['name', 'inputs', 'tags'])
+Metrics = OrderedDict()
+
+# Metrics screened by main.py unless selected otherwise.
+DefaultMetrics = ['revenue', 'op_yield', 'owner_yield', 'return_invested_cap', 'net_debt_over_ebit',
+                  'ev_over_ebit', 'div_yield', 'last_price']
+
+
+def metric(*inputs, tags=()):
+    def register(fn):
+        Metrics[fn.__name__] = Metric(fn.__name__, inputs, tags)
+        return fn
+    return register
+
+
+def row(tab, title, optional=False):
+    # Input of a stripped table row, see Spread.row()
+    return (), lambda sp: sp.row(tab, title, optional)
+
+
+def values_row(title, optional=False, multiple=False):
+    # Input of a stripped Values row, None without the Values tab for the metrics to warn on.
+    # multiple: cells such as '12.3x' read as numbers, see strip2()
+    def fn(sp):
+        if sp.values is None:
+            return None
+        result = sp.values.match_title(title, none_is_optional=optional)
+        if result is None:
+            return None
+        return sp.strip2(result) if multiple else sp.strip(result)
+    return (), fn
+
+
+def schedule(names: List[str]) -> Tuple[List[str], List[str]]:
+    # Inputs of the selected metrics in dependency order, each once, and the metrics in registry order.
+    for name in names:
+        if name not in Metrics:
+            raise ValueError("Unknown metric '{}', available metrics are: {}".format(
+                name, ', '.join(Metrics)))
+    metrics = [m for m in Metrics if m in names]
+
+    order = []
+    state = {}
+
+    def visit(n):
+        if state.get(n) == 'done':
+            return
+        assert state.get(n) != 'visiting', "Cyclic input '{}'".format(n)
+        state[n] = 'visiting'
+        for dep in SpreadX.Inputs[n][0]:
+            visit(dep)
+        state[n] = 'done'
+        order.append(n)
+
+    for m in metrics:
+        for n in Metrics[m].inputs:
+            visit(n)
+    return order, metrics
+
 
 class SpreadX(Spread):
     Percent_Denominator = 100
 
+    Inputs = {
+        'shares_out': ((), Spread.wa_diluted_shares_out),
+        'revenue': row('income', 'Total Revenues$'),
+        'revenue_per_share': (('revenue', 'shares_out'), Spread.revenue_per_share),
+        'op_income': row('income', 'Operating Income$'),
+        'ebt_excl_unusual': row('income', r'EBT Excl\. Unusual Items$'),
+        'net_income': row('income', 'Net Income$'),
+        'net_income_to_company': row('income', 'Net Income to Company$'),
+        'tax_expense': row('income', 'Income Tax Expense$', True),
+        'interest_expense': row('income', 'Interest Expense$'),
+        'dpu': ((), lambda sp: sp.row('income', 'Dividends Per Share', True, re.IGNORECASE)),
+        'total_assets': row('balance', 'Total Assets$'),
+        'total_liabilities': row('balance', 'Total Liabilities$'),
+        'total_equity': row('balance', 'Total Equity$'),
+        'common_equity': row('balance', 'Total Common Equity$'),
+        'goodwill': row('balance', 'Goodwill$', True),
+        'other_intangibles': row('balance', 'Other Intangibles$', True),
+        'total_debt': row('balance', 'Total Debt$'),
+        'net_debt': row('balance', 'Net Debt$'),
+        'retained_earnings': row('balance', 'Retained Earnings$'),
+        'cfo': row('cashflow', 'Cash from Operations$'),
+        'capex': row('cashflow', 'Capital Expenditure$'),
+        'cfi': row('cashflow', 'Cash from Investing$'),
+        'cff': row('cashflow', 'Cash from Financing$'),
+        'dividends_paid': row('cashflow', 'Common Dividends Paid$'),
+        'levered_fcf': ((), Spread.levered_fcf),
+        'fcf_per_share': (('levered_fcf', 'shares_out'), Spread.fcf_per_share),
+        # Values titles carry their unit such as 'Market Cap (MM)', matched by prefix
+        'tev': ((), lambda sp: sp.annual('Total Enterprise Value')),
+        'market_cap': ((), lambda sp: sp.annual('Market Cap')),
+        'price': values_row('Price$'),
+        'quarterly_market_cap': values_row('Market Cap'),
+        'ltm_ev_over_ebit': values_row(r'LTM\s+Total\s+Enterprise\s+Value\s*/\s*EBIT$', multiple=True),
+        'ltm_div_yield': values_row('LTM Dividend Yield$', optional=True, multiple=True),
+    }
+
     def __init__(self, wb: Workbook, tick: str, prof: 'Prof', header: list):
         super().__init__(wb, tick)
         self.profiler = prof
         # Append the returned super().head in Spread to the main header in the upstream inheritance.
         header.append(self.head)
 
+    def run(self, names: List[str]):
+        # Compute the shared inputs of the selected metrics once, then the metrics.
+        inputs, metrics = schedule(names)
+        for n in inputs:
+            self.input(n)
+        for m in metrics:
+            getattr(self, m)()
+
+    @metric('revenue', 'revenue_per_share', tags=('rev_per_share',))
     def revenue(self):
-        revs = self.strip(self.income.match_title('Total Revenues'))
-        rev_per_share = list_over_list(revs, self.wa_diluted_shares_out())
+        revs = self.input('revenue')
+        rev_per_share = self.input('revenue_per_share')
         cagr_rev_per_share = cagr(rev_per_share)
         print("Revenue per share from {} to {} at CAGR {:.2f}% for: {}".format(
             revs[0], revs[-1],
@@ -56,12 +168,13 @@ class SpreadX(Spread):
                                val2=cagr(rev_per_share[self.half_len:]),
                                val3=last_cagr_rev_per_share)
 
+    @metric('ebt_excl_unusual', 'shares_out', tags=('epu',))
     def epu(self):
         # EBT exclude unusual include Interest Expense, Investment Income, Income on Equity Investment,
         # Currency Exchange, Other Non Operating Income
         # Excluding M&A, Gain(Loss) sale of investments, legal settlements
-        ebt_exclude_unusual = self.strip(self.income.match_title('EBT Excl. Unusual Items'))
-        epu_per_share = list_over_list(ebt_exclude_unusual, self.wa_diluted_shares_out())
+        ebt_exclude_unusual = self.input('ebt_excl_unusual')
+        epu_per_share = Series(ebt_exclude_unusual).over(self.input('shares_out'))
         cagr_epu_ratio = cagr(epu_per_share)
         print("EPU from {:.2f} to {:.2f} at CAGR {:.2f}% for: {}".format(
             epu_per_share[0], epu_per_share[-1],
@@ -76,75 +189,48 @@ class SpreadX(Spread):
                                val2=cagr(epu_per_share[self.half_len:]),
                                val3=last_cagr_epu_ratio)
 
+    @metric('op_income', 'shares_out', 'tev', tags=('op_income',))
     def op_yield(self):
-        op_income = self.strip(self.income.match_title('Operating Income'))
-        op_income_per_share = list_over_list(op_income, self.wa_diluted_shares_out())
-        tev = self.strip(self.values.match_title('Total Enterprise Value'))
-        i = 0
-        TEV = []
-        while i < len(tev):
-            TEV.append(average(tev[i:i + 4]))
-            # print(a, i, j)
-            i += 4
-
-        # Trim the excess in TEV length over Diluted shares outstanding.
-        if len(TEV) > len(self.wa_diluted_shares_out()):
-            excess = len(TEV) - len(self.wa_diluted_shares_out())
-            TEV_per_share = list_over_list(TEV[excess:], self.wa_diluted_shares_out())
-        else:
-            while len(self.wa_diluted_shares_out()) > len(TEV):
-                # insert index 0 with 0 value
-                TEV.insert(0, 0)
-            TEV_per_share = list_over_list(TEV, self.wa_diluted_shares_out())
-
-        op_income_yield = list_over_list(op_income_per_share, TEV_per_share)
+        op_income = self.input('op_income')
+        shares_out = self.input('shares_out')
+        TEV = self.input('tev')
+        # TEV is aligned with the fiscal years, skip the years before the first Values sample.
+        first = TEV.first_present()
+        op_income_per_share = Series(op_income[first:]).over(shares_out[first:])
+        TEV_per_share = TEV[first:].over(shares_out[first:])
+
+        op_income_yield = op_income_per_share.over(TEV_per_share)
         avg_yield = statistics.median(op_income_yield)
         print("Earning yield from {:.2f} to {:.2f} at average {:.2f}% for: {}".format(
             op_income_yield[0], op_income_yield[-1],
             avg_yield, op_income_yield))
         self.profiler._collect(avg_yield, Tag.op_income, ProfMethod.Average,
-                               val2=statistics.median(op_income_yield[self.half_len:]),
+                               val2=statistics.median(op_income_yield[max(self.half_len - first, 0):]),
                                val3=op_income_yield[-1])
 
+    @metric('shares_out', 'fcf_per_share', 'tev', tags=('owner_yield',))
     def owner_yield(self):
-        # also known as Levered FCF
-        earning_not_strip = self.cashflow.match_title('Free Cash Flow$', none_is_optional=True)
-        if earning_not_strip is not None:
-            earning = self.strip(earning_not_strip)
-        else:
-            cfo = self.strip(self.cashflow.match_title('Cash from Operations$'))
-            opt_acq_real_assets = self.cashflow.match_title('Acquisition of Real Estate Assets$',
-                                                            none_is_optional=True)
-            earning = cfo
-            if opt_acq_real_assets is not None:
-                acq_real_assets = self.strip(opt_acq_real_assets)
-                earning = list_add_list(cfo, acq_real_assets)
-        earnings_per_share = list_over_list(earning, self.wa_diluted_shares_out())
-        tev = self.strip(self.values.match_title('Total Enterprise Value'))
-        i = 0
-        TEV = []
-        while i < len(tev):
-            TEV.append(average(tev[i:i+4]))
-            # print(a, i, j)
-            i += 4
-
-        # Trim the excess in TEV length over Diluted shares outstanding.
-        TEV_per_share = list_over_list(TEV[len(TEV)-len(self.wa_diluted_shares_out()):],
-                                       self.wa_diluted_shares_out())
-
-        earning_yield = list_over_list(earnings_per_share, TEV_per_share)
+        shares_out = self.input('shares_out')
+        earnings_per_share = self.input('fcf_per_share')
+        TEV = self.input('tev')
+        # TEV is aligned with the fiscal years, skip the years before the first Values sample.
+        first = TEV.first_present()
+        TEV_per_share = TEV[first:].over(shares_out[first:])
+
+        earning_yield = earnings_per_share[first:].over(TEV_per_share)
         avg_yield = statistics.median(earning_yield)
         print("Earning yield from {:.2f} to {:.2f} at average {:.2f}% for: {}".format(
             earning_yield[0], earning_yield[-1],
             avg_yield, earning_yield))
         self.profiler._collect(avg_yield, Tag.owner_yield, ProfMethod.Average,
-                               val2=statistics.median(earning_yield[self.half_len:]),
+                               val2=statistics.median(earning_yield[max(self.half_len - first, 0):]),
                                val3=earning_yield[-1])
 
+    @metric('cfo', 'shares_out')
     def cfo(self):
         # aka FFO - Funds from Operations
-        cfo = self.strip(self.cashflow.match_title('Cash from Operations'))
-        cfo_per_share = list_over_list(cfo, self.wa_diluted_shares_out())
+        cfo = self.input('cfo')
+        cfo_per_share = Series(cfo).over(self.input('shares_out'))
         cagr_cfo_per_share = cagr(cfo_per_share)
         print("FCF per share from {} to {} at CAGR {:.2f}% for: {}".format(
             cfo[0], cfo[-1],
@@ -155,10 +241,10 @@ class SpreadX(Spread):
         self.profiler.collect(cagr_cfo_per_share, cfo[-1], 'cfo_per_share', ProfMethod.CAGR)
 
     def _affo(self):
-        cfo = self.strip(self.cashflow.match_title('Cash from Operations'))
+        cfo = self.input('cfo')
         # Capex for real estates
-        capex = self.strip(self.cashflow.match_title('Capital Expenditure'))
-        affo = list_add_list(cfo, capex)
+        capex = self.input('capex')
+        affo = Series(cfo) + capex
 
         # TODO made comparison in relation to IGBREIT's share out filing
         # share_out_filing = self.share_out_filing()
@@ -184,12 +270,13 @@ class SpreadX(Spread):
         self.profiler.collect(avg_term_period_over_shares, last_term_period_over_shares,
                               Tag.affo_per_share, ProfMethod.IRR)
 
+    @metric('cfo', 'capex', 'shares_out', tags=('affo_per_share',))
     def affo(self):
-        cfo = self.strip(self.cashflow.match_title('Cash from Operations'))
+        cfo = self.input('cfo')
         # Capex for real estates
-        capex = self.strip(self.cashflow.match_title('Capital Expenditure'))
-        affo = list_add_list(cfo, capex)
-        affo_per_share = list_over_list(affo, self.wa_diluted_shares_out())
+        capex = self.input('capex')
+        affo = Series(cfo) + capex
+        affo_per_share = affo.over(self.input('shares_out'))
         # use Median rather than average.
         avg_affo_per_share = statistics.median(affo_per_share)
         print("AFFO at average {:.2f}% for: {}".format(
@@ -198,11 +285,12 @@ class SpreadX(Spread):
         ))
         self.profiler.collect(avg_affo_per_share, affo_per_share[-1], Tag.affo_per_share, ProfMethod.AveragePerc)
 
+    @metric('total_assets', 'total_liabilities', 'shares_out', tags=('nav_per_share',))
     def nav(self):
-        total_asset = self.strip(self.balance.match_title('Total Assets'))
-        total_liab = self.strip(self.balance.match_title('Total Liabilities'))
-        nav = list_minus_list(total_asset, total_liab)
-        nav_per_share = list_over_list(nav, self.wa_diluted_shares_out())
+        total_asset = self.input('total_assets')
+        total_liab = self.input('total_liabilities')
+        nav = Series(total_asset) - total_liab
+        nav_per_share = nav.over(self.input('shares_out'))
         avg_nav_per_share = cagr(nav_per_share)
         print("NAV per share at CAGR {:.2f}% for: {}".format(
             avg_nav_per_share*100,
@@ -210,18 +298,17 @@ class SpreadX(Spread):
         ))
         self.profiler.collect(avg_nav_per_share, nav_per_share[-1], Tag.nav_per_share, ProfMethod.CAGR)
 
+    @metric('total_equity', 'goodwill', 'other_intangibles', 'shares_out', tags=('tangible_per_share',))
     def tangible_book(self):
-        total_equity = self.strip(self.balance.match_title('Total Equity'))
-        goodwill_not_strip = self.balance.match_title('Goodwill', none_is_optional=True)
-        tangible = total_equity
-        if goodwill_not_strip is not None:
-            goodwill = self.strip(goodwill_not_strip)
-            tangible = list_minus_list(total_equity, goodwill)
-        intangible_not_strip = self.balance.match_title('Other Intangibles', none_is_optional=True)
-        if intangible_not_strip is not None:
-            intangible = self.strip(intangible_not_strip)
-            tangible = list_minus_list(tangible, intangible)
-        tangible_per_share = list_over_list(tangible, self.wa_diluted_shares_out())
+        total_equity = self.input('total_equity')
+        tangible = Series(total_equity)
+        goodwill = self.input('goodwill')
+        if goodwill is not None:
+            tangible = tangible - goodwill
+        intangible = self.input('other_intangibles')
+        if intangible is not None:
+            tangible = tangible - intangible
+        tangible_per_share = tangible.over(self.input('shares_out'))
         avg_tangible_per_share = cagr(tangible_per_share)
         print("Tangible book per share at CAGR {:.2f}% for: {}".format(
             avg_tangible_per_share*100,
@@ -229,10 +316,11 @@ class SpreadX(Spread):
         ))
         self.profiler.collect(avg_tangible_per_share, tangible_per_share[-1], Tag.tangible_per_share, ProfMethod.CAGR)
 
+    @metric('net_income', 'common_equity', tags=('ROCE',))
     def return_equity(self):
-        net_income = self.strip(self.income.match_title('Net Income$'))
-        requity = self.strip(self.balance.match_title('Total Common Equity$'))
-        roce = list_over_list(net_income, requity, percent=True)
+        net_income = self.input('net_income')
+        requity = self.input('common_equity')
+        roce = Series(net_income).over(requity, percent=True)
         avg_roce = average(roce)
         print("Return on Common Equity average {:.2f}% for: {}".format(
             avg_roce,
@@ -241,36 +329,34 @@ class SpreadX(Spread):
         # TODO ROCE is not defined
         self.profiler.collect(avg_roce/100, roce[-1], Tag.ROCE, ProfMethod.AveragePerc)
 
+    @metric('op_income', 'tax_expense', 'total_debt', 'total_equity', 'cfi', 'cff', tags=('ROIC',))
     def return_invested_cap(self):
         # ROIC = (nopat - tax) / (equity + debt + cash)
         # https://www.educba.com/invested-capital-formula/
         # https://www.thebalancemoney.com/return-on-invested-capital-393587#toc-how-to-calculate-roic
 
-        op_income = self.strip(self.income.match_title('Operating Income'))
-        tax_not_strip = self.income.match_title('Income Tax Expense', none_is_optional=True)
-        if tax_not_strip is not None:
+        op_income = self.input('op_income')
+        tax = self.input('tax_expense')
+        if tax is not None:
             # op_income after tax calculation
             # https://www.youtube.com/watch?v=QsqzDNOt89c
 
-            tax = self.strip(tax_not_strip)
-            tax_rate = list_over_list(tax, op_income)
+            tax_rate = Series(tax).over(op_income)
             # op_income * (1-tax_rate)
-            op_income_after_tax = list_add_list(list_one(1, len(tax)), tax_rate)
-            nopat = list_multiply_list(op_income, op_income_after_tax)
+            op_income_after_tax = 1 + tax_rate
+            nopat = Series(op_income) * op_income_after_tax
             pass
         else:
-            nopat = op_income
-        debt = self.strip(self.balance.match_title('Total Debt$'))
-        equity = self.strip(self.balance.match_title('Total Equity$'))
+            nopat = Series(op_income)
+        debt = self.input('total_debt')
+        equity = self.input('total_equity')
 
         # Minus non-operating-assets
-        cash = self.strip(self.cashflow.match_title('Cash from Investing$'))
-        cash = list_add_list(
-            self.strip(self.cashflow.match_title('Cash from Financing$')), cash)
+        cash = self.input('cfi')
+        cash = Series(self.input('cff')) + cash
 
-        _1 = list_add_list(debt, equity)
-        _2 = list_add_list(_1, cash)
-        roic_per = list_over_list(nopat, _2, percent=True)
+        invested_cap = Series(debt) + equity + cash
+        roic_per = nopat.over(invested_cap, percent=True)
         avg_roic_per = average(roic_per)
         print("Return on Invested Capital average {:.2f}% for: {}".format(
             avg_roic_per,
@@ -280,25 +366,25 @@ class SpreadX(Spread):
                                val2=average(roic_per[self.half_len:]) / SpreadX.Percent_Denominator,
                                val3=roic_per[-1] / SpreadX.Percent_Denominator)
 
+    @metric('net_debt', 'net_income', 'tax_expense', 'interest_expense', tags=('net_debt_over_ebit',))
     def net_debt_over_ebit(self):
-        net_debt = self.strip(self.balance.match_title('Net Debt'))
+        net_debt = self.input('net_debt')
 
         # Compute EBIT as Net income - Tax income expense - Interest expense.
         # Tax expense and Interest expense values from TIKR terminal have been negated.
-        net_income = self.strip(self.income.match_title('Net Income$'))
-        tax_not_strip = self.income.match_title('Income Tax Expense', none_is_optional=True)
-        if tax_not_strip is not None:
-            tax_expense = self.strip(tax_not_strip)
-            ebit = list_minus_list(net_income, tax_expense)
+        net_income = self.input('net_income')
+        tax_expense = self.input('tax_expense')
+        if tax_expense is not None:
+            ebit = Series(net_income) - tax_expense
         else:
-            ebit = net_income
-        interest_expense = self.strip(self.income.match_title('Interest Expense$'))
-        ebit = list_minus_list(ebit, interest_expense)
+            ebit = Series(net_income)
+        interest_expense = self.input('interest_expense')
+        ebit = ebit - interest_expense
 
         # EBIT may be more appropriate, as the Depreciation and Amortization captures
         # a portion of past capital expenditures.
         # https://corporatefinanceinstitute.com/resources/valuation/ebit-vs-ebitda/
-        net_debt_over_ebit = list_over_list(net_debt, ebit)
+        net_debt_over_ebit = Series(net_debt).over(ebit)
         avg_net_debt_over_ebit = average(net_debt_over_ebit)
         print("Net debt over EBIT average {:.2f} years for: {}".format(
             avg_net_debt_over_ebit,
@@ -319,21 +405,12 @@ class SpreadX(Spread):
         # except TypeError:
         #     colour_print("EBITDA return None", bcolors.WARNING)
 
+    @metric('net_debt', 'levered_fcf', tags=('net_debt_over_fcf',))
     def net_debt_over_fcf(self):
         # TODO net_debt_over_fcf
-        net_debt = self.strip(self.balance.match_title('Net Debt'))
-        fcf_not_strip = self.cashflow.match_title('Free Cash Flow$', none_is_optional=True)
-        if fcf_not_strip is not None:
-            fcf = self.strip(fcf_not_strip)
-        else:
-            cfo = self.strip(self.cashflow.match_title('Cash from Operations$'))
-            opt_acq_real_assets = self.cashflow.match_title('Acquisition of Real Estate Assets$',
-                                                            none_is_optional=True)
-            fcf = cfo
-            if opt_acq_real_assets is not None:
-                acq_real_assets = self.strip(opt_acq_real_assets)
-                fcf = list_add_list(cfo, acq_real_assets)
-        net_debt_over_fcf = list_over_list(net_debt, fcf)
+        net_debt = self.input('net_debt')
+        fcf = self.input('levered_fcf')
+        net_debt_over_fcf = Series(net_debt).over(fcf)
         avg_net_debt_over_fcf = average(net_debt_over_fcf)
         print("Net debt over FCF average {:.2f} years for: {}".format(
             avg_net_debt_over_fcf,
@@ -343,10 +420,11 @@ class SpreadX(Spread):
                                val2=average(net_debt_over_fcf[self.half_len:]),
                                val3=net_debt_over_fcf[-1])
 
+    @metric('op_income', 'revenue', tags=('op_margin',))
     def op_margin(self):
-        op_income = self.strip(self.income.match_title('Operating Income$'))
-        revs = self.strip(self.income.match_title('Total Revenues$'))
-        op_margins = list_over_list(op_income, revs, percent=True)
+        op_income = self.input('op_income')
+        revs = self.input('revenue')
+        op_margins = Series(op_income).over(revs, percent=True)
         avg_op_margins = average(op_margins)
         print("Operating margin average {:.2f}% for (numbers in percent) {}".format(
         avg_op_margins,
@@ -356,12 +434,13 @@ class SpreadX(Spread):
                                val2=average(op_margins[self.half_len:]) / SpreadX.Percent_Denominator,
                                val3=op_margins[-1] / SpreadX.Percent_Denominator)
 
+    @metric('ltm_ev_over_ebit', tags=('ev_over_ebit',))
     def ev_over_ebit(self):
         if self.values is None:
             # TODO exception to EV over EBIT
             print("Warning: ev_over_ebit: Missing values tab.")
             return
-        ev_over_ebit = self.strip2(self.values.match_title(r'LTM\s+Total\s+Enterprise\s+Value\s*/\s*EBIT$'))
+        ev_over_ebit = self.input('ltm_ev_over_ebit')
         avg_ev_over_ebit = average(ev_over_ebit)
         print("EV over EBIT average {:.2f} ratio for: {}".format(
             avg_ev_over_ebit,
@@ -372,10 +451,11 @@ class SpreadX(Spread):
                                val3=ev_over_ebit[-1])
 
     # TODO retined earnings pay in advance for one year?
+    @metric('retained_earnings', 'net_income', tags=('retained_earnings_ratio',))
     def retained_earnings_ratio(self):
-        retained_earnings = self.strip(self.balance.match_title('Retained Earnings$'))
-        net_income = self.strip(self.income.match_title('Net Income$'))
-        retention_ratio = list_over_list(retained_earnings, net_income)
+        retained_earnings = self.input('retained_earnings')
+        net_income = self.input('net_income')
+        retention_ratio = Series(retained_earnings).over(net_income)
 
         avg_retention_ratio = average(retention_ratio)
         print("Retention ratio average {:.2f}, last {:.2f} for: {}".format(
@@ -393,58 +473,47 @@ class SpreadX(Spread):
                                val2=average(retention_ratio[self.half_len:]),
                                val3=retention_ratio[-1])
 
+    @metric('retained_earnings', 'market_cap', tags=('market_cap_ov_retained_earnings',))
     def market_cap_over_retained_earnings_ratio(self):
-        multiples = self.strip(self.values.match_title('Multiples'))
-        avail_start_year = int(multiples[0].split('/')[-1])
-        start_year = int(multiples[0].split('/')[-1])
-        if avail_start_year > start_year:
-            # cut short the date range
-            offset = avail_start_year - start_year + 1
-            retained_earnings = self.balance.match_title('Retained Earnings')[offset:]
-            print("Start year in 20{} has been adjusted to available year 20{}".format(
-                start_year,
-                avail_start_year))
-        else:
-            retained_earnings = self.strip(self.balance.match_title('Retained Earnings$'))
-
-        # No exclusion in Valuation/Multiples sub
-        market_cap = self.strip(self.values.match_title('Market Cap'))
-        i = 0
-        MC = []
-        while i < len(market_cap):
-            MC.append(average(market_cap[i:i+4]))
-            # print(a, i, j)
-            i += 4
-
-        MC_change = MC[-1]-MC[0]
-        market_over_retained = MC_change / zsum(retained_earnings)
+        retained_earnings = self.input('retained_earnings')
+
+        # No exclusion in Valuation/Multiples sub, start from the first fiscal year sampled by Values.
+        MC = self.input('market_cap')
+        first = MC.first_present()
+        if first > 0:
+            print("Start year in {} has been adjusted to available year {}".format(
+                self.strip(self.income.tab[0])[0], self.strip(self.income.tab[0])[first]))
+
+        MC_change = MC[-1]-MC[first]
+        market_over_retained = MC_change / Series(retained_earnings[first:]).sum()
         print("MC_change over Retained earnings ratio is {:.2f}. MC samples: {}".format(
             market_over_retained,
-            list(map(lambda x: round(x, 2), MC))
+            [round(x, 2) for x in MC[first:]]
         ))
 
         val2 = None
-        if len(MC) > self.half_len:
-            val2 = (MC[-1]-MC[self.half_len]) / zsum(retained_earnings[self.half_len:])
+        if len(MC) > self.half_len and MC[self.half_len] is not None:
+            val2 = (MC[-1]-MC[self.half_len]) / Series(retained_earnings[self.half_len:]).sum()
 
         val3 = None
-        if len(MC) > 0:
-            val3 = (MC[-1]-MC[-2]) / zsum(retained_earnings[-2:])
+        if len(MC) > 1:
+            val3 = (MC[-1]-MC[-2]) / Series(retained_earnings[-2:]).sum()
 
         self.profiler._collect(market_over_retained, Tag.market_cap_ov_retained_earnings, ProfMethod.ReverseRatio,
                                val2=val2,
                                val3=val3)
 
+    @metric('dividends_paid', 'net_income_to_company', 'op_income', tags=('dividend_payout_ratio',))
     def dividend_payout_ratio(self):
-        div_paid = self.strip(self.cashflow.match_title('Common Dividends Paid'))
+        div_paid = self.input('dividends_paid')
         for i, a in enumerate(div_paid):
             if a is None:
                 print("W: {} does not provide dividend in year '{}".format(
                     self.tick, self.start_year+i))
-        income = self.strip(self.income.match_title('Net Income'))
+        income = self.input('net_income_to_company')
 
         # Op income is a probable replacement in the event when regular income produce negative number.
-        op_income = self.strip(self.income.match_title('Operating Income'))
+        op_income = self.input('op_income')
         net_income = []
         for i, a in enumerate(income):
             if a < 0:
@@ -454,7 +523,7 @@ class SpreadX(Spread):
             else:
                 net_income.append(income[i])
 
-        div_payout_ratio = list_over_list(div_paid, net_income)
+        div_payout_ratio = Series(div_paid).over(net_income)
         # Negating div payout to positive for the math to work easier
         avg_div_payout_ratio = - average(div_payout_ratio)
         print("Dividend payout ratio at average {:.2f} ratio for: {}".format(
@@ -464,16 +533,15 @@ class SpreadX(Spread):
         self.profiler.collect(avg_div_payout_ratio, - div_payout_ratio[-1],
                               Tag.dividend_payout_ratio, ProfMethod.Average)
 
+    @metric('ltm_div_yield', tags=('dividend_yield',))
     def div_yield(self):
         if self.values is None:
             # TODO exception to EV over EBIT
             print("Warning: dividend yield: Missing values tab.")
             return
-        result = self.values.match_title('LTM Dividend Yield$', none_is_optional=True)
+        result = self.input('ltm_div_yield')
         if result is not None:
-            div_yields = list(map(
-                lambda z: 0 if z is None else z, self.strip2(self.values.match_title('LTM Dividend Yield$')))
-            )
+            div_yields = list(map(lambda z: 0 if z is None else z, result))
             avg_div_yield = average(div_yields)
             self.profiler._collect(avg_div_yield, Tag.dividend_yield, ProfMethod.Average,
                                    val2=average(div_yields[self.half_len:]),
@@ -487,25 +555,24 @@ class SpreadX(Spread):
             self.profiler._collect(0, Tag.dividend_yield, ProfMethod.Average,
                                    val2=0, val3=0)
 
+    @metric('price', 'ltm_ev_over_ebit', 'ltm_div_yield', 'quarterly_market_cap', 'revenue', 'op_income',
+            'net_income_to_company', 'dpu')
     def last_price(self):
         if self.values is None:
             print("Warning: last_price: Missing values tab.")
             return
 
-        price = self.values.match_title('Price$')
-        ev_over_ebit = self.strip2(self.values.match_title(r'LTM\s+Total\s+Enterprise\s+Value\s*/\s*EBIT$'))
+        price = self.input('price')
+        ev_over_ebit = self.input('ltm_ev_over_ebit')
         # TODO all div yields data?
-        div_yield = None
-        _ = self.values.match_title('LTM Dividend Yield$', none_is_optional=True)
-        if _ is not None:
-            div_yield = self.strip2(self.values.match_title('LTM Dividend Yield$'))
+        div_yield = self.input('ltm_div_yield')
 
-        market_cap = self.values.match_title('Market Cap')
-        rev = self.income.match_title('Total Revenues')
-        op_income = self.income.match_title('Operating Income')
-        net_profit = self.income.match_title('Net Income')
+        market_cap = self.input('quarterly_market_cap')
+        rev = self.input('revenue')
+        op_income = self.input('op_income')
+        net_profit = self.input('net_income_to_company')
 
-        dpu = self.income.match_title('Dividends Per Share', none_is_optional=True, flags=re.IGNORECASE)
+        dpu = self.input('dpu')
         last_dpu = 0 if dpu is None or dpu[-1] is None else dpu[-1]
 
         # AFFO commented diff
@@ -547,26 +614,30 @@ ProfVerbose = {ProfMethod.CAGR: 'CAGR',
 
 class Tag(Enum):
     rev_per_share = 1
-    # epu = 2
+    epu = 2
     op_income = 16
     owner_yield = 13
-    # AFFO commented diff
-    # affo_per_share = 3
-    # nav_per_share = 4
-    # tangible_per_share = 14
-    # TODO ROCE is optional for tabulation.
-    # ROCE = 5
+    affo_per_share = 3
+    nav_per_share = 4
+    tangible_per_share = 14
+    ROCE = 5
     ROIC = 6
     net_debt_over_ebit = 7
-    # net_debt_over_fcf = 15
+    net_debt_over_fcf = 15
     ev_over_ebit = 8
-    # op_margin = 9
-    # retained_earnings_ratio = 10
-    # market_cap_ov_retained_earnings = 14
-    # dividend_payout_ratio = 11
+    op_margin = 9
+    retained_earnings_ratio = 10
+    market_cap_ov_retained_earnings = 17
+    dividend_payout_ratio = 11
     dividend_yield = 12
 
 
+# Tags tabulated in output.xlsx and scored by ProfManager, in column order.
+# AFFO, Tangible and the other metrics are collected when selected but not tabulated.
+Scored = [Tag.rev_per_share, Tag.op_income, Tag.owner_yield, Tag.ROIC, Tag.net_debt_over_ebit, Tag.ev_over_ebit,
+          Tag.dividend_yield]
+
+
 class Prof:
     def __init__(self, name):
         self.name = name
@@ -597,6 +668,26 @@ class Prof:
             if k is not str:
                 self.prof[k] = v
 
+    def to_dict(self):
+        # JSON friendly record, Tag and ProfMethod are stored by name.
+        d = OrderedDict()
+        for tag, v in self.d.items():
+            _ = OrderedDict(v)
+            _['method'] = v['method'].name
+            d[tag.name if isinstance(tag, Tag) else tag] = _
+        return {'name': self.name, 'long_name_ref': self.long_name_ref, 'd': d, 'last_price': self.last_price}
+
+    @classmethod
+    def from_dict(cls, record):
+        prof = cls(record['name'])
+        prof.long_name_ref = record['long_name_ref']
+        for name, v in record['d'].items():
+            _ = OrderedDict(v)
+            _['method'] = ProfMethod[v['method']]
+            prof.d[Tag[name] if name in Tag.__members__ else name] = _
+        prof.last_price = record['last_price']
+        return prof
+
 
 class Bucket:
     def __init__(self, name, value, method):
@@ -637,10 +728,21 @@ class ProfManager:
         self.company = {}
         self.metric = {}
 
+        # Incremental scoring, see update_scores()
+        # type: Dict[str, Dict[Tag, Tuple[float, RateType]]]
+        self.assigned = OrderedDict()
+        # type: Dict[Tag, Dict[RateType, Dict[str, float]]]
+        self.buckets = {x: {RateType.above_avg: {}, RateType.moderate_avg: {}, RateType.below_avg: {}}
+                        for x in Scored}
+        self.met = {}
+
     def create_folder(self, name):
-        prof = Prof(name)
+        return self.add_folder(Prof(name))
+
+    def add_folder(self, prof: Prof):
+        # Prof computed elsewhere, e.g. by a worker process in main.py
         self.companies.append(prof)
-        self.company[name] = prof
+        self.company[prof.name] = prof
         return prof
 
     def profile(self):
@@ -668,9 +770,9 @@ class ProfManager:
     # Yellow = 'F8DF81'
     # Green = '9BDB07'
 
-    def output(self, benched: Dict[str, dict]):
+    def output(self, benched: Dict[str, dict], bulk=True):
         # benched to access 'score' by company's name
-        wrap = WorkWrap(self.companies, benched)
+        wrap = BulkWorkWrap(self.companies, benched) if bulk else WorkWrap(self.companies, benched)
         wrap.start()
 
     def benchmark(self):
@@ -714,7 +816,7 @@ class ProfManager:
     def bucketize(self):
         # TODO namedtuple?
 
-        for x in Tag:
+        for x in Scored:
             self.metric[x] = {RateType.above_avg: [], RateType.moderate_avg: [], RateType.below_avg: [], }
 
         for c in self.companies:
@@ -724,20 +826,7 @@ class ProfManager:
                         assert k in self.metric
                         buck = self.metric[k]
                         tup = Bucket(c.name, v['val1'], v['method'])
-                        if v['method'] in (ProfMethod.AverageYears, ProfMethod.ReverseRatio):
-                            if v['val1'] < ProfManager.Rate[k]['high']:
-                                buck[RateType.above_avg].append(tup)
-                            elif v['val1'] < ProfManager.Rate[k]['mid']:
-                                buck[RateType.moderate_avg].append(tup)
-                            else:
-                                buck[RateType.below_avg].append(tup)
-                        else:
-                            if v['val1'] > ProfManager.Rate[k]['high']:
-                                buck[RateType.above_avg].append(tup)
-                            elif v['val1'] > ProfManager.Rate[k]['mid']:
-                                buck[RateType.moderate_avg].append(tup)
-                            else:
-                                buck[RateType.below_avg].append(tup)
+                        buck[ProfManager.rate(k, v)].append(tup)
 
         def value(val):
             return val.value
@@ -796,6 +885,107 @@ class ProfManager:
             for avg_rate in RateType.above_avg, RateType.moderate_avg, RateType.below_avg:
                 articulate(v[avg_rate], avg_rate)
 
+    @staticmethod
+    def rate(k: Tag, v) -> RateType:
+        # The thresholds in Rate are static, a company's bucket depends on its own value only.
+        if v['method'] in (ProfMethod.AverageYears, ProfMethod.ReverseRatio):
+            if v['val1'] < ProfManager.Rate[k]['high']:
+                return RateType.above_avg
+            elif v['val1'] < ProfManager.Rate[k]['mid']:
+                return RateType.moderate_avg
+        else:
+            if v['val1'] > ProfManager.Rate[k]['high']:
+                return RateType.above_avg
+            elif v['val1'] > ProfManager.Rate[k]['mid']:
+                return RateType.moderate_avg
+        return RateType.below_avg
+
+    @staticmethod
+    def score(key: RateType):
+        # Same points as articulate() in bucketize(), 10 for full points over all metrics.
+        if key is RateType.above_avg:
+            return 10./len(Scored)
+        elif key is RateType.moderate_avg:
+            return 5./len(Scored)
+        return 0
+
+    def remove_scores(self, name):
+        for k, (_, key) in self.assigned.pop(name, {}).items():
+            del self.buckets[k][key][name]
+        self.met.pop(name, None)
+
+    def add_scores(self, c: Prof):
+        # Replace the bucket assignments of one company, its score total is summed from its own buckets.
+        self.remove_scores(c.name)
+        assigned = OrderedDict()
+        for k, v in c.prof.items():
+            if type(k) is not str and k in ProfManager.Rate:
+                key = ProfManager.rate(k, v)
+                self.buckets[k][key][c.name] = v['val1']
+                assigned[k] = (v['val1'], key)
+        self.assigned[c.name] = assigned
+        if len(assigned) > 0:
+            self.met[c.name] = sum(ProfManager.score(key) for _, key in assigned.values())
+
+    def update_scores(self, changed: List[Prof], removed: List[str] = ()):
+        # Apply added/updated companies and removed names as deltas to the buckets and score totals.
+        for name in removed:
+            self.remove_scores(name)
+        for c in changed:
+            self.add_scores(c)
+        for k, v in self.buckets.items():
+            print("Based on {}: {}".format(k, ', '.join(
+                '{} {}'.format(len(v[key]), RateVerbose[key]) for key in v)))
+
+    def benchmark_scores(self):
+        # benchmark() over the incremental score totals, in the order of the companies.
+        final = {RateType.above_avg: [], RateType.moderate_avg: [], RateType.below_avg: []}
+        for c in self.companies:
+            if c.name not in self.met:
+                continue
+            v = self.met[c.name]
+            if v >= 5.5:
+                final[RateType.above_avg].append(c.name)
+            elif v >= 4.5:
+                final[RateType.moderate_avg].append(c.name)
+            else:
+                final[RateType.below_avg].append(c.name)
+        print("Total companies sampled thus far is {}".format(len(self.companies)))
+        return {'comp': final, 'score': self.met}
+
+    def save_scores(self, path):
+        # Per company metric values and bucket assignments by name, written atomically.
+        d = OrderedDict()
+        for name, assigned in self.assigned.items():
+            d[name] = OrderedDict((k.name, [val, RateName[key]]) for k, (val, key) in assigned.items())
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(d, f)
+        os.replace(tmp, path)
+
+    def load_scores(self, path):
+        if not os.path.isfile(path):
+            return
+        with open(path) as f:
+            d = json.load(f)
+        for name, assigned in d.items():
+            self.assigned[name] = OrderedDict()
+            for k, (val, key) in assigned.items():
+                k, key = Tag[k], getattr(RateType, key)
+                self.buckets[k][key][name] = val
+                self.assigned[name][k] = (val, key)
+            if len(assigned) > 0:
+                self.met[name] = sum(ProfManager.score(key) for _, key in self.assigned[name].values())
+
+    def profile_incremental(self, changed: List[Prof], removed: List[str] = ()):
+        # profile() with bucketize/benchmark replaced by score deltas of the changed companies only.
+        for p in self.companies:
+            p.profile()
+        self.update_scores(changed, removed)
+        benched = self.benchmark_scores()
+        self.simulate_price(benched['comp'])
+        self.output(benched)
+
     def simulate_price(self, benched):
         print()
 
@@ -805,7 +995,8 @@ class ProfManager:
                     for x in v:
                         assert x in self.company
                         company = self.company[x]
-                        if company.last_price is not None:
+                        # last_price and ev_over_ebit metrics are needed for the simulation
+                        if company.last_price is not None and Tag.ev_over_ebit in company.prof:
                             print("{}'s last quote was {}: -".format(x, company.last_price['last_price']))
 
                             current = company.last_price['ev_over_ebit']
@@ -889,6 +1080,26 @@ class WorkWrap:
                            end_type='percentile', end_value=10, end_color='3dccc7'),
     }
 
+    Tag_to_long = {
+        Tag.rev_per_share: 'Sales per share',
+        # Tag.epu: 'EPS',
+        Tag.op_income: 'Op yield',
+        Tag.owner_yield: 'FCF yield',
+        Tag.ROIC: 'ROIC',
+        Tag.net_debt_over_ebit: 'Net debt /EBIT',
+        Tag.ev_over_ebit: 'EV/EBIT',
+        # Tag.op_margin: 'Op margin',
+        # Tag.retained_earnings_ratio: 'Retained /Net',
+        # Tag.market_cap_ov_retained_earnings: 'Market /Retained',
+        Tag.dividend_yield: 'Dividend yield',
+    }
+
+    ext_header = ['P', 'Market Cap', 'Revenue', 'Op income', 'Net profit', 'FCF ratio',
+                  'DPU sen', 'Color']
+
+    no_price = {'last_price': None, 'market_cap': None, 'revenue': None, 'op_income': None, 'net_profit': None,
+                'dpu': 0}
+
     def __init__(self, companies: List[Prof], benched: Dict[str, dict]):
         self.companies = companies
         # benched to access 'score' by company's name
@@ -914,9 +1125,9 @@ class WorkWrap:
         sheet = self.sheet
         cell = self.cell
         cell.value = '10 years'
-        cell = self.sheet.cell(row=1, column=WorkWrap.start_col+len(Tag))
+        cell = self.sheet.cell(row=1, column=WorkWrap.start_col+len(Scored))
         cell.value = '5 years'
-        cell = self.sheet.cell(row=1, column=WorkWrap.start_col+2*len(Tag))
+        cell = self.sheet.cell(row=1, column=WorkWrap.start_col+2*len(Scored))
         cell.value = 'Current year'
 
         cell = self.sheet.cell(row=2, column=1)
@@ -924,39 +1135,23 @@ class WorkWrap:
         cell = self.sheet.cell(row=2, column=2)
         cell.value = 'Company'
 
-        Tag_to_long = {
-            Tag.rev_per_share: 'Sales per share',
-            # Tag.epu: 'EPS',
-            Tag.op_income: 'Op yield',
-            Tag.owner_yield: 'FCF yield',
-            Tag.ROIC: 'ROIC',
-            Tag.net_debt_over_ebit: 'Net debt /EBIT',
-            Tag.ev_over_ebit: 'EV/EBIT',
-            # Tag.op_margin: 'Op margin',
-            # Tag.retained_earnings_ratio: 'Retained /Net',
-            # Tag.market_cap_ov_retained_earnings: 'Market /Retained',
-            Tag.dividend_yield: 'Dividend yield',
-        }
-
         # Additional 3 columns.
         for _ in range(1, 4):
-            for x in Tag:
+            for x in Scored:
                 sheet.column_dimensions[colnum_string(self.i)].width = 10
                 cell = sheet.cell(row=self.j, column=self.i)
                 cell.alignment = Alignment(wrapText=True)
-                cell.value = Tag_to_long[x]
+                cell.value = WorkWrap.Tag_to_long[x]
                 self.i += 1
 
         # add extension header
-        ext_header = ['P', 'Market Cap', 'Revenue', 'Op income', 'Net profit', 'FCF ratio',
-                      'DPU sen', 'Color']
-        for x in ext_header:
+        for x in WorkWrap.ext_header:
             cell = sheet.cell(row=self.j, column=self.i)
             cell.value = x
             cell.alignment = Alignment(wrapText=True)
             self.i += 1
 
-    def start(self):
+    def start(self, path='output.xlsx'):
         self.j += 1
         for c in self.companies:
             # Table of mainly profile and last_price data
@@ -977,7 +1172,8 @@ class WorkWrap:
 
             # adding last column for color
             cell = self.sheet.cell(row=self.j, column=self.i)
-            cell.value = self.benched['score'][c.name]
+            # No score when none of the metrics selected is scored
+            cell.value = self.benched['score'].get(c.name)
             cell.number_format = '0.0'
             self.sheet.conditional_formatting.add('{alpha}{start}:{alpha}{end}'.format(
                 alpha=colnum_string(self.i), start=self.start_row_index, end=self.end_row_index),
@@ -985,35 +1181,42 @@ class WorkWrap:
             self.i += 1
 
             self.j += 1
-        self.wb.save('output.xlsx')
+        self.wb.save(path)
 
-    def build_lead(self, com: Prof, range_index: int):
+    @staticmethod
+    def val(com: Prof, tag: Tag, range_index: int):
+        # Empty cell for a metric that was not selected
+        return com.prof[tag]['val{}'.format(range_index)] if tag in com.prof else None
+
+    @staticmethod
+    def lead(com: Prof, range_index: int):
         gen_rule = WorkWrap.gen_rule
         rule = WorkWrap.rule
-        lead = [
+        return [
             # Last 10 years metric
-            {'val': com.prof[Tag.rev_per_share]['val{}'.format(range_index)], 'rule': gen_rule},
+            {'val': WorkWrap.val(com, Tag.rev_per_share, range_index), 'rule': gen_rule},
             # {'val': com.prof[Tag.epu]['val{}'.format(range_index)], 'rule': gen_rule},
-            {'val': com.prof[Tag.op_income]['val{}'.format(range_index)], 'rule': gen_rule},
-            {'val': com.prof[Tag.owner_yield]['val{}'.format(range_index)], 'rule': gen_rule},
+            {'val': WorkWrap.val(com, Tag.op_income, range_index), 'rule': gen_rule},
+            {'val': WorkWrap.val(com, Tag.owner_yield, range_index), 'rule': gen_rule},
             # AFFO and Tangible commented diffs
             # {'val': c.prof[Tag.affo_per_share]['val{}'.format(_)], 'rule': gen_rule},
             # {'val': c.prof[Tag.tangible_per_share]['val{}'.format(_)], 'rule': gen_rule},
             # {'val': c.prof[Tag.nav_per_share]['val{}'.format(_)], 'rule': gen_rule},
-            {'val': com.prof[Tag.ROIC]['val{}'.format(range_index)], 'rule': gen_rule},
-            {'val': com.prof[Tag.net_debt_over_ebit]['val{}'.format(range_index)], 'number': 'ratio',
+            {'val': WorkWrap.val(com, Tag.ROIC, range_index), 'rule': gen_rule},
+            {'val': WorkWrap.val(com, Tag.net_debt_over_ebit, range_index), 'number': 'ratio',
              'rule': rule[Tag.net_debt_over_ebit]},
-            {'val': com.prof[Tag.ev_over_ebit]['val{}'.format(range_index)], 'number': 'ratio',
+            {'val': WorkWrap.val(com, Tag.ev_over_ebit, range_index), 'number': 'ratio',
              'rule': rule[Tag.ev_over_ebit]},
             # {'val': com.prof[Tag.op_margin]['val{}'.format(range_index)], 'rule': gen_rule},
             # {'val': com.prof[Tag.retained_earnings_ratio]['val{}'.format(range_index)], 'number': 'ratio',
             #  'rule': gen_rule},
             # {'val': com.prof[Tag.market_cap_ov_retained_earnings]['val{}'.format(range_index)], 'number': 'ratio',
             #  'rule': rule[Tag.market_cap_ov_retained_earnings]},
-            {'val': com.prof[Tag.dividend_yield]['val{}'.format(range_index)], 'rule': gen_rule},
+            {'val': WorkWrap.val(com, Tag.dividend_yield, range_index), 'rule': gen_rule},
         ]
 
-        for x in lead:
+    def build_lead(self, com: Prof, range_index: int):
+        for x in WorkWrap.lead(com, range_index):
             self.build_sheet(x)
 
     def build_sheet(self, ent: Dict[str, Union[str, float, ColorScaleRule]]):
@@ -1029,7 +1232,7 @@ class WorkWrap:
         if 'number' in ent:
             cell.style = 'Comma'
             if ent['number'] == 'cap':
-                if len(str(abs(math.floor(cell.value)))) > 3:
+                if cell.value is not None and len(str(abs(math.floor(cell.value)))) > 3:
                     cell.number_format = "0,000.00"
                 else:
                     cell.number_format = '0.00'
@@ -1053,23 +1256,108 @@ class WorkWrap:
                 ent['rule'])
         self.i += 1
 
-    def build_suffix(self, com: Prof):
+    @staticmethod
+    def suffix(com: Prof):
         rule = WorkWrap.rule
+        # Empty cells when the last_price metric was not selected
+        last_price = com.last_price if com.last_price is not None else WorkWrap.no_price
 
         # Last price data
-        suffix = [
-            {'val': com.last_price['last_price'], 'number': 'value2'},
-            {'val': com.last_price['market_cap'], 'number': 'cap', 'rule': rule['market_cap']},
-            {'val': com.last_price['revenue'], 'number': 'cap', 'rule': rule['market_cap']},
-            {'val': com.last_price['op_income'], 'number': 'cap', 'rule': rule['market_cap']},
-            {'val': com.last_price['net_profit'], 'number': 'cap', 'rule': rule['market_cap']},
+        return [
+            {'val': last_price['last_price'], 'number': 'value2'},
+            {'val': last_price['market_cap'], 'number': 'cap', 'rule': rule['market_cap']},
+            {'val': last_price['revenue'], 'number': 'cap', 'rule': rule['market_cap']},
+            {'val': last_price['op_income'], 'number': 'cap', 'rule': rule['market_cap']},
+            {'val': last_price['net_profit'], 'number': 'cap', 'rule': rule['market_cap']},
             # {'val': com.prof[Tag.epu]['val2'], 'number': 'value', 'rule': rule['market_cap']},
-            {'val': com.prof[Tag.owner_yield]['val2'], 'number': 'value', 'rule': rule['market_cap']},
+            {'val': WorkWrap.val(com, Tag.owner_yield, 2), 'number': 'value', 'rule': rule['market_cap']},
             # {'val': com.prof[Tag.retained_earnings_ratio]['val2'], 'number': 'value', 'rule': rule['market_cap']},
             # x100 - KLSE/Bursa DPU use fractional pricing model
-            {'val': com.last_price['dpu'] * 100, 'number': 'value', 'rule': rule['market_cap']},
+            {'val': last_price['dpu'] * 100, 'number': 'value', 'rule': rule['market_cap']},
             # P/AFFO commented diff
             # {'val': c.last_price['price_over_affo'], 'number': 'value', 'rule': rule['price_over_affo']},
         ]
-        for x in suffix:
+
+    def build_suffix(self, com: Prof):
+        for x in WorkWrap.suffix(com):
             self.build_sheet(x)
+
+
+class BulkWorkWrap(WorkWrap):
+    # Same sheet as WorkWrap, streamed row by row through a write-only workbook. Cell formats are named
+    # styles registered once, and conditional formatting is added once per column after all the rows.
+    def __init__(self, companies: List[Prof], benched: Dict[str, dict]):
+        self.companies = companies
+        self.benched = benched
+        self.wb = Workbook(write_only=True)
+        ft = Font(name='Calibri', size=11)
+        for x in [NamedStyle(name='wrap', alignment=Alignment(wrapText=True), font=ft),
+                  NamedStyle(name='percent', number_format='0.00%', font=ft),
+                  NamedStyle(name='ratio', number_format='0.00', font=ft),
+                  NamedStyle(name='cap', number_format='0,000.00', font=ft),
+                  NamedStyle(name='score', number_format='0.0', font=ft)]:
+            self.wb.add_named_style(x)
+        self.sheet = self.wb.create_sheet('sheet 1')
+        self.start_row_index = WorkWrap.row_margin+1
+        self.end_row_index = len(self.companies) + self.start_row_index+1
+        # Column letter to its conditional formatting rule
+        self.rules = OrderedDict()
+        self.style_array = {}
+
+    def cell(self, value, style=None):
+        cell = WriteOnlyCell(self.sheet, value=value)
+        if style is not None:
+            # Resolving a named style by name is slow, reuse the style array of the first cell.
+            if style not in self.style_array:
+                cell.style = style
+                self.style_array[style] = copy.copy(cell._style)
+            else:
+                cell._style = copy.copy(self.style_array[style])
+        return cell
+
+    def entry(self, col, ent: Dict[str, Union[str, float, ColorScaleRule]]):
+        # build_sheet() for one write-only cell
+        value = 'NaN' if type(ent['val']) is complex else ent['val']
+        style = 'percent'
+        if 'number' in ent:
+            style = 'ratio'
+            if ent['number'] == 'cap' and value is not None and len(str(abs(math.floor(value)))) > 3:
+                style = 'cap'
+        if 'rule' in ent and col not in self.rules:
+            self.rules[col] = ent['rule']
+        return self.cell(value, style)
+
+    def init_sheet(self):
+        sheet = self.sheet
+        first = WorkWrap.start_col
+        for i in range(first, first + 3*len(Scored)):
+            sheet.column_dimensions[colnum_string(i)].width = 10
+
+        top = [None] * (first + 2*len(Scored))
+        top[first-1] = '10 years'
+        top[first-1+len(Scored)] = '5 years'
+        top[first-1+2*len(Scored)] = 'Current year'
+        sheet.append(top)
+
+        header = ['Tick', 'Company']
+        header += [self.cell(WorkWrap.Tag_to_long[x], 'wrap') for _ in range(1, 4) for x in Scored]
+        header += [self.cell(x, 'wrap') for x in WorkWrap.ext_header]
+        sheet.append(header)
+
+    def start(self, path='output.xlsx'):
+        self.init_sheet()
+        for c in self.companies:
+            row = [c.name, c.long_name_ref[0] if type(c.long_name_ref) is list else None]
+            ents = [x for ri in range(1, 4) for x in WorkWrap.lead(c, ri)] + WorkWrap.suffix(c)
+            for x in ents:
+                row.append(self.entry(colnum_string(len(row)+1), x))
+            col = colnum_string(len(row)+1)
+            self.rules[col] = WorkWrap.gen_rule
+            # No score when none of the metrics selected is scored
+            row.append(self.cell(self.benched['score'].get(c.name), 'score'))
+            self.sheet.append(row)
+
+        for col, rule in self.rules.items():
+            self.sheet.conditional_formatting.add('{alpha}{start}:{alpha}{end}'.format(
+                alpha=col, start=self.start_row_index, end=self.end_row_index), rule)
+        self.wb.save(path)
@@ -3,12 +3,10 @@ from selenium.webdriver.common.by import By
 from selenium.common.exceptions import NoSuchElementException
 import requests
 import time
-from bs4 import BeautifulSoup
-import lxml
-from typing import List
+import lxml.html
 
 import bootstrap
-from table import Page
+from table import extract_tables
 
 global driver
 
@@ -41,23 +39,17 @@ class TradingView:
     def fetch(self):
         result = []
         page = requests.get(self.path)
-        soup = BeautifulSoup(page.text, 'html.parser')
+        html = lxml.html.fromstring(page.text)
 
-        # https://stackoverflow.com/questions/5041008/how-to-find-elements-by-class
-        load_butt = soup.find_all("button", {"class": "{}".format(self.load_button_text)})
-        if load_butt is not None:
-            # cause garbage to recycle BeautifulSoup to new context
-            soup = None
+        load_butt = html.xpath("//button[@class='{}']".format(self.load_button_text))
+        if len(load_butt) > 0:
             result = self.fetch_chrome()
         else:
-            tab = soup.find('table')
-            for x in tab:
-                # print(x.text)
-                pager = Page(x)
-                pager.parse_top()
-                if len(pager.data[0]) > 0:
-                    for a in pager.data:
-                        result.append(a[0].lower())
+            tables = extract_tables(page.text)
+            if len(tables) > 0:
+                for a in tables[0].data[tables[0].header_rows:]:
+                    if len(a) > 0:
+                        result.append(str(a[0]).lower())
         print()
         return result
 
@@ -84,19 +76,18 @@ class TradingView:
                 break
 
         result = []
-        page = driver.page_source
-        soup = BeautifulSoup(page, 'lxml')
-
-        for tab in soup.find_all('table'):
-            rows = tab.find_all('tr')
-            for tr in rows:
-                td = tr.find_all('td')  # type: List[BeautifulSoup]
-                if len(td) > 0:
-                    # length of contents is asserted based on index 2 which is defined as the first class
-                    class_index = 2
-                    assert len(td[0].contents[0].contents) >= class_index
-                    result.append(td[0].contents[0].contents[class_index].text.lower())
-                    # row = [i.text for i in td]
+        html = lxml.html.fromstring(driver.page_source)
+
+        for tr in html.xpath('//table//tr'):
+            td = tr.xpath('./td')
+            if len(td) > 0:
+                # Children of the first cell, text nodes included as counted by the index below
+                contents = td[0][0].xpath('node()')
+                # length of contents is asserted based on index 2 which is defined as the first class
+                class_index = 2
+                assert len(contents) > class_index
+                symbol = contents[class_index]
+                result.append((symbol if isinstance(symbol, str) else symbol.text_content()).lower())
         return result
 
 
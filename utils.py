@@ -1,5 +1,4 @@
 import re
-import yahooquery as yq
 
 
 def colnum_string(n):
@@ -111,13 +110,18 @@ def zsum(a):
     return sum(list(map(lambda x: x if x is not None else 0, a)))
 
 
-def get_symbol(query, preferred_exchange=''):
+def get_symbol(query, preferred_exchange='', search=None):
+    # search: yahooquery.search() like lookup, defaults to the provider of market.configure()
+    if search is None:
+        # Imported here as market imports utils
+        from market import default_provider
+        search = default_provider().search
     try:
         data = None
         for i in range(2):
             if i == 1:
                 query = query.replace("Berhad", 'Bhd')
-            data = yq.search(query)
+            data = search(query)
             if len(data['quotes']) > 0:
                 break
     except ValueError:  # Will catch JSONDecodeError